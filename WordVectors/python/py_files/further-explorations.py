@@ -94,6 +94,142 @@ wv.most_similar('recipe', topn=10)
 wv.similarity("milk", "cream")
 
 
+# #### Saving Only What You Need for Querying
+# 
+# Even a `.wordvectors` file holds more than you need to query a model, and `Word2Vec.load()` has to unpack everything that would let you keep training it. If you are only going to query a model, for example from a script or the query server described below, `export_vectors()` from the `wem_tools` folder saves just the vectors (as a NumPy `.npy` file) and the list of words (as a text file). `load_exported()` opens them again almost instantly and gives you the same kind of `wv` object as before, so everything shown in this notebook works with it.
+# 
+# To save memory as well as disk space, see the section on storing vectors in less memory below. To see how quickly each kind of file opens, run `python -m wem_tools.benchmarks startup` from the `WordVectors/python` folder.
+
+# In[ ]:
+
+
+from wem_tools.export import export_vectors, load_exported
+
+# save just the vectors and the list of words
+export_vectors(wv, "./models/recipes-demo")
+
+# load them again; this works like the wv from before
+exported_wv = load_exported("./models/recipes-demo")
+exported_wv.most_similar('recipe', topn=10)
+
+
+# #### Making the First Query Faster
+# 
+# Cosine similarity only looks at the direction of each vector, so before answering its first query a newly loaded model works out the length of every vector in its vocabulary. For a large model, this makes the first query noticeably slower than the ones that follow. `save_normed()` from the `wem_tools` folder does this work once and saves the results next to your `.wordvectors` file; after that, `load_normed()` hands them to the model as soon as it is loaded, so the first query is as fast as the rest. The evaluation helpers and the query server described below pick these files up automatically if they exist. If you retrain the model, save them again.
+
+# In[ ]:
+
+
+from wem_tools.normed import save_normed, load_normed
+
+# save the unit-length vectors next to the .wordvectors file (you only need to do this once)
+save_normed(wv, "./models/recipes-demo.wordvectors")
+
+# after loading the vectors, attach the saved unit-length vectors
+wv = KeyedVectors.load("./models/recipes-demo.wordvectors", mmap='r')
+load_normed(wv, "./models/recipes-demo.wordvectors")
+wv.most_similar('recipe', topn=10)
+
+
+# #### Storing Vectors in Less Memory
+# 
+# Large models, like the Google News model in the section on pre-trained models below, can take up several gigabytes of memory. For answering similarity queries, the vectors rarely need to be stored as precisely as gensim stores them, so `quantize()` from the `wem_tools` folder can store them in a smaller form. `'float16'` halves the memory, `'int8'` takes a quarter of it, and `'pq'` ("product quantization") replaces short pieces of each vector with the closest of a set of typical pieces, which takes about an eighth of the memory for a large vocabulary. The smaller the form, the more the results can differ from the full model, so `accuracy_report()` shows how much memory each form saves and how much it changes the model's scores on the analogy and word pair tests from the [evaluation notebook](wem-evaluation.ipynb). As with the other files above, quantized vectors can be saved and loaded again with `mmap='r'`.
+
+# In[ ]:
+
+
+from wem_tools.quantize import quantize, load_quantized, accuracy_report
+
+# compare the memory used and the test scores of each form
+accuracy_report(wv, analogies="./testing/analogies_test.txt")
+
+# store the vectors as int8, query them, and save them for later
+quantized_wv = quantize(wv, 'int8')
+quantized_wv.most_similar('recipe', topn=10)
+quantized_wv.save("./models/recipes-demo")
+
+# load the saved int8 vectors again
+quantized_wv = load_quantized("./models/recipes-demo", 'int8')
+
+
+# #### Faster Queries for Large Models
+# 
+# Each `most_similar()` call compares your word with every other word in the model, so queries slow down as the vocabulary grows. If you are exploring a very large model and running many queries, you can build an approximate index with `IVFIndex` from the `wem_tools` folder. The index sorts the vocabulary into groups of words that point in similar directions, and each query only searches the groups closest to it. This means that it can occasionally miss one of the true nearest words; the `probes` setting controls how many groups are searched, so raising it makes the results more complete but slower. For small models like the recipes demo, plain `most_similar()` is already fast enough.
+# 
+# The index only needs to be built once: it is saved next to your `.wordvectors` file and can be loaded with `mmap='r'`, just like the vectors themselves. If you retrain the model, build and save the index again.
+
+# In[ ]:
+
+
+from wem_tools.ann import IVFIndex
+
+# build the index and save it next to the vectors file
+index = IVFIndex.build(wv)
+index.save("./models/recipes-demo.wordvectors")
+
+# load the index and query it just like wv.most_similar()
+index = IVFIndex.load(wv, "./models/recipes-demo.wordvectors", mmap='r')
+index.most_similar('recipe', topn=10, probes=16)
+
+
+# #### Remembering Repeated Queries
+# 
+# If you find yourself running the same queries again and again, for example by re-running a cell while you write up your notes, you can wrap your vectors in `CachedVectors` from the `wem_tools` folder. It works just like `wv`, but it remembers the answers to recent `most_similar()` and `similarity()` queries and hands them back straight away the next time they are asked. `hits` and `misses` show how many queries were answered from memory and how many had to be worked out. The cache only keeps about 64 MB of answers by default (you can change this with `max_bytes`), dropping the answers that haven't been used for the longest time first.
+# 
+# The cache forgets its old answers when the vectors it wraps change. For example, if you wrap `model.wv` and then call `model.train()` on that same model, the next query is worked out again. The `wv` wrapped below was loaded from the `.wordvectors` file, so it never changes. The next section retrains a new copy of the model loaded with `Word2Vec.load()`, so to cache queries about the retrained model, wrap its `model.wv` in a new `CachedVectors` after training.
+
+# In[ ]:
+
+
+from wem_tools.querycache import CachedVectors
+
+# wrap the vectors so that repeated queries are remembered
+cached_wv = CachedVectors(wv)
+
+cached_wv.most_similar('recipe', topn=10)
+cached_wv.most_similar('recipe', topn=10)
+
+# shows that the second query was answered from the cache
+print(cached_wv.hits, "hits,", cached_wv.misses, "misses")
+
+
+# #### Comparing Many Pairs of Words at Once
+# 
+# `wv.similarity()` compares one pair of words each time it is called. If you want the cosine similarities of a long list of word pairs, such as the pairs used to test a model, `similarities()` from the `wem_tools` folder works them all out at once and returns them in the same order. If one of the words in a pair isn't in the model, you get `nan` ("not a number") for that pair instead of an error.
+
+# In[ ]:
+
+
+from wem_tools.similarity import similarities
+
+word_pairs = [("milk", "cream"), ("stir", "whisk"), ("butter", "sugar"), ("cupcake", "muffin")]
+
+# gives the cosine similarity of each pair, in the same order as the list
+similarities(wv, word_pairs)
+
+
+# #### Querying a Model from Other Programs
+# 
+# If you want to use your model from a website, a dashboard, or a script written in another language, loading the model again every time can take longer than the queries themselves. Instead, you can run a small web server from the `wem_tools` folder that loads the vectors once (with `mmap='r'`) and answers queries sent to it. To start it, open a terminal in the `WordVectors/python` folder and run:
+# 
+# ```
+# python -m wem_tools.server ./models/recipes-demo.wordvectors --port 8000
+# ```
+# 
+# While it is running, you can visit an address such as http://localhost:8000/most_similar?positive=milk&topn=5 in your browser, or query it from code as shown below. The server can answer `most_similar`, `analogy`, `similarity` and `vocab` queries, and you can send many queries in a single request, which is much faster than sending them one by one. Adding `--workers 4` starts four copies of the server that share the same vectors, so that several queries can be answered at once. Press Ctrl-C in the terminal to stop the server.
+
+# In[ ]:
+
+
+import json
+import urllib.request
+
+# send two most_similar queries to the server in one request
+queries = {"queries": [{"positive": ["milk"], "topn": 5}, {"positive": ["cake", "chocolate"], "topn": 5}]}
+request = urllib.request.urlopen("http://localhost:8000/most_similar", data=json.dumps(queries).encode("utf-8"))
+json.loads(request.read())
+
+
 # ### Resuming Training
 
 # Working with word embedding models is typically an iterative process where you train a model, evaluate it, and then train the model again. Thankfully, Gensim provides the functionality for introducing new data to an existing model. 
@@ -108,7 +244,7 @@ wv.similarity("milk", "cream")
 # 
 # Now, we get to the bit that differs from the core notebook. Now that we have a list of tokens, we build the vocabulary for our model by calling `model.build_vocab()`. We are building the vocabulary using the new data and using the `update=True` parameter to let our model know that we are updating the vocabulary in our existing model.
 # 
-# Finally, we call the built in function `train()` to retrain the model. Whereas in the core notebook, we used `model= Word2Vec()` to train a new model, by using `model.train()` we tell the model to train using these additional items rather than replacing the vocabulary that the model has already built. If you were to call `model=Word2Vec` instead, you would be overwriting the existing model to only contain the vocabulary of the new data.
+# Finally, we call the built in function `train()` to retrain the model. Whereas in the core notebook, we used `model= Word2Vec()` to train a new model, by using `model.train()` we tell the model to train using these additional items rather than replacing the vocabulary that the model has already built. If you were to call `model=Word2Vec` instead, you would be overwriting the existing model to only contain the vocabulary of the new data. Because we are only training on the new data, we tell `train()` how many texts it is getting with `total_examples=len(data_clean)`, rather than the number of texts the model was originally trained on.
 
 # In[ ]:
 
@@ -154,7 +290,8 @@ for x in more_sentences:
 model.build_vocab(data_clean, update=True)
 
 # tell the model to re-train with the new data
-model.train(data_clean, total_examples=model.corpus_count, epochs=model.epochs)
+# total_examples is the number of new texts, not the size of the corpus the model was first trained on
+model.train(data_clean, total_examples=len(data_clean), epochs=model.epochs)
 
 
 # You can add additional data and retrain a model as many times as you want. Something to keep in mind, however, is that you may want to save your model under a different name than the name of the previous model. This way, you'll still have access to the old model in case something goes wrong in the re-training process. To do so, you would do the following:
@@ -167,6 +304,29 @@ model.train(data_clean, total_examples=model.corpus_count, epochs=model.epochs)
 model.save("./models/recipes-demo_retrained_08012022.model")
 
 
+# #### Adding New Texts as They Arrive (Optional)
+# 
+# If new texts keep arriving (for example, newly transcribed documents every day), loading the model, retraining it and saving a new copy each time soon takes far longer than the training itself, especially for a large model. `IncrementalUpdater` from the `wem_tools` folder keeps the model in memory instead. You queue new texts with `add()`, and `update()` trains the model on them in batches. Each update is saved as a new numbered version in the folder you give it, containing only the vectors that changed and any new words, while the whole model is only saved every few versions. Texts that have been added since the model was last saved in full are kept in a "journal" file, so nothing is lost if Python stops: the next time you create an updater with the same folder, it picks up where it left off.
+# 
+# `updater.live` holds a copy of the vectors that you can query like `model.wv`. It is only replaced once an update has finished, so queries never see a half-trained model. Each update is also logged, with the number of documents per second that were added to the model. The same updater can run as a service that checks a folder for new .txt files on a schedule; see the `wem_tools/updates.py` file for details.
+
+# In[ ]:
+
+
+from wem_tools.updates import IncrementalUpdater
+
+# keep the model in memory and save each update as a new version in the "output" folder
+updater = IncrementalUpdater("./models/recipes-demo.model", "./output/recipes-demo-updates")
+
+# queue the new texts, then train the model on them
+updater.add(data_clean)
+record = updater.update()
+print(record)
+
+# query the updated vectors
+updater.live.most_similar("cake", topn=5)
+
+
 # ### Using Pre-Trained Models
 
 # Gensim also provides the functionality to load an existing model into memory. Using pre-trained models can be incredibly useful if you know of a model that someone else has already trained that suits your needs. For example, the Google News Dataset is freely available to use and is already trained on roughly three million words.
@@ -94,7 +94,7 @@ nltk.download('stopwords')
 nltk.download('punkt')
 
 
-# The code below loops through a directory of plain text files, extracts the text from each file, cleans the text (removes stopwords, punctuation, numbers, etc.), and then counts the most frequently occurring words. While we generated a list of the top one thousand most common words, the code below will generate the top thirty most common words and the top thirty least common words in your corpus to give you a basic starting point. You can change this number to whatever number you would like (as long as the number doesn't exceed the number of words in your corpus). 
+# The code below loops through a directory of plain text files, extracts the text from each file, cleans the text (removes stopwords, punctuation, numbers, etc.), and then counts the most frequently occurring words. While we generated a list of the top one thousand most common words, the code below will generate the top thirty most common words and the top thirty least common words in your corpus to give you a basic starting point. You can change this number to whatever number you would like (as long as the number doesn't exceed the number of words in your corpus). The counts are kept by the `WordCounter` class from the `wem_tools` folder, which only works out the most and least common words when it saves them to the CSV file, rather than after every file, so that counting stays fast even for corpora with many thousands of files. 
 # 
 # Importantly, this version of our source texts (stopwords removed) is *not* what was used to train the word embedding model. This code is *only* for generating word counts in the corpus (which is why the stopword were removed here). For training the word embedding model, you would want the stopwords to remain, since stopwords help to identify the relationships between words in a sentence. For more information on training word embedding models, please see the WWP's [Word2Vec Fundamentals](https://github.com/NEU-DSG/wwp-public-code-share/blob/main/WordVectors/python/word2vec-fundamentals.ipynb) walkthrough.
 # 
@@ -129,9 +129,21 @@ for root, dirs, files in os.walk(dirpath, topdown=False):
 # LOOP TO OPEN ONE FILE AT A TIME, CLEAN TEXT, AND COUNT WORDS
 # =============================================================================
 
-temp_count = ["test_word"]   # initiate a list to aggregate word counts in
-counted_words = Counter(temp_count) # count this iniital list
+from wem_tools.corpus import clean_text     # the same cleaning steps used in the other notebooks
+from wem_tools.counting import WordCounter  # keeps a running count of words across files
+from wem_tools.tokenstore import TokenStoreWriter  # saves cleaned text in a form that is quick to read back
 
+stop_words = set(stopwords.words('english')) # setting the stopwords we want to remove
+
+# initiate a counter to aggregate word counts in
+# the counter keeps track of the top thirty and least common thirty words, and saves them to a csv file
+# every 1,000 files in case python runs into memory issues (you can change both of these numbers)
+# update the line below with the file path where you want your CSV to go
+counted_words = WordCounter(n=30, csv_path=r'~FILE PATH TO PUT CSV FILE IN~/CSV_FILE_NAME.CSV', checkpoint_every=1000)
+
+# we want to also save the cleaned text for later
+# update the line below with the file path to the folder where you want the cleaned text to go
+cleaned_text = TokenStoreWriter(r'~FILE PATH TO PUT CLEANED TEXT IN~/all_text_clean')
 
 
 # this for loop then goes through the list of files, reads them, cleans those words and removes stop words, and then counts frequencies
@@ -141,87 +153,53 @@ for filename in filenames:
     with open(filename, encoding='utf-8') as afile: # open the first file in the set of corpora
         data = afile.read()
     
-        print("opening " + filename) # print statement to let you know the file was successfully opened
-        stop_words = set(stopwords.words('english')) # setting the stopwords we want to remove
-        
-        # this function cleans the text and removes stop words
-        def clean_text(text):       
-            # lower case
-            tokens = text.split()
-            tokens = [t.lower() for t in tokens]
-    
-            # remove punctuation
-            re_punc = re.compile('[%s]' % re.escape(string.punctuation))
-            tokens = [re_punc.sub('', token) for token in tokens]
-    
-            # only include tokens that aren't numbers
-            tokens = [token for token in tokens if token.isalpha()]
-            
-            # remove stop words
-            tokens = [w for w in tokens if not w in stop_words]
-            
-            # return the cleaned text
-            return tokens
-        
-        
-        # run the function on our current file
-        data_clean = clean_text(data)
-        print(filename + " has been cleaned")  # print statement letting you know that the file was successfully cleaned
-        
-        new_count = Counter(data_clean) # count the word frequencies in the current file
-        counted_words.update(new_count) # update our aggregated count with the new file
-        
-        # get the top thirty most common words in the aggregated set
-        top_words = counted_words.most_common(30)
+    print("opening " + filename) # print statement to let you know the file was successfully opened
         
-        # get the least common thirty words in the aggregated set
-        least_common = counted_words.most_common()[:-30-1:-1]
+    # run the cleaning function on our current file, removing stop words
+    data_clean = clean_text(data, stop_words)
+    print(filename + " has been cleaned")  # print statement letting you know that the file was successfully cleaned
         
-        # open a csv file where we can save our word counts
-        # the csv file will update every time the code loops through a new file in case python runs into memory issues
-        # update the line below with the file path where you want your CSV to go
-        with open(r'~FILE PATH TO PUT CSV FILE IN~/CSV_FILE_NAME.CSV', 'w', encoding='utf-8') as counted_file:
-            c = csv.writer(counted_file)
-            # write the word counts to the csv with the headers Top 30 Words and 30 Least Common
-            c.writerows([['Top 30 Words', '30 Least Common'], [top_words, least_common]])
-                        
-            print("CSV File Updated") # print statement to let you know that the csv file was successfully updated
+    counted_words.update(data_clean) # update our aggregated count with the new file
        
-        # we want to also save the cleaned text to a text file for later
-        text_file = open("all_text_clean.txt", "a", encoding="utf-8")
-        n = text_file.write(str(data_clean))
-        print(filename + " saved to .txt file") # print statement to let you know that the text has been saved to a .txt file
-        text_file.close() # close the text file
-            
-        # close the file we have open currently
-        # this is important for saving memory
-        afile.close()
+    # save the cleaned text from this file alongside the files before it
+    cleaned_text.add(data_clean)
+    print(filename + " saved to cleaned text") # print statement to let you know that the cleaned text has been saved
+
+
+cleaned_text.close() # close the cleaned text files
+
+# write the word counts to the csv with the headers Top 30 Words and 30 Least Common
+counted_words.write()
+print("CSV File Updated") # print statement to let you know that the csv file was successfully updated
+
+# get the top thirty most common words in the aggregated set
+top_words = counted_words.most_common()
+
+# get the least common thirty words in the aggregated set
+least_common = counted_words.least_common()
 
 
-# Alternatively, if your corpus text is formatted as a csv file, you can use the code below to accomplish the same thing. Feel free to skip this block if you are not working with a csv file. Update both file paths before you run the code. 
+# The code above also saves the cleaned text to a folder. Rather than a plain text file, the folder holds a list of every distinct word in the corpus and a numbered version of the text in which each word is replaced by its position in that list. This takes up much less space than the text itself, and Python can open it almost instantly however large your corpus is. If you want to count the words again later (for instance, to get the top one hundred words instead of thirty), you can use the code below to do so without cleaning the texts again. Feel free to skip this block if you don't need to count the words a second time. Update the file path before you run the code. 
 
 # In[ ]:
 
 
 # =============================================================================
 # 
-#  TO OPEN TEXT FILE OF CLEANED TEXT AND CSV FILE OF COUNTS
+#  TO OPEN THE SAVED CLEANED TEXT AND COUNT ITS WORDS
 # =============================================================================
 
-open the file with the cleaned text saved to it
-    filename = r"FILE PATH TO TEXT FILE OF CLEANED TEXT"
-    with open(filename, encoding ='utf-8') as afile:
-        cleaned_text = afile.read()
+from wem_tools.counting import WordCounter
+from wem_tools.tokenstore import TokenStore
 
+# open the folder with the cleaned text saved to it
+cleaned_text = TokenStore(r"FILE PATH TO FOLDER OF CLEANED TEXT")
 
-filename = r"FILE PATH TO CSV FILE"
-with open(filename, newline='') as csvfile:
-    word_counts = csv.reader(csvfile, delimiter=',')
-
-
-counted_words = Counter(data_file)
-top_words = counted_words.most_common(30) # 30 most common
-least_common = counted_words.most_common()[:-30-1:-1] # 30 least common
+# count every word in the cleaned text at once
+counted_words = WordCounter(n=30)
+counted_words.update(cleaned_text.counts())
+top_words = counted_words.most_common() # 30 most common
+least_common = counted_words.least_common() # 30 least common
 
 
 # Once the top one thousand most commonly used words were obtained from our multi-collection corpus, the terms were reviewed by WWP staff in order to select words we considered to be significant within the context of the corpus or to represent concepts we considered to be important to the time period. Specific place names were, for the most part, not included in the final set of words primarily because we wanted the set of testing words to be generalizable and useful across a broad spectrum of pre-twentieth century texts rather than couched in specific geographic locations. Of course, these choices reflect the WWP team’s perspectives, but we focused our efforts on thinking broadly and were able to bring in period-specific expertise from many years of working with pre-Victorian women’s texts.  
@@ -312,6 +290,7 @@ def evaluate_word_analogies_mod(analogies, vectors):
     ok_keys = language_model.index_to_key 
 
     ok_vocab = {k.upper(): language_model.get_index(k) for k in reversed(ok_keys)} # the vocabulary of the model
+    folded_keys = {k: k.upper() for k in ok_keys} # the upper-case version of each word, worked out once for the whole vocabulary
     oov = 0
     quadruplets_no = 0
 
@@ -345,14 +324,12 @@ def evaluate_word_analogies_mod(analogies, vectors):
                         if a not in ok_vocab or expected not in ok_vocab:
                             not_ok += 1
                         else:
-                            original_key_to_index = language_model.key_to_index
-                            language_model.key_to_index = ok_vocab
                             predicted = None
 
-                            sims = language_model.most_similar(positive=[a], topn=15, restrict_vocab=3000000000) # the restrict_vocab is an arbitrary high number
-                            language_model.key_to_index = original_key_to_index
+                            # look the word up by the row of its vector, so the model itself is never changed
+                            sims = language_model.most_similar(positive=[ok_vocab[a]], topn=15, restrict_vocab=3000000000) # the restrict_vocab is an arbitrary high number
                             for element in sims:
-                                predicted = element[0].upper() 
+                                predicted = folded_keys[element[0]]
                                 if predicted in ok_vocab:
                                     if predicted == expected:
                                         right = True
@@ -406,6 +383,47 @@ if __name__ == "__main__":
 evaluate_word_analogies_mod(analogies, vectors)
 
 
+# ### Evaluating Larger Models More Quickly
+# 
+# The function above asks the model for the fifteen most similar words to each test word one at a time, and each of those questions means comparing the test word to every word in the model's vocabulary. For a model with a large vocabulary and a long list of word pairs, this can take a very long time.
+# 
+# The `evaluate_word_analogies_batched()` function in the `wem_tools` folder gives exactly the same scores, but compares a whole batch of test words with the vocabulary at once using matrix multiplication, which computers are very good at doing quickly. It prints the same results as the function above, followed by how many test words it looked up per second. You can make `batch_size` larger to go faster, as long as your computer has enough memory to compare that many words with the whole vocabulary at once.
+
+# In[ ]:
+
+
+from wem_tools.evaluation import evaluate_word_analogies_batched
+
+# Run this code to evaluate the model in batches of 256 test words
+evaluate_word_analogies_batched(analogies, vectors, batch_size=256)
+
+
+# If your computer has several processor cores, you can also spread the evaluation across them with `evaluate_word_analogies_parallel()`. This splits the word pairs into groups and has each core score one group at a time, then adds the scores for each category back together. Each core opens the saved vectors file with `mmap='r'` (just like the `KeyedVectors.load()` call in the [Further Explorations](further-explorations.ipynb) notebook), which means that all of the cores share one copy of the vectors rather than each loading its own. By default, all of your computer's cores are used; you can set `processes` to use fewer.
+
+# In[ ]:
+
+
+from wem_tools.evaluation import evaluate_word_analogies_parallel
+
+# Run this code to evaluate the model using every core on your computer
+evaluate_word_analogies_parallel(analogies, vectors)
+
+
+# ### Comparing Many Models at Once
+# 
+# When you have trained several models on the same corpus with different settings, you will usually want to run the same tests on all of them and compare the results side by side. `evaluate_models()` does this for every model saved in a folder (files ending in `.wordvectors`, `.wv`, `.kv` or `.model`; a model saved as both a `.model` file and a vectors file is only tested once, using the vectors file). For each model it measures the cosine similarity of a list of word pairs (by default, the pairs used in the R walkthroughs, such as "before" and "after" or "little" and "small") and, if you give it a file of analogies, scores the model on them as above. The test files are only read once, and each model is opened with `mmap='r'` only when it is being tested, so even a large folder of models can be compared without running out of memory.
+# 
+# All of the results are saved to one CSV file with a column for each model and a row for each test, in the same layout as the `model-test-results.csv` file in the "output" folder of the WordVectors directory. A blank cell means that one of the words is not in that model's vocabulary. You can also give your own word pairs, either as a list like `[("stir", "whisk"), ("cream", "milk")]` or as the path to a text file with two words on each line.
+
+# In[ ]:
+
+
+from wem_tools.evaluation import evaluate_models
+
+# Run this code to test every model in the models folder and save the results to a CSV file
+results = evaluate_models('./models', analogies=analogies, output_csv='./output/model-test-results.csv')
+
+
 # ## Final Thoughts
 
 # Model evaluation remains one aspect of WEM research that researchers can’t quite hammer down into a definitive method. There are a number of approaches to evaluating the ability of a model to understand the vocabulary of a corpus and much of the process of evaluating a model depends greatly on what you consider “understand the vocabulary” to mean. For some projects, “understand” can mean more a structural, grammatical understanding. For others, “understand” may mean a clear and consistent scoring of concepts or specific terminology. Depending on what your evaluation needs are, evaluation methods and tasks should be modified to best answer the types of questions you are interested in answering.
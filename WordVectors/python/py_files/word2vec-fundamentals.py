@@ -309,6 +309,45 @@ model = Word2Vec(sentences=data_clean, window=5, min_count=3, workers=4, epochs=
 model.save("./models/word2vec.model")
 
 
+# #### Training in Stages (Optional)
+# 
+# Training a model on a large corpus can take hours, and if Python stops partway through—because your computer goes to sleep, for instance—everything the model has learned so far is lost. `train_model()` from the `wem_tools` folder trains the same model as the code above, but saves a copy of the model (a "checkpoint") in the folder you give it after every epoch, or every few epochs if you set `every`. If training is interrupted, run the same cell again: it will pick up from the latest checkpoint instead of starting over.
+# 
+# After each epoch, `train_model()` also adds a line to `training-log.jsonl` in the checkpoint folder, recording how long the epoch took, how many words per second were processed, and the model's "loss" (a measure of how far off its predictions still are, which should generally go down from one epoch to the next). `read_log()` reads these lines back so that you can compare them between runs.
+
+# In[ ]:
+
+
+# train the model, saving a checkpoint after every epoch
+from wem_tools.training import read_log, train_model
+
+model = train_model(data_clean, "./models/checkpoints/word2vec", every=1,
+                    window=5, min_count=3, workers=4, epochs=5, sg=1)
+
+# print the time taken, speed and loss of each epoch
+for record in read_log("./models/checkpoints/word2vec"):
+    print(record["epoch"], record["seconds"], record["words_per_second"], record["loss"])
+
+# save the model
+model.save("./models/word2vec.model")
+
+
+# #### Choosing the Number of Workers (Optional)
+# 
+# The code above uses `workers=4`, but the number of workers that trains fastest depends on your computer and your corpus: on a computer with many processor cores, four workers may leave most of it idle, while past a certain point adding more workers stops making any difference. `tune_workers()` from the `wem_tools` folder trains briefly on the first million or so words of your corpus with different numbers of workers and batch sizes, and returns the fastest settings, which you can then pass on to `Word2Vec()` or `train_model()`. If more workers barely help, it picks the smaller number. The speeds it measured are saved to `worker-scaling.csv` in the "output" folder so that you can see how your computer scales. Use the same `window`, `min_count` and `sg` settings here that you will use for your model, since they change the speed too.
+
+# In[ ]:
+
+
+# find the fastest number of workers and batch size on a sample of the corpus
+from wem_tools.training import tune_workers
+
+settings = tune_workers(data_clean, report="./output/worker-scaling.csv", window=5, min_count=3, sg=1)
+
+# train the model with those settings
+model = Word2Vec(sentences=data_clean, window=5, min_count=3, epochs=5, sg=1, **settings)
+
+
 # To access the model once its been saved, you can run the code below. 
 # 
 # The code below loads a model file called "word2vec" and saves it in the variable `model`. Note that this code will look for a file called `word2vec.model` in the models folder. If you saved your model in a different folder or with a different name, you should provide the full file path followed by the model name (the same way you saved the model). If you wanted to load more than one model, then all you would need to do is save your second model under a new variable. For instance, instead of `model` you might use `model2`. You can load any number of models that you want as long as they each have a unique variable.
@@ -522,6 +561,69 @@ df = pd.read_csv(r'./data/sample_csv_recipes.csv', usecols= col_list)
 df['text'] = df['text'].apply(clean_text)
 
 
+# ### Streaming Texts from a Folder
+# 
+# The code in the [section on loading in texts from a folder](#Code-for-Loading-Texts-from-a-Folder) reads every file into the `data` list, and the cleaning code then makes a second, cleaned copy of everything in `data_clean`. For the sample recipes this is no problem, but for a corpus of several gigabytes your computer may run out of memory before training even begins.
+# 
+# Instead of holding the whole corpus in memory, you can use the `TextCorpus` class from the `wem_tools` folder that comes with these notebooks. A `TextCorpus` remembers only the list of file names. Each time Gensim loops over it, it opens one file, cleans it with the same `clean_text()` function used above, hands the tokens to Gensim, and then moves on to the next file. Gensim loops over the corpus several times (once to build the vocabulary and once for every epoch), so the files are read again on each pass, but only one file is ever held in memory at a time.
+# 
+# If you want to use this code, you should run it instead of the first codeblock in the [section on loading in texts from a folder](#Code-for-Loading-Texts-from-a-Folder) and the codeblock that creates `data_clean`. Because there is no longer a `data` variable, the `print()` checks comparing `data` and `data_clean` won't work, but the training code below will work unchanged.
+
+# In[ ]:
+
+
+from wem_tools.corpus import TextCorpus, find_files
+
+# find all of the files in the folder, just like the for loop in the first codeblock
+filenames = find_files(dirpath, file_type)
+
+# data_clean will read each file and clean it with our clean_text() function only when Gensim asks for it
+data_clean = TextCorpus(filenames, clean=clean_text)
+
+
+# ### Cleaning Texts in Parallel
+# 
+# Cleaning runs on a single processor core, one file after another. With tens of thousands of files, this step can take longer than training the model itself. Most computers have several cores, so the `clean_files()` function from the `wem_tools` folder splits the list of files between them, cleans each share at the same time, and returns the cleaned texts in the same order as `filenames`, just like the `for` loop above.
+# 
+# By default `clean_files()` uses every core on your computer. You can set `processes` to use fewer, and `chunksize` to control how many files are handed to a core at once. `clean_files()` uses its own copy of the `clean_text()` function defined above, so if you have changed your `clean_text()` function, you should make the same change in `wem_tools/corpus.py`.
+# 
+# If you want to use this code, you should run it instead of the first codeblock in the [section on loading in texts from a folder](#Code-for-Loading-Texts-from-a-Folder) and the codeblock that creates `data_clean`.
+
+# In[ ]:
+
+
+from wem_tools.corpus import clean_files, find_files
+
+# find all of the files in the folder, just like the for loop in the first codeblock
+filenames = find_files(dirpath, file_type)
+
+# read and clean the files using all of the cores on your computer
+data_clean = clean_files(filenames)
+
+
+# ### Reusing Cleaned Texts Between Runs
+# 
+# Every time you run the cleaning code, every file is read and cleaned again, even if nothing has changed since the last time you trained a model. If you plan to train several models on the same corpus (for instance, to try out different `window` or `epochs` settings), you can save the cleaned texts in a cache with the `TokenCache` class from the `wem_tools` folder.
+# 
+# The cache is a folder (by default inside the "output" folder) holding a compressed copy of the tokens for each file. A cached copy is only used if the file hasn't changed and it would be cleaned in exactly the same way, including after you edit the `clean_text()` function in `wem_tools/corpus.py`, so you don't need to worry about using out-of-date texts. The one exception is a change to something the function uses from elsewhere in that file, such as the `re_punc` pattern; if you make one, delete the cache folder before running the code again. When the cache grows larger than `max_bytes` (two gigabytes by default), the copies that haven't been used for the longest time are deleted.
+# 
+# The cache works with both `clean_files()` and `TextCorpus`. Run the code below instead of the code that creates `data_clean` in either of the previous two sections.
+
+# In[ ]:
+
+
+from wem_tools.cache import TokenCache
+
+# keep cleaned copies of the texts in the output folder
+cache = TokenCache('./output/token-cache')
+
+# clean the files on all of your cores, reusing any copies already in the cache
+data_clean = clean_files(filenames, cache=cache)
+
+# or, to stream the texts one file at a time:
+# data_clean = TextCorpus(filenames, cache=cache)
+
+
 # ## Splitting large input files ##
 # Gensim's Word2Vec expects data to be formatted in a very specific way: a list of lists where every item in that list is a set of tokenized words (which we have created using the `clean_text()` function). It is not ideal to use a single, very large text file when using Word2Vec because of the expectation that Gensim has that data will be fed to it in this format. In short, Gensim anticipates data will be formatted in a list which holds a series of sub-lists. Those sub-lists are limited in the number of tokens Gensim will actually process. All of this happens behind the scenes and the model will seemingly run like normal when run on a single large text file, leading to some strange and deceiving results if you are unaware of these limitations. Let's explore exactly how to avoid this problem.
 # 
@@ -553,26 +655,18 @@ def chunks(lst, n):  # accepts a list and the number of tokens per list
 data_clean_chunked = list(chunks(data_clean[0], 10000))
 
 
-# The above code will work if you have a single, large text file. If you have more than one text file, you can wrap the final line of code in a `for` loop such that the `chunks()` function is called on every item in data_clean
+# The above code will work if you have a single, large text file. If you have more than one text file, you can use `ChunkedCorpus` from the `wem_tools` folder, as in the cell below, to split every item in `data_clean` into chunks. Rather than building a new list with a copy of every chunk, `ChunkedCorpus` splits each text as Word2Vec reads it, so it takes almost no extra memory and works just as quickly for a corpus of any size. A chunk never contains the end of one text and the beginning of the next. `data_clean` can also be one of the streaming corpora from earlier in this notebook, such as a `TextCorpus`.
+# 
+# If you are worried about losing the context of the words on either side of a split, you can add `overlap=5` (or another number, up to your model's `window` size) so that each chunk begins with the last few words of the chunk before it.
 
 # In[ ]:
 
 
 # Run this code to break a set of very long texts into chunks
-data_clean_chunked = []
-
-def flatten(xss):
-    return [x for xs in xss for x in xs]
-
-def chunks(lst, n):  # accepts a list and the number of tokens per list
-   for i in range(0, len(lst), n):
-       yield lst[i:i + n]
+from wem_tools.corpus import ChunkedCorpus
 
-for i in data_clean:
-    #formats the chunks of 10,000 tokens into a list to produce a list of lists
-    data2 = list(chunks(i, 10000))
-    data_clean_chunked.append(data2)
-    data_clean_chunked = flatten(data_clean_chunked) #flatten the list of lists into a single list
+# splits each text in data_clean into chunks of 10,000 tokens as the model reads them
+data_clean_chunked = ChunkedCorpus(data_clean, size=10000)
 
 
 # 
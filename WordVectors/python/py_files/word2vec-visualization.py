@@ -39,6 +39,8 @@ import numpy as np                                      # to do fancy things wit
 import plotly.graph_objs as go                          # to visualize PCA
 import matplotlib.pyplot as plt                         # to visualize plots
 from mpl_toolkits.mplot3d import Axes3D                 # to visualize 3D plots
+from wem_tools.projection import pca_projection         # to reuse PCA results for each model
+from wem_tools.tsne import select_words, tsne_projection  # to run tSNE on large models
 import random                                           # to obtain random numbers
 
 model = Word2Vec.load(r"./models/recipes-demo.model")
@@ -101,6 +103,41 @@ num_clusters = 3
 kmeans = cluster.KMeans(n_clusters=num_clusters, max_iter=40).fit(vocab) 
 
 
+# #### Clustering by Direction
+# 
+# The k-means algorithm above measures the straight-line (Euclidean) distance between vectors, which depends on how long the vectors are as well as the direction they point in. Since word embedding models usually compare words by direction alone (this is what cosine similarity measures), you may want to cluster the unit-length versions of the vectors instead, which places words that point in the same direction together. `normed_vectors()` from the `wem_tools` folder gives these vectors; if you have saved them next to your model with `save_normed()` (see the Further Explorations notebook), they are loaded from that file rather than worked out again. Keep in mind that clustering unit-length vectors will usually give somewhat different clusters from the code above. The rest of the cells in this section work in the same way with either version of `kmeans`.
+
+# In[ ]:
+
+
+from wem_tools.normed import normed_vectors
+
+# vocab will hold the unit-length versions of our model's vectors
+vocab = normed_vectors(model.wv)
+
+# cluster the unit-length vectors in the same way as above
+kmeans = cluster.KMeans(n_clusters=num_clusters, max_iter=40).fit(vocab)
+
+
+# #### Clustering Large Models
+# 
+# Both versions of the k-means code above make a copy of every vector in the model and compare every word with every centroid on each pass, which can take several minutes for a model with hundreds of thousands of words. `cluster_vocabulary()` from the `wem_tools` folder clusters the unit-length vectors by direction, like the code above, but uses "mini-batch" k-means: it moves the centroids a little after looking at each small random batch of words, which gives very similar clusters in a fraction of the time. If you have saved unit-length vectors with `save_normed()` and loaded them with `load_normed()`, they are read straight from disk without being copied into memory.
+# 
+# If you give it a `path`, the centroids and the cluster of every word are saved in files beginning with that path (here, in the "output" folder). The next time you run this cell with the same model and the same number of clusters, they are loaded from those files instead of being calculated again. Like the cell above, this one sets `kmeans`, so the rest of the cells in this section work in the same way. It finishes by showing a table of the cluster that each word was put in.
+
+# In[ ]:
+
+
+from wem_tools.clustering import cluster_vocabulary
+
+# cluster the unit-length vectors a few thousand at a time, or load the clusters saved for this model
+kmeans = cluster_vocabulary(model.wv, num_clusters, path="./output/recipes-demo")
+
+# the cluster that each word in the vocabulary belongs to
+word_clusters = pd.DataFrame({'Word': model.wv.index_to_key, 'Cluster Number': kmeans.labels_})
+word_clusters
+
+
 # Next, we'll declare a set of variables related to the clusters themselves. The `centroids` variable will hold the center points around which the clusters are arranged. You can imagine these centroids as points on a map that we have thrown random darts at. The centroids are generated by the k-means algorithm as it runs. The way that we get access to these centroids is by using the `cluster_centers_` variable that the algorithm generates. This is somewhat similar to the way you call `model.wv` to get access to a model's word vectors.
 # 
 # Finally, we declare the `clusters_df` dataframe which will be used to store the words within our clusters. Storing these clusters in a dataframe will allow us to preserve distinctions between clusters using columns and rows, and will make saving the results to a `.csv` file easier.
@@ -117,7 +154,7 @@ clusters_df = pd.DataFrame()
 
 # Now, using a `for` loop, we are going to visit each of the clusters and gather some of the words within them. This `for` loop starts at the first cluster and will iterate through each of the clusters, stopping once it has finished with the last one.
 # 
-# As the `for` loop reaches a cluster, it calculates the most representative words within that cluster by using the `most_similar` function. The function is calculating the words that are most similar to the centroid of that cluster and returns the top 15 words. Those words are stored within a variable, `most_representative`.
+# Before the loop starts, we calculate the most representative words within every cluster using the `representative_words()` function from the `wem_tools` folder. The function calculates the words that are most similar to the centroid of each cluster and returns the top 15 words for each one; these are the same words that the `most_similar` function would give for each centroid, but the function finds them for all of the clusters at once, which is much faster when you have many clusters or a large vocabulary. As the `for` loop reaches a cluster, the words for that cluster are stored within a variable, `most_representative`.
 # 
 # Then, we declare a temporary dataframe, called `temp_df` that will store the ID of the current cluster and the words associated with that cluster. Saving both the cluster ID as well as the words allows us to remember which words came from which cluster and will make interpreting the results much easier later.
 # 
@@ -126,11 +163,16 @@ clusters_df = pd.DataFrame()
 # In[11]:
 
 
+from wem_tools.clustering import representative_words
+
+# calculate the top fifteen most similar words to every centroid at once
+representative = representative_words(model.wv, centroids, topn=15)
+
 # iterate through each of the clusters
 for i in range(num_clusters):
     
-    # calculate the top fifteen most similar words within the current cluster
-    most_representative = model.wv.most_similar(positive=[centroids[i]], topn=15)
+    # get the top fifteen most similar words within the current cluster
+    most_representative = representative[i]
     
     # store the cluster number and the most representative words in a temporary dataframe
     temp_df = pd.DataFrame({'Cluster Number': i, 'Words in Cluster': most_representative})
@@ -270,15 +312,15 @@ plt.show()
 # Then, you can call the function just like we've called built-in functions in previous code by first writing the function name and then the parameters in parentheses: `function_name(parameter)`. In our case, we are going to define `pca()` as a function that accepts a model as its only parameter. This way, if you want to run the `pca()` function on a different model, you would just need to call `pca()` on your model of choice.
 # 
 # Before we define our function, we are going to declare the variable `labels`. We declare the `labels` variable outside of the PCA function for two reasons. First, by keeping `labels` outside of the function definition, we don't have to change anything about the PCA function if we want to change what the labels are. Second, it's a good practice to keep variables that aren't directly contributing to functionality of the function outside of its definition. 
+# 
+# Inside the function, rather than copying out all of the vectors and fitting `PCA()` again every time the function is called, we use `pca_projection()` from the `wem_tools` folder. The first time it is called for a model, it fits PCA to the model's vectors and saves the results in the "output" folder; after that, it gives back the saved results right away, so switching between the 2D and 3D plots below, or running a function again, doesn't mean waiting for PCA to be fitted again. The results are the same as the ones from `pca.fit_transform(vectors)` above, and if you retrain your model, PCA is fitted again for the new version.
 
 # In[23]:
 
 
 labels = list(model.wv.key_to_index)
 def pca(model):
-    vectors = model.wv[model.wv.key_to_index]  # get all the vectors
-    pca = PCA(n_components=2)
-    result = pca.fit_transform(vectors)
+    result = pca_projection(model.wv, 2)  # PCA is only fitted once for each model
     # create a scatter plot of the projection
     x_axis = result[:,0]
     y_axis = result[:,1]
@@ -339,9 +381,7 @@ pca(model)
 
 labels = list(model.wv.key_to_index)
 def pca_2d(model):
-    vectors = model.wv[model.wv.key_to_index]  # get all the vectors
-    pca = PCA(n_components=2)
-    result = pca.fit_transform(vectors)
+    result = pca_projection(model.wv, 2)  # PCA is only fitted once for each model
     # create a scatter plot of the projection
     x_axis = result[:,0]
     y_axis = result[:,1]
@@ -430,9 +470,7 @@ pca_2d(model)
 
 labels = list(model.wv.key_to_index)
 def pca_2d(model):
-    vectors = model.wv[model.wv.key_to_index]  # get all the vectors
-    pca = PCA(n_components=2)
-    result = pca.fit_transform(vectors)
+    result = pca_projection(model.wv, 2)  # PCA is only fitted once for each model
     # create a scatter plot of the projection
     x_axis = result[:,0]
     y_axis = result[:,1]
@@ -464,9 +502,7 @@ pca_2d(model)
 
 labels = list(model.wv.key_to_index)
 def pca_3d(model):
-    vectors = model.wv[model.wv.key_to_index]  #get all the vectors
-    pca = PCA(n_components=3)
-    result = pca.fit_transform(vectors)
+    result = pca_projection(model.wv, 3)  # PCA is only fitted once for each model
     # create a scatter plot of the projection
     x_axis = result[:,0]
     y_axis = result[:,1]
@@ -504,9 +540,7 @@ pca_3d(model)
 
 labels = list(model.wv.key_to_index)
 def pca_random(model):
-    vectors = model.wv[model.wv.key_to_index]  # get all the vectors
-    pca = PCA(n_components=2)
-    result = pca.fit_transform(vectors)
+    result = pca_projection(model.wv, 2)  # PCA is only fitted once for each model
     # create a scatter plot of the projection
     x_axis = result[:,0]
     y_axis = result[:,1]
@@ -543,6 +577,22 @@ pca_random(model)
 # 
 # PCA can generally help you get a sense of how your data is shaped. However, PCA is not particularly useful for determining what individual clusters of words might be. In order to determine that, you should turn to tSNE analysis, which is particularly useful for getting a sense of how your data is grouped whereas PCA more so captures a sense of the data as a whole.
 
+# #### Exploring Large Models in a Browser (Optional)
+# 
+# The plots above draw every word in the model at once. With `%matplotlib widget` (or with `plotly`) this gets slow once a model has more than a few tens of thousands of words, and the labels end up piled on top of one another. `export_tiles()` from the `wem_tools` folder instead cuts the 2D PCA plot of the whole vocabulary into square "tiles" at several zoom levels, the way online maps do. Zoomed out, you only see the most common words; as you zoom in, more and more of the vocabulary appears, and the most common words in view are labelled. The tiles are saved in the "output" folder along with a small web page that only loads the tiles you're looking at, so even a model with half a million words can be moved around and zoomed smoothly.
+# 
+# Browsers won't load the tiles from a page opened straight from your computer's files, so the page has to be served. After running the cell below, run `python -m http.server 8001 --directory ./output/tiles` in a terminal in this folder and visit http://127.0.0.1:8001/ in your browser. Drag to move around the plot and scroll to zoom in and out. To explore a tSNE plot instead, pass its coordinates for every word in the model, for example `export_tiles(model.wv, "./output/tiles", coordinates=tsne_projection(model.wv))`, though running tSNE on a whole large model takes a long time.
+
+# In[ ]:
+
+
+from wem_tools.tiles import export_tiles
+
+# cut the 2D PCA plot of every word in the model into tiles, along with a page for viewing them
+export_tiles(model.wv, "./output/tiles")
+
+
+
 # # tSNE Analysis ##
 # 
 # The final form of mathematical analysis that we will cover in this tutorial is tSNE analysis. T-distributed Stochastic Neighbourhood Embedding (tSNE) is a dimensionality reduction algorithm similar to PCA. However, while PCA is more concerned with preserving variance in a data set, tSNE cares more about things that are close together. Essentially, tSNE is a type of analysis that allows you to visualize all of the words in your corpus according to their relationships with other words. Imagine that tSNE is visualizing your corpus as a neighborhood where some words live next door to one another and other words might live across the street or on a different street altogether. Another important difference between tSNE and PCA, is that the results of tSNE analysis vary with each run. This is because tSNE is a probabilistic technique. tSNE is also always working in a two-dimensional space whereas PCA can work with many dimensions. 
@@ -656,9 +706,11 @@ y = [value[1] for value in new_values]
 # set the size of the scatter plot
 plt.figure(figsize=(figure_height, figure_width)) 
     
-# begin to plot each point and label it
+# plot all of the points at once
+plt.scatter(x, y)
+
+# label each point
 for i in range(len(x)):
-    plt.scatter(x[i],y[i])
     plt.annotate(labels[i],
                      xy=(x[i], y[i]),
                      xytext=(5, 2),
@@ -677,37 +729,29 @@ plt.show()
 #    ```
 # Just like the PCA analysis, you call the tSNE function by using `tsne_all_points(model)`. If you wanted to set a focus_word, you can follow this model: `tsne_all_points(model, focus_word="milk")`
 # 
-# All of the rest of the code is the same as above, just indented one line in to indicate that it is part of the function. When running the code below, you may trigger a future warning, but feel free to ignore it.
+# The rest of the code does the same work as above, just indented one line in to indicate that it is part of the function, with a few changes that make it practical for larger models:
+# 
+# - Instead of adding one vector at a time to a `tokens` list, `select_words()` from the `wem_tools` folder picks out the focus word and its neighbors, or the words in the vocabulary, all at once.
+# - tSNE only really looks at each word's closest neighbors, so `tsne_projection()` from the `wem_tools` folder finds those first, and then runs scikit-learn's tSNE on them alone, starting from the PCA results from earlier in this notebook. The neighbors and the tSNE results are saved in the "output" folder, so running `tsne_some_points()` or `tsne_all_points()` again on the same words of the same model is immediate. Like the `TSNE()` call above, it places words by the straight-line distance between their vectors; add `metric="cosine"` to place them by cosine similarity instead, the way `most_similar()` compares words.
+# - All of the points are drawn with a single call to `plt.scatter()` rather than one call per point.
+# - For a very large model, plotting every word would take a very long time and produce a plot too crowded to read, so without a focus word only the `max_words` most common words (10,000 by default) are included. You can change this with, for example, `tsne_all_points(model, max_words=2000)`.
 
 # In[ ]:
 
 
-def tsne_all_points(model, focus_word = None, n = 50):
-    labels = []
-    tokens = []
-
-    if focus_word is not None:
-        tokens.append(model.wv[focus_word])
-        labels.append(focus_word)
-        neighbors = model.wv.most_similar(focus_word, topn = n)
-        for neighbor in neighbors:
-            tokens.append(model.wv[neighbor[0]])
-            labels.append(neighbor[0])
-    else:
-        for word in model.wv.key_to_index:
-            tokens.append(model.wv[word])
-            labels.append(word)
-
-    tokens = np.array(tokens)
-    tsne_model = TSNE(perplexity=40, n_components=2, init='pca', max_iter=2500, random_state=23)
-    new_values = tsne_model.fit_transform(tokens)
-
-    x = [value[0] for value in new_values]
-    y = [value[1] for value in new_values]
+def tsne_all_points(model, focus_word = None, n = 50, max_words = 10000):
+    # get the rows and labels of the focus word and its neighbors, or of the most common words
+    rows, labels = select_words(model.wv, focus_word, n, max_words)
+
+    # run tSNE on each word's nearest neighbors, or load the results saved for these words
+    new_values = tsne_projection(model.wv, rows, perplexity=40, max_iter=2500, random_state=23)
+
+    x = new_values[:, 0]
+    y = new_values[:, 1]
         
     plt.figure(figsize=(figure_height, figure_width)) 
+    plt.scatter(x, y)
     for i in range(len(x)):
-        plt.scatter(x[i],y[i])
         plt.annotate(labels[i],
                       xy=(x[i], y[i]),
                       xytext=(5, 2),
@@ -745,32 +789,18 @@ tsne_all_points(model)
 # In[ ]:
 
 
-def tsne_some_points(model, focus_word = None, n = 50):
-    labels = []
-    tokens = []
-
-    if focus_word is not None:
-        tokens.append(model.wv[focus_word])
-        labels.append(focus_word)
-        neighbors = model.wv.most_similar(focus_word, topn = n)
-        for neighbor in neighbors:
-            tokens.append(model.wv[neighbor[0]])
-            labels.append(neighbor[0])
-    else:
-        for word in model.wv.key_to_index:
-            tokens.append(model.wv[word])
-            labels.append(word)
-
-    tokens = np.array(tokens)
-    tsne_model = TSNE(perplexity=40, n_components=2, init='pca', max_iter=2500, random_state=23)
-    new_values = tsne_model.fit_transform(tokens)
-
-    x = [value[0] for value in new_values]
-    y = [value[1] for value in new_values]
+def tsne_some_points(model, focus_word = None, n = 50, max_words = 10000):
+    # get the rows and labels of the focus word and its neighbors, or of the most common words
+    rows, labels = select_words(model.wv, focus_word, n, max_words)
+
+    # run tSNE on each word's nearest neighbors, or load the results saved for these words
+    new_values = tsne_projection(model.wv, rows, perplexity=40, max_iter=2500, random_state=23)
+
+    x = new_values[:, 0]
+    y = new_values[:, 1]
         
     plt.figure(figsize=(figure_height, figure_width)) 
-    for i in range(len(x)):
-        plt.scatter(x[i],y[i])
+    plt.scatter(x, y)
         
     # only label a random set of 25 points
     random.seed(0) 
@@ -797,32 +827,18 @@ tsne_some_points(model)
 # In[ ]:
 
 
-def tsne_random(model, focus_word = None, n = 50):
-    labels = []
-    tokens = []
-
-    if focus_word is not None:
-        tokens.append(model.wv[focus_word])
-        labels.append(focus_word)
-        neighbors = model.wv.most_similar(focus_word, topn = n)
-        for neighbor in neighbors:
-            tokens.append(model.wv[neighbor[0]])
-            labels.append(neighbor[0])
-    else:
-        for word in model.wv.key_to_index:
-            tokens.append(model.wv[word])
-            labels.append(word)
-    
-    tokens = np.array(tokens)
-    tsne_model = TSNE(perplexity=40, n_components=2, init='pca', max_iter=2500, random_state=23)
-    new_values = tsne_model.fit_transform(tokens)
+def tsne_random(model, focus_word = None, n = 50, max_words = 10000):
+    # get the rows and labels of the focus word and its neighbors, or of the most common words
+    rows, labels = select_words(model.wv, focus_word, n, max_words)
 
-    x = [value[0] for value in new_values]
-    y = [value[1] for value in new_values]
+    # run tSNE on each word's nearest neighbors, or load the results saved for these words
+    new_values = tsne_projection(model.wv, rows, perplexity=40, max_iter=2500, random_state=23)
+
+    x = new_values[:, 0]
+    y = new_values[:, 1]
         
     plt.figure(figsize=(figure_height, figure_width)) 
-    for i in range(len(x)):
-        plt.scatter(x[i],y[i])
+    plt.scatter(x, y)
         
     # only label a random set of 25 points
     random.seed() 
@@ -0,0 +1,11 @@
+"""
+Helper modules for the Word2Vec walkthroughs.
+
+The notebooks in this directory are written to be read from top to bottom, so
+most of their code lives in the notebook cells themselves. The modules in this
+package collect the pieces that the optional sections of the notebooks use for
+working with larger corpora and models. Import them from a notebook or script
+that is run from the `WordVectors/python` directory, for example:
+
+    from wem_tools.corpus import TextCorpus
+"""
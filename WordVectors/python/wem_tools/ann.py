@@ -0,0 +1,143 @@
+"""
+Approximate nearest neighbour search for word vectors.
+
+`most_similar()` compares the query with every word in the vocabulary, so it
+gets slower as the vocabulary grows. `IVFIndex` (an "inverted file" index)
+sorts the vocabulary into groups of words that point in similar directions
+ahead of time. A query is then only compared with the groups whose centres are
+closest to it, which skips most of the vocabulary at the cost of sometimes
+missing a neighbour that was filed in a group that wasn't searched.
+
+`probes`, the number of groups searched for each query, trades speed for
+accuracy: searching more groups finds more of the true neighbours but takes
+longer, and searching every group gives the same answers as `most_similar()`.
+Run `python -m wem_tools.benchmarks ann` to see how the two compare on a model.
+
+The index is saved as a few .npy files next to the vectors file, in the same
+way that gensim saves large arrays, and can be opened with mmap='r':
+
+    index = IVFIndex.build(wv)
+    index.save('./models/recipes-demo.wordvectors')
+    index = IVFIndex.load(wv, './models/recipes-demo.wordvectors', mmap='r')
+    index.most_similar('recipe', topn=10)
+"""
+
+import numpy as np
+
+from wem_tools.clustering import closest_centroids, kmeans
+from wem_tools.normed import normed_vectors
+
+
+INDEX_PARTS = ('centroids', 'rows', 'offsets', 'vectors')
+
+
+def _index_path(path, part):
+    return '%s.ivf_%s.npy' % (path, part)
+
+
+class IVFIndex:
+    """
+    An approximate nearest neighbour index over a set of KeyedVectors.
+
+    The unit-length vectors are stored sorted by group, so `vectors[offsets[i]:
+    offsets[i + 1]]` holds every word in group `i`, and `rows` gives the row
+    of each of those words in the original vectors. Use `IVFIndex.build()` to
+    create an index and `IVFIndex.load()` to open a saved one.
+
+    `probes` sets how many groups are searched by default; it can also be
+    given to each `most_similar()` call.
+    """
+
+    def __init__(self, language_model, centroids, rows, offsets, vectors, probes=None):
+        if len(rows) != len(language_model.index_to_key):
+            raise ValueError("index has %d words but the model has %d; rebuild the index"
+                             % (len(rows), len(language_model.index_to_key)))
+        self.language_model = language_model
+        self.centroids = centroids
+        self.rows = rows
+        self.offsets = offsets
+        self.vectors = vectors
+        self.probes = probes or max(1, len(centroids) // 16)
+
+    @classmethod
+    def build(cls, language_model, lists=None, iterations=10, sample_size=None, seed=0, probes=None):
+        # Groups the model's vocabulary into `lists` groups (by default about
+        # four times the square root of the vocabulary size). The group
+        # centres are found from a random sample of at most `sample_size`
+        # words, which is much faster than using every word and gives nearly
+        # the same groups.
+        normed = np.asarray(normed_vectors(language_model))
+        count = len(normed)
+        lists = min(count, lists or max(1, int(4 * np.sqrt(count))))
+        sample_size = min(count, max(lists, sample_size or 64 * lists))
+        rng = np.random.default_rng(seed)
+        sample = normed[np.sort(rng.choice(count, sample_size, replace=False))]
+        centroids = kmeans(sample, lists, iterations, seed)
+
+        assignments = closest_centroids(normed, centroids)[0]
+        rows = np.argsort(assignments, kind='stable').astype(np.int64)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=lists))))
+        return cls(language_model, centroids, rows, offsets, normed[rows], probes)
+
+    def save(self, path):
+        # Saves the index next to `path`, the file the vectors were saved to.
+        for part in INDEX_PARTS:
+            np.save(_index_path(path, part), getattr(self, part))
+
+    @classmethod
+    def load(cls, language_model, path, mmap=None, probes=None):
+        # Opens an index saved next to `path`. With mmap='r' the arrays are
+        # read from disk as they are needed instead of all at once.
+        parts = [np.load(_index_path(path, part), mmap_mode=mmap) for part in INDEX_PARTS]
+        return cls(language_model, *parts, probes=probes)
+
+    def search(self, query, topn=10, probes=None, exclude=()):
+        # Returns the rows and cosine similarities of the `topn` vectors
+        # closest to the unit-length `query`, best first, leaving out any
+        # rows in `exclude`.
+        probes = min(len(self.centroids), probes or self.probes)
+        nearest_lists = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+
+        rows, scores = [], []
+        for group in nearest_lists:
+            start, end = self.offsets[group], self.offsets[group + 1]
+            rows.append(self.rows[start:end])
+            scores.append(self.vectors[start:end] @ query)
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+        if len(exclude):
+            keep = ~np.isin(rows, exclude)
+            rows, scores = rows[keep], scores[keep]
+
+        if topn < len(scores):
+            best = np.argpartition(-scores, topn - 1)[:topn]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return rows[best], scores[best]
+
+    def most_similar(self, positive=None, negative=None, topn=10, probes=None):
+        """
+        Works like `KeyedVectors.most_similar()`, but only searches the
+        `probes` groups closest to the query.
+
+        Returns a list of (word, cosine similarity) pairs, best first, leaving
+        out the query words themselves.
+        """
+        if isinstance(positive, str):
+            positive = [positive]
+        if isinstance(negative, str):
+            negative = [negative]
+        positive = list(positive or [])
+        negative = list(negative or [])
+
+        language_model = self.language_model
+        keys = positive + negative
+        weights = np.concatenate((np.ones(len(positive)), -np.ones(len(negative))))
+        query = language_model.get_mean_vector(keys, weights, pre_normalize=True,
+                                               post_normalize=True, ignore_missing=False)
+        exclude = np.array([language_model.get_index(key) for key in keys], dtype=np.int64)
+
+        rows, scores = self.search(query, topn, probes, exclude)
+        index_to_key = language_model.index_to_key
+        return [(index_to_key[row], float(score)) for row, score in zip(rows.tolist(), scores)]
@@ -0,0 +1,766 @@
+"""
+Timing comparisons between the walkthrough code and the `wem_tools` helpers.
+
+Run from the `WordVectors/python` directory, for example:
+
+    python -m wem_tools.benchmarks cleaning --processes 4
+
+Each benchmark prints its timings and returns them as a dictionary, so they can
+also be called from a notebook.
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from gensim.models import KeyedVectors, Word2Vec
+from gensim.models.callbacks import CallbackAny2Vec
+
+from wem_tools.ann import IVFIndex
+from wem_tools.clustering import SphericalKMeans, representative_words
+from wem_tools.corpus import ChunkedCorpus, TextCorpus, chunk_tokens, clean_file, clean_files, clean_text, \
+    find_files
+from wem_tools.export import export_vectors, load_exported
+from wem_tools.normed import has_normed, load_normed, normed_vectors, save_normed
+from wem_tools.projection import pca_projection
+from wem_tools.quantize import METHODS, accuracy_report, quantize
+from wem_tools.similarity import similarities
+from wem_tools.tiles import export_tiles
+from wem_tools.training import measure_scaling, read_log, train_model, write_scaling_report
+from wem_tools.tsne import select_words, tsne_projection
+from wem_tools.updates import IncrementalUpdater
+
+
+SAMPLE_DATA = './data/sample-data-recipes/'
+SAMPLE_VECTORS = './models/recipes-demo.wordvectors'
+SAMPLE_MODEL = './models/recipes-demo.model'
+SAMPLE_ANALOGIES = './testing/analogies_test.txt'
+
+
+def notebook_clean_text(text):
+    # `clean_text()` exactly as it is written in word2vec-fundamentals.ipynb,
+    # kept here as the baseline that the helpers are compared against.
+
+    # lower case
+    tokens = text.split()
+    tokens = [t.lower() for t in tokens]
+
+    # remove punctuation
+    re_punc = re.compile('[%s]' % re.escape(string.punctuation))
+    tokens = [re_punc.sub('', token) for token in tokens]
+
+    # only include tokens that aren't numbers
+    tokens = [token for token in tokens if token.isalpha()]
+    return tokens
+
+
+def notebook_clean_text_stop_words(text, stop_words):
+    # The stop word version of `clean_text()` from wem-evaluation.ipynb.
+    tokens = notebook_clean_text(text)
+
+    # remove stop words
+    tokens = [w for w in tokens if not w in stop_words]
+    return tokens
+
+
+def notebook_chunk_texts(data_clean):
+    # The loop that splits a set of long texts into chunks in
+    # word2vec-fundamentals.ipynb. Note that from the second text on, flatten()
+    # also breaks the chunks made so far back into single tokens, so the
+    # result is not a list of chunks.
+    data_clean_chunked = []
+
+    def flatten(xss):
+        return [x for xs in xss for x in xs]
+
+    def chunks(lst, n):  # accepts a list and the number of tokens per list
+        for i in range(0, len(lst), n):
+            yield lst[i:i + n]
+
+    for i in data_clean:
+        data2 = list(chunks(i, 10000))
+        data_clean_chunked.append(data2)
+        data_clean_chunked = flatten(data_clean_chunked)
+    return data_clean_chunked
+
+
+def _best_of(repeat, function, *args, **kwargs):
+    # Runs `function` `repeat` times and returns the fastest time along with
+    # the result of the last run.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def benchmark_cleaning(dirpath=SAMPLE_DATA, processes=None, chunksize=None, repeat=3):
+    # Compares the serial read-then-clean loop from the notebooks with
+    # `clean_files()` spread over a pool of processes.
+    filenames = find_files(dirpath)
+
+    def serial():
+        data_clean = []
+        for filename in filenames:
+            with open(filename, encoding='utf-8') as afile:
+                data_clean.append(notebook_clean_text(afile.read()))
+        return data_clean
+
+    serial_time, expected = _best_of(repeat, serial)
+    results = {'files': len(filenames), 'serial': serial_time}
+    print("%d files" % len(filenames))
+    print("serial loop: %.3fs" % serial_time)
+
+    counts = [processes] if processes else sorted({1, 2, 4, os.cpu_count() or 1})
+    for count in counts:
+        elapsed, data_clean = _best_of(repeat, clean_files, filenames,
+                                       processes=count, chunksize=chunksize)
+        if data_clean != expected:
+            raise AssertionError("clean_files() output differs from the serial loop")
+        results[count] = elapsed
+        print("%d processes: %.3fs (%.2fx)" % (count, elapsed, serial_time / elapsed))
+    return results
+
+
+def benchmark_tokenizer(dirpath=SAMPLE_DATA, repeat=5):
+    # Checks that `clean_text()` from wem_tools.corpus gives exactly the same
+    # tokens as the notebook version for every file in `dirpath`, with and
+    # without stop words, and then compares how fast the two run.
+    texts = []
+    for filename in find_files(dirpath):
+        with open(filename, encoding='utf-8') as afile:
+            texts.append(afile.read())
+    stop_words = {'the', 'and', 'of', 'a', 'to', 'in', 'it', 'with', 'or', 'is'}
+
+    for text in texts:
+        if clean_text(text) != notebook_clean_text(text):
+            raise AssertionError("clean_text() differs from the notebook version")
+        if clean_text(text, stop_words) != notebook_clean_text_stop_words(text, stop_words):
+            raise AssertionError("clean_text() with stop words differs from the notebook version")
+    print("%d files: output identical to the notebook clean_text()" % len(texts))
+
+    characters = sum(len(text) for text in texts)
+    notebook_time, _ = _best_of(repeat, lambda: [notebook_clean_text(text) for text in texts])
+    single_pass_time, _ = _best_of(repeat, lambda: [clean_text(text) for text in texts])
+    print("notebook clean_text: %.3fs (%.1f MB/s)" % (notebook_time, characters / notebook_time / 1e6))
+    print("single-pass clean_text: %.3fs (%.1f MB/s, %.2fx)"
+          % (single_pass_time, characters / single_pass_time / 1e6, notebook_time / single_pass_time))
+    return {'notebook': notebook_time, 'single_pass': single_pass_time}
+
+
+def benchmark_ann(vectors=SAMPLE_VECTORS, lists=None, probes=None, queries=500, topn=10, seed=0):
+    # Measures how many of the true `topn` neighbours (recall@topn) an
+    # IVFIndex finds for a random sample of words, and how long each query
+    # takes, for several numbers of probes, compared with `most_similar()`.
+    language_model = KeyedVectors.load(vectors, mmap='r')
+    start = time.perf_counter()
+    index = IVFIndex.build(language_model, lists=lists, seed=seed)
+    print("%d words, %d groups, built in %.3fs"
+          % (len(language_model), len(index.centroids), time.perf_counter() - start))
+
+    rng = np.random.default_rng(seed)
+    words = [language_model.index_to_key[i] for i in
+             rng.choice(len(language_model), min(queries, len(language_model)), replace=False)]
+
+    start = time.perf_counter()
+    exact = [{word for word, _ in language_model.most_similar(word, topn=topn)} for word in words]
+    exact_time = (time.perf_counter() - start) / len(words)
+    results = {'exact': exact_time}
+    print("most_similar: %.3f ms per query" % (exact_time * 1000))
+
+    if probes is None:
+        probes = sorted({1, 2, 4, 8, 16, 32, len(index.centroids)} & set(range(1, len(index.centroids) + 1)))
+    for count in probes:
+        start = time.perf_counter()
+        found = [{word for word, _ in index.most_similar(word, topn=topn, probes=count)} for word in words]
+        elapsed = (time.perf_counter() - start) / len(words)
+        recall = np.mean([len(a & b) / len(a) for a, b in zip(exact, found)])
+        results[count] = (recall, elapsed)
+        print("%d probes: recall@%d %.3f, %.3f ms per query (%.2fx)"
+              % (count, topn, recall, elapsed * 1000, exact_time / elapsed))
+    return results
+
+
+def benchmark_similarity(vectors=SAMPLE_VECTORS, pairs=100000, seed=0):
+    # Checks that `similarities()` agrees with calling `wv.similarity()` for
+    # each of `pairs` random word pairs (one in twenty with a made-up word,
+    # which should give NaN), then compares how long the two take.
+    language_model = KeyedVectors.load(vectors, mmap='r')
+    rng = np.random.default_rng(seed)
+    vocab = language_model.index_to_key + ['notaword%d' % i for i in range(len(language_model) // 19 + 1)]
+    word_pairs = [(vocab[i], vocab[j]) for i, j in rng.integers(0, len(vocab), (pairs, 2)).tolist()]
+
+    def one_at_a_time():
+        scores = []
+        for word1, word2 in word_pairs:
+            if word1 in language_model.key_to_index and word2 in language_model.key_to_index:
+                scores.append(language_model.similarity(word1, word2))
+            else:
+                scores.append(np.nan)
+        return np.array(scores, dtype=np.float32)
+
+    loop_time, expected = _best_of(1, one_at_a_time)
+    batch_time, scores = _best_of(3, similarities, language_model, word_pairs)
+    if not np.allclose(scores, expected, atol=1e-6, equal_nan=True):
+        raise AssertionError("similarities() differs from wv.similarity()")
+    print("%d pairs (%d out of vocabulary): results match wv.similarity()"
+          % (pairs, np.isnan(expected).sum()))
+    print("wv.similarity loop: %.3fs" % loop_time)
+    print("similarities(): %.3fs (%.1fx)" % (batch_time, loop_time / batch_time))
+    return {'loop': loop_time, 'batch': batch_time}
+
+
+def _peak_memory(function, *args):
+    # Runs `function` and returns the time it took and the most memory that
+    # Python had allocated at any point while it ran.
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def benchmark_chunking(dirpath=SAMPLE_DATA, documents=5, size=10000):
+    # Joins the files in `dirpath` into `documents` long texts and splits them
+    # into chunks of `size` tokens, with the notebook's chunks()/flatten()
+    # loop and with ChunkedCorpus. ChunkedCorpus is checked against chunking
+    # each text separately, which is what the notebook loop is meant to do.
+    filenames = find_files(dirpath)
+    data_clean = [[token for filename in filenames[i::documents] for token in clean_file(filename)]
+                  for i in range(documents)]
+    expected = [chunk for tokens in data_clean for chunk in chunk_tokens(tokens, size)]
+    if list(ChunkedCorpus(data_clean, size)) != expected:
+        raise AssertionError("ChunkedCorpus differs from chunking each text separately")
+    print("%d texts, %d tokens, %d chunks of up to %d tokens"
+          % (documents, sum(len(tokens) for tokens in data_clean), len(expected), size))
+
+    notebook_time, notebook_peak = _peak_memory(notebook_chunk_texts, data_clean)
+    print("notebook chunks()/flatten() loop: %.3fs, peak %.1f MB" % (notebook_time, notebook_peak / 1e6))
+
+    def stream():
+        for _ in ChunkedCorpus(data_clean, size):
+            pass
+
+    stream_time, stream_peak = _peak_memory(stream)
+    print("ChunkedCorpus: %.3fs, peak %.1f MB" % (stream_time, stream_peak / 1e6))
+
+    def stream_from_disk():
+        for _ in ChunkedCorpus(TextCorpus(filenames), size):
+            pass
+
+    disk_time, disk_peak = _peak_memory(stream_from_disk)
+    print("ChunkedCorpus over a TextCorpus: %.3fs, peak %.1f MB" % (disk_time, disk_peak / 1e6))
+    return {'notebook': (notebook_time, notebook_peak), 'chunked': (stream_time, stream_peak),
+            'chunked_from_disk': (disk_time, disk_peak)}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def benchmark_server(vectors=SAMPLE_VECTORS, url=None, workers=1, clients=4, requests=500, batch=1, seed=0):
+    # Load test for wem_tools.server: `clients` threads send `requests`
+    # most_similar requests between them, each holding `batch` queries, and
+    # the throughput and response times are reported. Unless the `url` of a
+    # running server is given, a server with `workers` workers is started for
+    # the test and stopped afterwards.
+    language_model = KeyedVectors.load(vectors, mmap='r')
+    rng = np.random.default_rng(seed)
+    words = [language_model.index_to_key[i] for i in rng.integers(0, len(language_model), requests * batch)]
+
+    server = None
+    if url is None:
+        port = _free_port()
+        url = 'http://127.0.0.1:%d' % port
+        server = subprocess.Popen([sys.executable, '-m', 'wem_tools.server', vectors,
+                                   '--port', str(port), '--workers', str(workers)],
+                                  stdout=subprocess.DEVNULL)
+        # wait for the server to finish loading the model
+        for _ in range(600):
+            try:
+                urllib.request.urlopen(url + '/vocab?word=the', timeout=1).read()
+                break
+            except urllib.error.HTTPError:
+                # any answer at all means the server is up
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.1)
+        else:
+            server.kill()
+            raise RuntimeError("the server didn't start")
+
+    def send(number):
+        queries = [{'positive': [word], 'topn': 10} for word in words[number * batch:(number + 1) * batch]]
+        body = json.dumps({'queries': queries}).encode('utf-8')
+        start = time.perf_counter()
+        with urllib.request.urlopen(url + '/most_similar', data=body) as response:
+            results = json.loads(response.read())['results']
+        if len(results) != len(queries):
+            raise AssertionError("the server gave %d results for %d queries" % (len(results), len(queries)))
+        return time.perf_counter() - start
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            latencies = np.array(list(pool.map(send, range(requests))))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = {'requests_per_second': requests / elapsed,
+               'queries_per_second': requests * batch / elapsed,
+               'median_ms': np.median(latencies) * 1000,
+               'p95_ms': np.percentile(latencies, 95) * 1000}
+    print("%d requests of %d queries from %d clients in %.3fs" % (requests, batch, clients, elapsed))
+    print("%.1f requests/s, %.1f queries/s" % (results['requests_per_second'], results['queries_per_second']))
+    print("response time: median %.2f ms, 95th percentile %.2f ms" % (results['median_ms'], results['p95_ms']))
+    return results
+
+
+def benchmark_startup(model=SAMPLE_MODEL, repeat=3):
+    # Compares how long it takes to open a model and answer a first query
+    # with `Word2Vec.load()`, `KeyedVectors.load()` (with and without mmap)
+    # and `load_exported()`.
+    word = Word2Vec.load(model).wv.index_to_key[0]
+    with tempfile.TemporaryDirectory() as directory:
+        vectors = os.path.join(directory, 'vectors.wordvectors')
+        language_model = Word2Vec.load(model).wv
+        language_model.save(vectors)
+        export_vectors(language_model, os.path.join(directory, 'exported'))
+        expected = [key for key, _ in language_model.most_similar(word)]
+
+        loaders = [
+            ('Word2Vec.load', lambda: Word2Vec.load(model).wv),
+            ('KeyedVectors.load', lambda: KeyedVectors.load(vectors)),
+            ("KeyedVectors.load(mmap='r')", lambda: KeyedVectors.load(vectors, mmap='r')),
+            ('load_exported', lambda: load_exported(os.path.join(directory, 'exported'))),
+        ]
+        results = {}
+        for name, load in loaders:
+            load_time, loaded = _best_of(repeat, load)
+            start = time.perf_counter()
+            found = [key for key, _ in loaded.most_similar(word)]
+            query_time = time.perf_counter() - start
+            if found != expected:
+                raise AssertionError("%s gives different most_similar() results" % name)
+            results[name] = (load_time, query_time)
+            print("%-28s open %.4fs, first query %.4fs" % (name, load_time, query_time))
+    return results
+
+
+def benchmark_normed(vectors=SAMPLE_VECTORS, queries=100, seed=0):
+    # Compares the time of the first and the later most_similar() queries on
+    # freshly loaded vectors, with and without unit-length vectors saved by
+    # `save_normed()`.
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'vectors.wordvectors')
+        language_model = KeyedVectors.load(vectors)
+        language_model.save(path)
+        save_normed(language_model, path)
+        rng = np.random.default_rng(seed)
+        words = [language_model.index_to_key[i] for i in rng.integers(0, len(language_model), queries)]
+
+        results = {}
+        for name, with_normed in (('without saved norms', False), ('with saved norms', True)):
+            language_model = KeyedVectors.load(path, mmap='r')
+            if with_normed:
+                load_normed(language_model, path)
+            times = []
+            for word in words:
+                start = time.perf_counter()
+                language_model.most_similar(word)
+                times.append(time.perf_counter() - start)
+            results[name] = (times[0], np.median(times[1:]))
+            print("%-20s first query %.4fs, later queries %.4fs" % (name, times[0], np.median(times[1:])))
+    return results
+
+
+def benchmark_quantize(vectors=SAMPLE_VECTORS, analogies=SAMPLE_ANALOGIES, methods=METHODS, queries=100, seed=0):
+    # Reports the memory saved and the test scores lost by each quantization
+    # method (see `accuracy_report()`), then times most_similar() queries on
+    # the quantized vectors against the full model.
+    language_model = KeyedVectors.load(vectors)
+    results = accuracy_report(language_model, analogies, methods=methods)
+    rng = np.random.default_rng(seed)
+    words = [language_model.index_to_key[i] for i in rng.integers(0, len(language_model), queries)]
+
+    full_time, _ = _best_of(1, lambda: [language_model.most_similar(word) for word in words])
+    print("float32 most_similar: %.3f ms per query" % (full_time / queries * 1000))
+    for method in methods:
+        build_time, quantized = _best_of(1, quantize, language_model, method)
+        query_time, _ = _best_of(1, lambda: [quantized.most_similar(word) for word in words])
+        results[method].update(build=build_time, query=query_time / queries)
+        print("%s: built in %.2fs, %.3f ms per query" % (method, build_time, query_time / queries * 1000))
+    return results
+
+
+class _StopAfter(CallbackAny2Vec):
+    # Stops training after `epochs` epochs, as if Python had been interrupted.
+    def __init__(self, epochs):
+        self.epochs = epochs
+
+    def on_epoch_end(self, model):
+        self.epochs -= 1
+        if not self.epochs:
+            raise KeyboardInterrupt
+
+
+def benchmark_training(dirpath=SAMPLE_DATA, epochs=5, every=1, workers=4):
+    # Compares training in a single `Word2Vec()` call with `train_model()`,
+    # which saves a checkpoint every `every` epochs, then interrupts a second
+    # `train_model()` run partway through and times resuming it. Prints the
+    # words per second of each epoch from the training log.
+    data_clean = clean_files(find_files(dirpath))
+    params = dict(window=5, min_count=3, workers=workers, epochs=epochs, sg=1)
+    plain_time, _ = _best_of(1, Word2Vec, sentences=data_clean, **params)
+    print("Word2Vec():                      %.2fs" % plain_time)
+
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoints = os.path.join(directory, 'checkpoints')
+        checkpoint_time, _ = _best_of(1, train_model, data_clean, checkpoints, every, **params)
+        print("train_model() with checkpoints:  %.2fs" % checkpoint_time)
+        log = read_log(checkpoints)
+        for record in log:
+            print("  epoch %(epoch)d: %(seconds).2fs, %(words_per_second).0f words/s, loss %(loss).0f" % record)
+
+        resumed = os.path.join(directory, 'resumed')
+        stopped = max(1, epochs // 2)
+        try:
+            train_model(data_clean, resumed, every, callbacks=[_StopAfter(stopped)], **params)
+        except KeyboardInterrupt:
+            pass
+        resume_time, _ = _best_of(1, train_model, data_clean, resumed, every, **params)
+        print("resuming after epoch %d of %d:    %.2fs" % (stopped, epochs, resume_time))
+
+    words_per_second = [record['words_per_second'] for record in log]
+    return {'plain': plain_time, 'checkpoints': checkpoint_time, 'resume': resume_time,
+            'words_per_second': words_per_second}
+
+
+def benchmark_workers(dirpath=SAMPLE_DATA, workers=None, batch_words=(2500, 5000, 10000),
+                      sample_words=1000000, report=None):
+    # Reports how training speed changes with the number of worker threads
+    # and the batch size (see `measure_scaling()`), optionally saving the
+    # results as a CSV file.
+    data_clean = clean_files(find_files(dirpath))
+    results = measure_scaling(data_clean, workers, batch_words, sample_words, verbose=True,
+                              window=5, min_count=3, sg=1)
+    if report:
+        write_scaling_report(results, report)
+    return results
+
+
+def benchmark_clustering(vectors=SAMPLE_VECTORS, clusters=100, topn=15):
+    # Compares the notebook's KMeans on a copy of the vocabulary and its
+    # most_similar() loop with SphericalKMeans on the unit-length vectors and
+    # one call to representative_words(), checking that both ways of finding
+    # the representative words give the same similarities. Vectors with a saved `.normed.npy` are
+    # clustered straight from disk.
+    from sklearn import cluster
+
+    language_model = KeyedVectors.load(vectors, mmap='r')
+    if has_normed(vectors):
+        load_normed(language_model, vectors)
+
+    def notebook_kmeans():
+        vocab = language_model[language_model.key_to_index]
+        return cluster.KMeans(n_clusters=clusters, max_iter=40).fit(vocab)
+
+    kmeans_time, kmeans = _best_of(1, notebook_kmeans)
+    spherical_time, spherical = _best_of(1, SphericalKMeans(clusters).fit, normed_vectors(language_model))
+    print("KMeans:          %.2fs" % kmeans_time)
+    print("SphericalKMeans: %.2fs (%.1fx faster)" % (spherical_time, kmeans_time / spherical_time))
+
+    centroids = spherical.cluster_centers_
+    loop_time, expected = _best_of(1, lambda: [language_model.most_similar(positive=[centroid], topn=topn)
+                                               for centroid in centroids])
+    batched_time, found = _best_of(1, representative_words, language_model, centroids, topn)
+    # words with equal scores can come back in either order, so compare the scores
+    if not np.allclose([[score for _, score in words] for words in found],
+                       [[score for _, score in words] for words in expected], atol=1e-5):
+        raise AssertionError("representative_words() gives different results from most_similar()")
+    print("most_similar() loop:    %.3fs" % loop_time)
+    print("representative_words(): %.3fs (%.1fx faster)" % (batched_time, loop_time / batched_time))
+    return {'kmeans': kmeans_time, 'spherical': spherical_time, 'loop': loop_time, 'batched': batched_time}
+
+
+def benchmark_projection(vectors=SAMPLE_VECTORS):
+    # Times drawing the 2D and then the 3D PCA plot of the same model, as the
+    # notebook's pca_2d() and pca_3d() do, by fitting PCA() each time and with
+    # pca_projection(), in a fresh session and again once its results are
+    # saved. Checks that both give the same coordinates.
+    from sklearn.decomposition import PCA
+
+    language_model = KeyedVectors.load(vectors, mmap='r')
+
+    def notebook_views():
+        results = []
+        for dimensions in (2, 3):
+            vocab = language_model[language_model.key_to_index]
+            results.append(PCA(n_components=dimensions).fit_transform(vocab))
+        return results
+
+    def cached_views(cache_dir):
+        return [pca_projection(language_model, dimensions, cache_dir) for dimensions in (2, 3)]
+
+    notebook_time, expected = _best_of(1, notebook_views)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first_time, found = _best_of(1, cached_views, cache_dir)
+        cached_time, _ = _best_of(1, cached_views, cache_dir)
+        # a freshly loaded copy of the model only finds the saved results
+        language_model = KeyedVectors.load(vectors, mmap='r')
+        saved_time, _ = _best_of(1, cached_views, cache_dir)
+    for want, got in zip(expected, found):
+        if not np.allclose(want, got, atol=1e-4 * np.abs(want).max()):
+            raise AssertionError("pca_projection() gives different coordinates from PCA()")
+    print("PCA() for 2D and 3D:                  %.3fs" % notebook_time)
+    print("pca_projection() first time:          %.3fs" % first_time)
+    print("pca_projection() again:               %.5fs" % cached_time)
+    print("pca_projection() in a new session:    %.3fs" % saved_time)
+    return {'notebook': notebook_time, 'first': first_time, 'cached': cached_time, 'saved': saved_time}
+
+
+def benchmark_tsne(vectors=SAMPLE_VECTORS, max_words=5000, perplexity=40, max_iter=2500, metric='euclidean'):
+    # Compares the notebook's tSNE (a tokens list built one word at a time
+    # and TSNE(init='pca') on every vector) with tsne_projection() on the
+    # same `max_words` most common words, first and once its results are
+    # saved. Prints the trustworthiness of each plot: how well the 10 nearest
+    # neighbours (by `metric`) of each word on the plot match its nearest
+    # neighbours in the model, from 0 to 1.
+    from sklearn.manifold import TSNE, trustworthiness
+
+    language_model = KeyedVectors.load(vectors, mmap='r')
+    rows, labels = select_words(language_model, max_words=max_words)
+
+    def notebook_tsne():
+        tokens = []
+        for word in labels:
+            tokens.append(language_model[word])
+        tsne_model = TSNE(perplexity=perplexity, n_components=2, init='pca', max_iter=max_iter, random_state=23)
+        return tsne_model.fit_transform(np.array(tokens))
+
+    notebook_time, expected = _best_of(1, notebook_tsne)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        first_time, found = _best_of(1, tsne_projection, language_model, rows, perplexity, max_iter,
+                                     cache_dir=cache_dir, metric=metric)
+        cached_time, _ = _best_of(1, tsne_projection, language_model, rows, perplexity, max_iter,
+                                  cache_dir=cache_dir, metric=metric)
+    original = np.asarray(language_model.vectors[rows])
+    results = {'notebook': notebook_time, 'first': first_time, 'cached': cached_time,
+               'notebook_trustworthiness': trustworthiness(original, expected, n_neighbors=10, metric=metric),
+               'trustworthiness': trustworthiness(original, found, n_neighbors=10, metric=metric)}
+    print("TSNE() on %d words:           %.2fs, trustworthiness %.3f"
+          % (len(rows), notebook_time, results['notebook_trustworthiness']))
+    print("tsne_projection() first time: %.2fs, trustworthiness %.3f" % (first_time, results['trustworthiness']))
+    print("tsne_projection() again:      %.4fs" % cached_time)
+    return results
+
+
+def benchmark_tiles(vectors=SAMPLE_VECTORS, max_points=4096):
+    # Compares one plot of every word in the model, saved as a single JSON
+    # file as plotly would hold it, with export_tiles(). The largest tile is
+    # the most that the tile viewer has to fetch and draw for each tile in
+    # view, however big the model is.
+    language_model = KeyedVectors.load(vectors, mmap='r')
+    coordinates = pca_projection(language_model, 2, None)
+
+    def single_plot(path):
+        with open(path, 'w', encoding='utf-8') as plot_file:
+            json.dump({'x': coordinates[:, 0].tolist(), 'y': coordinates[:, 1].tolist(),
+                       'text': list(language_model.index_to_key)}, plot_file)
+        return os.path.getsize(path)
+
+    with tempfile.TemporaryDirectory() as directory:
+        single_time, single_size = _best_of(1, single_plot, os.path.join(directory, 'plot.json'))
+        tiles_dir = os.path.join(directory, 'tiles')
+        tiles_time, max_zoom = _best_of(1, export_tiles, language_model, tiles_dir, coordinates, max_points)
+        sizes = [os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(tiles_dir)
+                 for name in names if name.endswith('.json') and name != 'tiles.json']
+    print("one plot of %d words:    %.2fs, %.1fMB" % (len(coordinates), single_time, single_size / 2 ** 20))
+    print("export_tiles():           %.2fs, %d tiles in %d zoom levels, %.1fMB in all"
+          % (tiles_time, len(sizes), max_zoom + 1, sum(sizes) / 2 ** 20))
+    print("largest tile:             %.0fKB (%.0fKB on average)" % (max(sizes) / 2 ** 10, np.mean(sizes) / 2 ** 10))
+    return {'single': single_time, 'single_size': single_size, 'tiles': tiles_time, 'tile_count': len(sizes),
+            'zoom_levels': max_zoom + 1, 'largest_tile': max(sizes)}
+
+
+def benchmark_updates(model=SAMPLE_MODEL, dirpath=SAMPLE_DATA, batches=5, batch_size=100):
+    # Folds `batches` batches of `batch_size` documents into a saved model,
+    # first as the further explorations notebook does (load the model,
+    # build_vocab(update=True), train and save it again for each batch) and
+    # then with an IncrementalUpdater, and compares the documents per second.
+    documents = list(TextCorpus(find_files(dirpath)[:batches * batch_size]))
+    chunks = [documents[start:start + batch_size] for start in range(0, len(documents), batch_size)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = model
+        started = time.perf_counter()
+        for number, batch in enumerate(chunks):
+            retrained = Word2Vec.load(path)
+            retrained.build_vocab(batch, update=True)
+            retrained.train(batch, total_examples=len(batch), epochs=retrained.epochs)
+            path = os.path.join(directory, 'retrained-%d.model' % number)
+            retrained.save(path)
+        notebook_time = time.perf_counter() - started
+
+        updater = IncrementalUpdater(model, os.path.join(directory, 'updates'), batch_size)
+        started = time.perf_counter()
+        for batch in chunks:
+            updater.add(batch)
+            updater.update()
+        updater_time = time.perf_counter() - started
+
+    count = len(documents)
+    print("load, train and save each batch: %.2fs, %.1f documents/s" % (notebook_time, count / notebook_time))
+    print("IncrementalUpdater:              %.2fs, %.1f documents/s (%.1fx faster)"
+          % (updater_time, count / updater_time, notebook_time / updater_time))
+    return {'notebook': notebook_time, 'updater': updater_time, 'documents': count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    cleaning = subparsers.add_parser('cleaning', help='serial vs. multi-process text cleaning')
+    cleaning.add_argument('--dirpath', default=SAMPLE_DATA)
+    cleaning.add_argument('--processes', type=int)
+    cleaning.add_argument('--chunksize', type=int)
+    cleaning.add_argument('--repeat', type=int, default=3)
+
+    tokenizer = subparsers.add_parser('tokenizer', help='notebook vs. single-pass clean_text()')
+    tokenizer.add_argument('--dirpath', default=SAMPLE_DATA)
+    tokenizer.add_argument('--repeat', type=int, default=5)
+
+    ann = subparsers.add_parser('ann', help='IVFIndex vs. most_similar() recall and speed')
+    ann.add_argument('--vectors', default=SAMPLE_VECTORS)
+    ann.add_argument('--lists', type=int)
+    ann.add_argument('--probes', type=int, nargs='+')
+    ann.add_argument('--queries', type=int, default=500)
+    ann.add_argument('--topn', type=int, default=10)
+
+    similarity = subparsers.add_parser('similarity', help='wv.similarity() loop vs. similarities()')
+    similarity.add_argument('--vectors', default=SAMPLE_VECTORS)
+    similarity.add_argument('--pairs', type=int, default=100000)
+
+    server = subparsers.add_parser('server', help='load test for wem_tools.server')
+    server.add_argument('--vectors', default=SAMPLE_VECTORS)
+    server.add_argument('--url', help='address of a running server (by default one is started)')
+    server.add_argument('--workers', type=int, default=1)
+    server.add_argument('--clients', type=int, default=4)
+    server.add_argument('--requests', type=int, default=500)
+    server.add_argument('--batch', type=int, default=1)
+
+    startup = subparsers.add_parser('startup', help='time to open a model and answer a first query')
+    startup.add_argument('--model', default=SAMPLE_MODEL)
+    startup.add_argument('--repeat', type=int, default=3)
+
+    normed = subparsers.add_parser('normed', help='first query with and without saved unit-length vectors')
+    normed.add_argument('--vectors', default=SAMPLE_VECTORS)
+    normed.add_argument('--queries', type=int, default=100)
+
+    quantize_parser = subparsers.add_parser('quantize', help='memory, accuracy and speed of quantized vectors')
+    quantize_parser.add_argument('--vectors', default=SAMPLE_VECTORS)
+    quantize_parser.add_argument('--analogies', default=SAMPLE_ANALOGIES)
+    quantize_parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS)
+
+    chunking = subparsers.add_parser('chunking', help='notebook chunks()/flatten() vs. ChunkedCorpus')
+    chunking.add_argument('--dirpath', default=SAMPLE_DATA)
+    chunking.add_argument('--documents', type=int, default=5)
+    chunking.add_argument('--size', type=int, default=10000)
+
+    training = subparsers.add_parser('training', help='Word2Vec() vs. checkpointed train_model()')
+    training.add_argument('--dirpath', default=SAMPLE_DATA)
+    training.add_argument('--epochs', type=int, default=5)
+    training.add_argument('--every', type=int, default=1)
+    training.add_argument('--workers', type=int, default=4)
+
+    workers = subparsers.add_parser('workers', help='training speed with different worker counts and batch sizes')
+    workers.add_argument('--dirpath', default=SAMPLE_DATA)
+    workers.add_argument('--workers', type=int, nargs='+')
+    workers.add_argument('--batch-words', type=int, nargs='+', default=[2500, 5000, 10000])
+    workers.add_argument('--sample-words', type=int, default=1000000)
+    workers.add_argument('--report', help='path of a CSV file to save the results to')
+
+    clustering = subparsers.add_parser('clustering', help='KMeans vs. SphericalKMeans and representative_words()')
+    clustering.add_argument('--vectors', default=SAMPLE_VECTORS)
+    clustering.add_argument('--clusters', type=int, default=100)
+    clustering.add_argument('--topn', type=int, default=15)
+
+    projection = subparsers.add_parser('projection', help='PCA() for each plot vs. saved pca_projection()')
+    projection.add_argument('--vectors', default=SAMPLE_VECTORS)
+
+    tsne = subparsers.add_parser('tsne', help="the notebook's TSNE() vs. tsne_projection()")
+    tsne.add_argument('--vectors', default=SAMPLE_VECTORS)
+    tsne.add_argument('--max-words', type=int, default=5000)
+    tsne.add_argument('--perplexity', type=float, default=40)
+    tsne.add_argument('--max-iter', type=int, default=2500)
+    tsne.add_argument('--metric', choices=('euclidean', 'cosine'), default='euclidean')
+
+    tiles = subparsers.add_parser('tiles', help='one plot of every word vs. export_tiles()')
+    tiles.add_argument('--vectors', default=SAMPLE_VECTORS)
+    tiles.add_argument('--max-points', type=int, default=4096)
+
+    updates = subparsers.add_parser('updates', help='retraining the notebook way vs. IncrementalUpdater')
+    updates.add_argument('--model', default=SAMPLE_MODEL)
+    updates.add_argument('--dirpath', default=SAMPLE_DATA)
+    updates.add_argument('--batches', type=int, default=5)
+    updates.add_argument('--batch-size', type=int, default=100)
+
+    args = parser.parse_args()
+    if args.benchmark == 'cleaning':
+        benchmark_cleaning(args.dirpath, args.processes, args.chunksize, args.repeat)
+    elif args.benchmark == 'tokenizer':
+        benchmark_tokenizer(args.dirpath, args.repeat)
+    elif args.benchmark == 'ann':
+        benchmark_ann(args.vectors, args.lists, args.probes, args.queries, args.topn)
+    elif args.benchmark == 'similarity':
+        benchmark_similarity(args.vectors, args.pairs)
+    elif args.benchmark == 'server':
+        benchmark_server(args.vectors, args.url, args.workers, args.clients, args.requests, args.batch)
+    elif args.benchmark == 'startup':
+        benchmark_startup(args.model, args.repeat)
+    elif args.benchmark == 'normed':
+        benchmark_normed(args.vectors, args.queries)
+    elif args.benchmark == 'chunking':
+        benchmark_chunking(args.dirpath, args.documents, args.size)
+    elif args.benchmark == 'quantize':
+        benchmark_quantize(args.vectors, args.analogies, args.methods)
+    elif args.benchmark == 'training':
+        benchmark_training(args.dirpath, args.epochs, args.every, args.workers)
+    elif args.benchmark == 'workers':
+        benchmark_workers(args.dirpath, args.workers, args.batch_words, args.sample_words, args.report)
+    elif args.benchmark == 'clustering':
+        benchmark_clustering(args.vectors, args.clusters, args.topn)
+    elif args.benchmark == 'projection':
+        benchmark_projection(args.vectors)
+    elif args.benchmark == 'tsne':
+        benchmark_tsne(args.vectors, args.max_words, args.perplexity, args.max_iter, args.metric)
+    elif args.benchmark == 'tiles':
+        benchmark_tiles(args.vectors, args.max_points)
+    elif args.benchmark == 'updates':
+        benchmark_updates(args.model, args.dirpath, args.batches, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
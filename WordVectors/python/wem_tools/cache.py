@@ -0,0 +1,168 @@
+"""
+An on-disk cache of cleaned texts.
+
+Cleaning a large corpus can take minutes, and it has to be done again every
+time a model is trained, even when neither the texts nor the cleaning code have
+changed. `TokenCache` saves the tokens for each file the first time it is
+cleaned and hands them back on later runs, so retraining with different
+settings on the same corpus only has to read the cache.
+"""
+
+import hashlib
+import os
+import tempfile
+import zlib
+from functools import partial
+
+
+# Changes to a cleaning function's own code are noticed automatically (see
+# describe_cleaning()), but not changes to what it uses from outside, such as
+# `re_punc` in wem_tools.corpus. Change this whenever one of those makes
+# `clean_text()` produce different tokens, so that old cache entries are no
+# longer used.
+CACHE_VERSION = 1
+
+
+def _describe_value(value):
+    # repr() of a value, with sets sorted (their order changes from one run
+    # of Python to the next) and code objects (such as those of functions
+    # defined inside the cleaning function) described by their contents
+    if isinstance(value, (set, frozenset)):
+        return repr(sorted(value, key=repr))
+    if isinstance(value, (tuple, list)):
+        return '(%s)' % ', '.join(_describe_value(item) for item in value)
+    if hasattr(value, 'co_code'):
+        return _describe_code(value)
+    return repr(value)
+
+
+def _describe_code(code):
+    # The compiled instructions of a function along with the constants and
+    # names they use, which change whenever the function's source does
+    return '<%s %s %s %s>' % (code.co_name, code.co_code.hex(), _describe_value(code.co_consts),
+                              ' '.join(code.co_names))
+
+
+def describe_cleaning(clean):
+    # Returns a string that identifies a cleaning function and its settings,
+    # such as the stop words given to it with functools.partial. It includes
+    # a hash of the function's code and default arguments, so editing the
+    # function changes its description. Two functions with the same
+    # description are assumed to produce the same tokens.
+    if isinstance(clean, partial):
+        parts = [describe_cleaning(clean.func)]
+        parts.extend(_describe_value(arg) for arg in clean.args)
+        for name, value in sorted(clean.keywords.items()):
+            parts.append('%s=%s' % (name, _describe_value(value)))
+        return '(%s)' % ', '.join(parts)
+    description = '%s.%s' % (getattr(clean, '__module__', ''), getattr(clean, '__qualname__', repr(clean)))
+    code = getattr(clean, '__code__', None)
+    if code is not None:
+        source = _describe_code(code) + _describe_value(clean.__defaults__ or ())
+        description += '#' + hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+    return description
+
+
+class TokenCache:
+    """
+    Cleaned tokens stored on disk, keyed by the contents of each file.
+
+    Each entry is named after a SHA-1 hash of a file's bytes together with a
+    description of the cleaning function (including a hash of its code), so
+    an entry is only reused when the file is unchanged and it would be
+    cleaned in the same way. The tokens are
+    stored as compressed, newline-separated text, which is much smaller than
+    the original file.
+
+    When the cache grows beyond `max_bytes`, the entries that were used least
+    recently are deleted until it is back under 90% of that size.
+
+        cache = TokenCache('./output/token-cache')
+        data_clean = clean_files(filenames, cache=cache)
+    """
+
+    def __init__(self, directory='./output/token-cache', max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._entries())
+
+    def _entries(self):
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tok'):
+                    yield os.path.join(root, name)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.tok')
+
+    def key(self, data, clean):
+        # `data` is the raw bytes of a file and `clean` the cleaning function
+        digest = hashlib.sha1(data)
+        digest.update(('\0%d\0%s' % (CACHE_VERSION, describe_cleaning(clean))).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        # Returns the list of tokens saved under `key`, or None if there isn't one.
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as afile:
+                stored = afile.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # mark the entry as recently used so it is evicted last
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        text = zlib.decompress(stored).decode('utf-8')
+        return text.split('\n') if text else []
+
+    def put(self, key, tokens):
+        # Saves a list of tokens under `key`. Tokens never contain whitespace,
+        # so a newline is a safe separator.
+        stored = zlib.compress('\n'.join(tokens).encode('utf-8'), 1)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first so that other processes never see a
+        # half-written entry
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(handle, 'wb') as afile:
+            afile.write(stored)
+        os.replace(temp_path, path)
+
+        self.size += len(stored)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        # Deletes the least recently used entries until the cache is under 90%
+        # of `max_bytes`.
+        entries = []
+        for path in self._entries():
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, path))
+        self.size = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def clear(self):
+        # Deletes every entry in the cache.
+        for path in list(self._entries()):
+            os.remove(path)
+        self.size = 0
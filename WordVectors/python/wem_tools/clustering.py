@@ -0,0 +1,242 @@
+"""
+K-means clustering of word vectors by direction, a few thousand words at a time.
+
+The visualization notebook clusters a model with
+
+    vocab = model.wv[model.wv.key_to_index]
+    kmeans = cluster.KMeans(n_clusters=num_clusters, max_iter=40).fit(vocab)
+
+which makes a copy of every vector in the model and then compares every word
+with every centre on each of its passes. For a model with hundreds of
+thousands of words this takes minutes. `SphericalKMeans` instead moves the
+centres a little after each small random batch of words (mini-batch k-means),
+and compares words by cosine similarity, the same measure used by
+`most_similar()`. It reads the unit-length vectors a block at a time, so it
+works directly on the vectors saved by `save_normed()` and opened with
+mmap='r', without copying them.
+
+`cluster_vocabulary()` clusters a model and saves the centres and the cluster
+of every word, so the next run with the same model can load them instead:
+
+    kmeans = cluster_vocabulary(model.wv, 3, './output/recipes-demo')
+    representative_words(model.wv, kmeans.cluster_centers_, topn=15)
+
+The `kmeans()` function underneath `SphericalKMeans` is also used to build the
+search index in wem_tools.ann and the typical pieces in wem_tools.quantize.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from wem_tools.normed import fingerprint, normed_vectors
+
+
+CLUSTER_PARTS = ('cluster_centers_', 'labels_', 'scores_')
+
+
+def _cluster_path(path, part):
+    return '%s.kmeans_%s.npy' % (path, part.strip('_'))
+
+
+def _info_path(path):
+    return path + '.kmeans.json'
+
+
+def closest_centroids(vectors, centroids, spherical=True, block_size=16384):
+    # Returns the closest centroid to each vector and how close it is,
+    # reading the vectors a block at a time. With spherical=True the vectors
+    # must be unit length and closeness is cosine similarity; otherwise it is
+    # minus the squared Euclidean distance.
+    labels = np.empty(len(vectors), dtype=np.int32)
+    scores = np.empty(len(vectors), dtype=np.float32)
+    if not spherical:
+        half_norms = (centroids ** 2).sum(axis=1) / 2
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        similarity = block @ centroids.T
+        if not spherical:
+            # the closest centre is the one with the largest x.c - |c|^2 / 2
+            similarity -= half_norms
+        best = np.argmax(similarity, axis=1)
+        labels[start:start + block_size] = best
+        scores[start:start + block_size] = similarity[np.arange(len(similarity)), best]
+        if not spherical:
+            scores[start:start + block_size] = 2 * scores[start:start + block_size] - (block ** 2).sum(axis=1)
+    return labels, scores
+
+
+def kmeans(vectors, clusters, iterations=10, seed=0, spherical=True, batch_size=None):
+    """
+    Returns `clusters` centres that `vectors` are grouped around.
+
+    With spherical=True (the default) the vectors must be unit length, they
+    are grouped by cosine similarity and the centres are kept at unit length;
+    otherwise they are grouped by Euclidean distance. On each of `iterations`
+    steps every vector is given to its closest centre and each centre moves
+    to the average of its vectors. With `batch_size`, each step only looks at
+    a random batch of that many vectors and moves each centre towards the
+    average of its batch by an amount that shrinks as the centre collects more
+    vectors (mini-batch k-means), so a large or memory-mapped array is never
+    read all at once.
+    """
+    count = len(vectors)
+    if count < clusters:
+        raise ValueError("can't make %d clusters from %d vectors" % (clusters, count))
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[np.sort(rng.choice(count, clusters, replace=False))], dtype=np.float32)
+    seen = np.zeros(clusters, dtype=np.int64)
+    if batch_size is None:
+        batch = np.asarray(vectors, dtype=np.float32)
+
+    for _ in range(iterations):
+        if batch_size is None:
+            seen[:] = 0
+        else:
+            # sorted rows read a memory-mapped file in order
+            rows = np.sort(rng.choice(count, min(batch_size, count), replace=False))
+            batch = np.asarray(vectors[rows], dtype=np.float32)
+        labels = closest_centroids(batch, centroids, spherical)[0]
+        counts = np.bincount(labels, minlength=clusters)
+        filled = np.flatnonzero(counts)
+        order = np.argsort(labels, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.add.reduceat(batch[order], starts, axis=0)
+
+        # each centre is the running average of every vector it has been
+        # given so far (in this step only, without a batch_size), so it moves
+        # less as it collects more of them
+        seen += counts
+        rate = (counts[filled] / seen[filled])[:, np.newaxis]
+        centroids[filled] += rate * (sums / counts[filled, np.newaxis] - centroids[filled])
+        # a centre that has no vectors starts again from a random one
+        empty = np.flatnonzero(seen == 0)
+        centroids[empty] = batch[rng.choice(len(batch), len(empty), replace=False)]
+        if spherical:
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    return centroids
+
+
+class SphericalKMeans:
+    """
+    Mini-batch k-means that groups unit-length vectors by the direction they
+    point in.
+
+    Each of `max_iter` steps takes a random batch of `batch_size` vectors,
+    finds the closest centre to each one, and moves each centre towards the
+    average of its vectors by an amount that shrinks as the centre collects
+    more of them. The centres are kept at unit length throughout. After the
+    last step every vector is given to its closest centre.
+
+    The results are stored with the same names as scikit-learn's KMeans, so
+    it can take the place of `kmeans` in the notebook: `cluster_centers_`
+    holds the centres, `labels_` the cluster of each vector and `scores_` the
+    cosine similarity of each vector to its centre.
+    """
+
+    def __init__(self, n_clusters=8, batch_size=4096, max_iter=100, random_state=0):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.random_state = random_state
+
+    def fit(self, vectors):
+        # Clusters `vectors`, which must already be unit length, such as
+        # those from normed_vectors(). They can be a memory-mapped array.
+        centroids = kmeans(vectors, self.n_clusters, self.max_iter, self.random_state,
+                           batch_size=self.batch_size)
+        self.cluster_centers_ = centroids
+        self.labels_, self.scores_ = closest_centroids(vectors, centroids)
+        return self
+
+    def predict(self, vectors):
+        # The closest cluster to each of the unit-length `vectors`.
+        return closest_centroids(vectors, self.cluster_centers_)[0]
+
+    def save(self, path, model_fingerprint=None):
+        # Saves the centres, labels and scores next to `path`, along with the
+        # fingerprint of the model they were found for.
+        for part in CLUSTER_PARTS:
+            np.save(_cluster_path(path, part), getattr(self, part))
+        info = {'n_clusters': self.n_clusters, 'batch_size': self.batch_size, 'max_iter': self.max_iter,
+                'random_state': self.random_state, 'fingerprint': model_fingerprint}
+        with open(_info_path(path), 'w', encoding='utf-8') as info_file:
+            json.dump(info, info_file, indent=2)
+
+    @classmethod
+    def load(cls, path, mmap=None):
+        # Opens clusters saved next to `path`. With mmap='r' the labels and
+        # scores are read from disk as they are needed.
+        with open(_info_path(path), encoding='utf-8') as info_file:
+            info = json.load(info_file)
+        fitted = cls(info['n_clusters'], info['batch_size'], info['max_iter'], info['random_state'])
+        for part in CLUSTER_PARTS:
+            setattr(fitted, part, np.load(_cluster_path(path, part), mmap_mode=mmap))
+        fitted.fingerprint = info['fingerprint']
+        return fitted
+
+
+def cluster_vocabulary(language_model, n_clusters=8, path=None, verbose=True, **options):
+    """
+    Clusters the vocabulary of `language_model` by direction with
+    `SphericalKMeans` and returns the fitted clusters.
+
+    If `path` is given, the results are saved next to it, and if clusters
+    with the same settings were already saved there for the same model they
+    are loaded instead of being found again. `options` are passed on to
+    `SphericalKMeans`, for example `batch_size` or `max_iter`. The model's
+    unit-length vectors come from `load_normed()` if it has been used, so
+    they are not copied into memory.
+    """
+    settings = SphericalKMeans(n_clusters, **options)
+    model_fingerprint = fingerprint(language_model) if path else None
+    if path and os.path.exists(_info_path(path)):
+        saved = SphericalKMeans.load(path, mmap='r')
+        if saved.fingerprint == model_fingerprint and all(
+                getattr(saved, name) == getattr(settings, name)
+                for name in ('n_clusters', 'batch_size', 'max_iter', 'random_state')):
+            if verbose:
+                print("loaded the clusters saved at %s" % path)
+            return saved
+
+    fitted = settings.fit(normed_vectors(language_model))
+    if path:
+        fitted.save(path, model_fingerprint)
+    return fitted
+
+
+def representative_words(language_model, centroids, topn=15, block_size=16384):
+    """
+    Returns the `topn` words closest to each of the `centroids`, best first,
+    as a list with one list of (word, cosine similarity) pairs per centroid.
+
+    The results are the same as calling
+    `language_model.most_similar(positive=[centroid], topn=topn)` for each
+    centroid in turn, but every centroid is compared with each block of the
+    vocabulary at once, so the vectors are only read through one time.
+    """
+    centroids = np.asarray(centroids, dtype=np.float32)
+    centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+    normed = normed_vectors(language_model)
+    topn = min(topn, len(normed))
+    block_size = max(block_size, topn)
+
+    best_rows = np.empty((len(centroids), 0), dtype=np.int64)
+    best_scores = np.empty((len(centroids), 0), dtype=np.float32)
+    for start in range(0, len(normed), block_size):
+        block = np.asarray(normed[start:start + block_size], dtype=np.float32)
+        # keep the best `topn` of the ones found so far and this block's
+        rows = np.hstack((best_rows, np.broadcast_to(np.arange(start, start + len(block)),
+                                                     (len(centroids), len(block)))))
+        scores = np.hstack((best_scores, centroids @ block.T))
+        keep = np.argpartition(-scores, topn - 1, axis=1)[:, :topn]
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best_rows = np.take_along_axis(best_rows, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    index_to_key = language_model.index_to_key
+    return [[(index_to_key[row], float(score)) for row, score in zip(rows, scores)]
+            for rows, scores in zip(best_rows.tolist(), best_scores.tolist())]
@@ -0,0 +1,193 @@
+"""
+Reading and cleaning folders of plain text files for Word2Vec training.
+
+The walkthroughs read every file into a `data` list and then build a second,
+cleaned copy in `data_clean` before training. That is easy to follow, but it
+means the whole corpus sits in memory twice. The helpers below do the same
+work one file at a time, so the amount of memory used stays the same no matter
+how many files are in the corpus.
+"""
+
+import multiprocessing
+import os
+import re
+import string
+from functools import partial
+
+
+# compiled once here rather than every time a text is cleaned
+re_punc = re.compile('[%s]' % re.escape(string.punctuation))
+
+
+def find_files(dirpath, file_type=".txt"):
+    # Walks through a folder and its subfolders and returns the paths of every
+    # file ending with `file_type`, in the same order as the loop in the notebooks.
+    filenames = []
+    for root, dirs, files in os.walk(dirpath, topdown=False):
+        # look through all the files in the given directory
+        for name in files:
+            if (root + os.sep + name).endswith(file_type):
+                filenames.append(os.path.join(root, name))
+        # look through all the directories
+        for name in dirs:
+            if (root + os.sep + name).endswith(file_type):
+                filenames.append(os.path.join(root, name))
+    return filenames
+
+
+def clean_text(text, stop_words=None):
+    # Cleans the given text and returns a list of tokens. If a set of
+    # `stop_words` is given, those words are removed as well, as in the
+    # evaluation notebook.
+    #
+    # The result is the same as the `clean_text()` function in the walkthroughs,
+    # which splits the text and then makes a new list for each of lower-casing,
+    # removing punctuation and dropping non-alphabetic tokens. Here the whole
+    # text is lower-cased and stripped of punctuation in one go before it is
+    # split, and the remaining checks are done in a single list comprehension.
+    tokens = re_punc.sub('', text.lower()).split()
+
+    # only include tokens that aren't numbers, and remove stop words
+    if stop_words:
+        return [token for token in tokens if token.isalpha() and token not in stop_words]
+    return [token for token in tokens if token.isalpha()]
+
+
+def clean_file(filename, clean=clean_text, encoding='utf-8', cache=None):
+    # Reads a single file and returns its cleaned tokens. If a TokenCache from
+    # wem_tools.cache is given, the tokens are taken from the cache when the
+    # file hasn't changed since it was last cleaned, and saved to it when not.
+    if cache is None:
+        with open(filename, encoding=encoding) as afile:
+            return clean(afile.read())
+
+    with open(filename, 'rb') as afile:
+        data = afile.read()
+    key = cache.key(data, clean)
+    tokens = cache.get(key)
+    if tokens is None:
+        tokens = clean(data.decode(encoding))
+        cache.put(key, tokens)
+    return tokens
+
+
+def clean_files(filenames, processes=None, chunksize=None, clean=clean_text,
+                stop_words=None, encoding='utf-8', cache=None):
+    """
+    Cleans every file in `filenames` using a pool of worker processes.
+
+    Returns a list with one list of tokens per file, in the same order as
+    `filenames`, exactly as the serial `for` loop in the notebooks would.
+
+    `processes` defaults to the number of CPU cores. The files are handed to
+    the workers in batches of `chunksize` files; larger batches mean less
+    back-and-forth between processes, smaller batches spread uneven file sizes
+    more evenly. By default the list is split into about four batches per
+    worker.
+
+    `clean` must be a function that can be imported by the worker processes,
+    such as `clean_text` from this module. A function defined in a notebook
+    only works on systems that start workers with "fork" (Linux).
+
+    If a TokenCache from wem_tools.cache is given as `cache`, files that were
+    cleaned the same way before are read from the cache instead.
+    """
+    filenames = list(filenames)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if stop_words:
+        clean = partial(clean, stop_words=frozenset(stop_words))
+    if chunksize is None:
+        chunksize, extra = divmod(len(filenames), processes * 4)
+        if extra or not chunksize:
+            chunksize += 1
+    work = partial(clean_file, clean=clean, encoding=encoding, cache=cache)
+
+    # a single process doesn't need a pool at all
+    if processes == 1:
+        return [work(filename) for filename in filenames]
+    with multiprocessing.Pool(processes) as pool:
+        # imap hands back the results in the order the files were given
+        data_clean = list(pool.imap(work, filenames, chunksize=chunksize))
+
+    # each worker only knew about the entries it wrote itself, so check the
+    # size of the whole cache once they have all finished
+    if cache is not None:
+        cache.evict()
+    return data_clean
+
+
+class TextCorpus:
+    """
+    A cleaned corpus that is read from disk one file at a time.
+
+    Looping over a `TextCorpus` opens each file in `filenames`, cleans it with
+    `clean` and yields its list of tokens. Nothing is kept between files, and
+    every new loop starts again from the first file. This is what Gensim needs
+    from its `sentences` argument: it loops over the corpus once to build the
+    vocabulary and once more for every training epoch.
+
+        corpus = TextCorpus(find_files('./data/sample-data-recipes/'))
+        model = Word2Vec(sentences=corpus, window=5, min_count=3, workers=4, epochs=5, sg=1)
+
+    Passing a TokenCache from wem_tools.cache as `cache` means each file is
+    only cleaned once, on the first pass, instead of once per epoch.
+    """
+
+    def __init__(self, filenames, clean=clean_text, encoding='utf-8', cache=None):
+        self.filenames = list(filenames)
+        self.clean = clean
+        self.encoding = encoding
+        self.cache = cache
+
+    def __iter__(self):
+        for filename in self.filenames:
+            yield clean_file(filename, self.clean, self.encoding, self.cache)
+
+    def __len__(self):
+        return len(self.filenames)
+
+
+def chunk_tokens(tokens, size=10000, overlap=0):
+    # Yields the list of `tokens` in windows of at most `size` tokens. With
+    # `overlap`, each window starts with the last `overlap` tokens of the one
+    # before, so words near a split still have their neighbours on both sides.
+    if not 0 <= overlap < size:
+        raise ValueError("overlap must be at least 0 and less than size")
+    if not isinstance(tokens, list):
+        tokens = list(tokens)
+    step = size - overlap
+    for start in range(0, len(tokens), step):
+        yield tokens[start:start + size]
+        if start + size >= len(tokens):
+            break
+
+
+class ChunkedCorpus:
+    """
+    A corpus whose documents are split into windows of at most `size` tokens.
+
+    Gensim only trains on the first 10,000 tokens of each list it is given, so
+    long texts need to be split up before training. Looping over a
+    `ChunkedCorpus` splits each document in `documents` as it is reached and
+    yields the windows one at a time, so no copy of the whole corpus is ever
+    made. A window never holds tokens from two different documents.
+
+    `documents` can be a list of token lists, or a TextCorpus or TokenStore
+    that reads them from disk. Either way, every new loop starts again from
+    the first document, as Gensim needs.
+
+        data_clean_chunked = ChunkedCorpus(data_clean, size=10000)
+        model = Word2Vec(sentences=data_clean_chunked, window=5, min_count=3)
+    """
+
+    def __init__(self, documents, size=10000, overlap=0):
+        if not 0 <= overlap < size:
+            raise ValueError("overlap must be at least 0 and less than size")
+        self.documents = documents
+        self.size = size
+        self.overlap = overlap
+
+    def __iter__(self):
+        for tokens in self.documents:
+            yield from chunk_tokens(tokens, self.size, self.overlap)
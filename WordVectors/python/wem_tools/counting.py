@@ -0,0 +1,76 @@
+"""
+Counting word frequencies across a corpus.
+
+The evaluation notebook counts the words in a corpus one file at a time so that
+the whole corpus never has to be in memory. `WordCounter` keeps that running
+count and works out the most and least common words only when they are needed,
+instead of sorting the whole vocabulary after every file.
+"""
+
+import csv
+import heapq
+import os
+from collections import Counter
+from operator import itemgetter
+
+
+class WordCounter:
+    """
+    A running count of words that can save its top and bottom words to a CSV.
+
+    `update()` adds the tokens of one document to the count. The `n` most and
+    least common words are picked out with a heap, which takes time in
+    proportion to the size of the vocabulary rather than sorting it.
+
+    If `csv_path` is given, the CSV file is written every `checkpoint_every`
+    documents (if set) and whenever `write()` is called, in the same layout as
+    the evaluation notebook: a header row followed by a row holding the list of
+    most common and the list of least common (word, count) pairs.
+
+        counted_words = WordCounter(n=30, csv_path='./output/word_counts.csv')
+        for tokens in data_clean:
+            counted_words.update(tokens)
+        counted_words.write()
+    """
+
+    def __init__(self, n=30, csv_path=None, checkpoint_every=None):
+        self.n = n
+        self.csv_path = csv_path
+        self.checkpoint_every = checkpoint_every
+        self.counts = Counter()
+        self.documents = 0
+
+    def update(self, tokens):
+        # Adds the tokens of one document to the running count.
+        self.counts.update(tokens)
+        self.documents += 1
+        if self.checkpoint_every and self.documents % self.checkpoint_every == 0:
+            self.write()
+
+    def most_common(self, n=None):
+        # The n most common words, the same as Counter.most_common(n).
+        return self.counts.most_common(self.n if n is None else n)
+
+    def least_common(self, n=None):
+        # The n least common words, least common first. This gives the same
+        # list, in the same order, as `counts.most_common()[:-n-1:-1]` in the
+        # notebook: words with equal counts come out in the reverse of the order
+        # they were first seen in.
+        n = self.n if n is None else n
+        return heapq.nsmallest(n, reversed(self.counts.items()), key=itemgetter(1))
+
+    def write(self, csv_path=None):
+        # Saves the most and least common words to `csv_path` (by default the
+        # path given when the counter was created).
+        csv_path = csv_path or self.csv_path
+        if csv_path is None:
+            raise ValueError("no csv_path was given to write the word counts to")
+
+        # write to a temporary file and then swap it in, so that the CSV is
+        # never left half-written if Python stops partway through
+        temp_path = csv_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8', newline='') as counted_file:
+            c = csv.writer(counted_file)
+            c.writerows([['Top %d Words' % self.n, '%d Least Common' % self.n],
+                         [self.most_common(), self.least_common()]])
+        os.replace(temp_path, csv_path)
@@ -0,0 +1,460 @@
+"""
+Faster analogy evaluation for word vectors.
+
+`evaluate_word_analogies_mod()` in the evaluation notebook asks the model for
+the fifteen nearest neighbours of each test word with its own `most_similar()`
+call, and each of those calls compares the test word with every word in the
+vocabulary. `evaluate_word_analogies_batched()` gives exactly the same scores,
+but looks up the neighbours of a whole batch of test words at once with a
+single matrix multiplication, which is much faster for large vocabularies and
+long lists of word pairs.
+
+`evaluate_models()` runs the word pair and analogy tests on every model in a
+folder and saves the results for all of them to a single CSV file.
+"""
+
+import csv
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from gensim.models import KeyedVectors, Word2Vec
+
+from wem_tools.normed import has_normed, load_normed, saved_normed
+from wem_tools.similarity import row_similarities
+
+
+# the word pairs tested for every model in the R walkthroughs' model-test-results.csv
+DEFAULT_WORD_PAIRS = [
+    ("away", "off"), ("before", "after"), ("cause", "effects"), ("children", "parents"),
+    ("come", "go"), ("day", "night"), ("first", "second"), ("good", "bad"),
+    ("last", "first"), ("kind", "sort"), ("leave", "quit"), ("life", "death"),
+    ("girl", "boy"), ("little", "small"),
+]
+
+
+def read_word_pairs(path):
+    # Reads a file with two words on each line, separated by a tab, space or
+    # comma, and returns a list of (word1, word2) pairs.
+    pairs = []
+    with open(path, encoding='utf8') as pairs_file:
+        for line in pairs_file:
+            words = line.replace(',', ' ').split()
+            if len(words) == 2:
+                pairs.append(tuple(words))
+    return pairs
+
+
+def read_analogies(analogies):
+    """
+    Reads a file of word pairs in the BATS format used by the evaluation notebook.
+
+    Returns a list of sections, each a dictionary with the section name and a
+    list of questions. Each question is a pair of the upper-cased test word and
+    the list of its upper-cased acceptable answers:
+
+        [{'section': 'rooms', 'questions': [('SOFA', ['LIVING-ROOM', 'PARLOR', 'SITTING-ROOM']), ...]}, ...]
+    """
+    sections, section = [], None
+    with open(analogies, encoding='utf8') as analogs:
+        for line in analogs:
+            if line.startswith(': '): # the subcategories are separated here
+                section = {'section': line.lstrip(': ').strip(), 'questions': []}
+                sections.append(section)
+            elif line.strip():
+                # convert all words to uppercase to avoid case variations
+                a, expected = [word.upper() for word in line.split()]
+                section['questions'].append((a, expected.split('/')))
+    return sections
+
+
+class FoldedIndex:
+    """
+    An upper-cased ("case-folded") view of a model's vocabulary.
+
+    The evaluation notebook compares words in upper case so that "Milk" and
+    "milk" count as the same word. A `FoldedIndex` does that upper-casing once
+    for the whole vocabulary, instead of once for every neighbour of every test
+    word:
+
+    * `rows` maps each upper-cased word to the row of its vector. When several
+      words only differ in case, the most frequent one (the lowest row) is
+      used, as in the notebook.
+    * `folded_keys` holds the upper-cased word for each row.
+
+    The index is never changed after it is built, so one index can be shared by
+    any number of threads evaluating the same model. Use `folded_index()` to
+    get the shared index for a model rather than building a new one.
+    """
+
+    def __init__(self, language_model):
+        self.folded_keys = np.array([key.upper() for key in language_model.index_to_key], dtype=object)
+        rows = {}
+        for row, folded in enumerate(self.folded_keys.tolist()):
+            rows.setdefault(folded, row)
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.folded_keys)
+
+    def __contains__(self, folded):
+        return folded in self.rows
+
+    def row(self, word):
+        # The row for `word` in any mix of upper and lower case, or None.
+        return self.rows.get(word.upper())
+
+
+_folded_indexes = weakref.WeakKeyDictionary()
+_folded_indexes_lock = threading.Lock()
+
+
+def folded_index(language_model):
+    # Returns the FoldedIndex for a KeyedVectors model, building it the first
+    # time it is asked for and again only if words are added to the model.
+    with _folded_indexes_lock:
+        index = _folded_indexes.get(language_model)
+        if index is None or len(index) != len(language_model.index_to_key):
+            index = _folded_indexes[language_model] = FoldedIndex(language_model)
+        return index
+
+
+def _query_vectors(language_model, rows):
+    # The unit-length query vector for each row, worked out exactly as
+    # most_similar() does for a single positive word.
+    weight = np.ones(1)
+    return np.array([
+        language_model.get_mean_vector([row], weight, pre_normalize=True, post_normalize=True)
+        for row in rows
+    ])
+
+
+def nearest_rows(language_model, rows, topn=15, batch_size=256, threads=1):
+    """
+    Returns an array with the rows of the `topn` nearest neighbours of each row
+    in `rows`, leaving out the row itself, as most_similar() does.
+
+    The cosine similarities for `batch_size` rows at a time are worked out with
+    one matrix multiplication. np.argpartition then picks out the top `topn`
+    of each batch without sorting the whole vocabulary. The neighbours of each
+    row are returned in no particular order.
+
+    With `threads` greater than one, several batches are worked on at once.
+    The model is only read, never changed, so this is safe.
+
+    Vectors that search themselves, such as wem_tools.quantize's
+    QuantizedVectors, are asked for their own `nearest_rows()`.
+    """
+    if hasattr(language_model, 'nearest_rows'):
+        return language_model.nearest_rows(rows, topn, batch_size, threads)
+    language_model.fill_norms()
+    vectors, norms = language_model.vectors, language_model.norms
+    # unit-length vectors saved with save_normed() don't need dividing by the norms
+    normed = saved_normed(language_model)
+    rows = np.asarray(rows, dtype=np.int64)
+    topn = min(topn, len(vectors) - 1)
+    neighbours = np.empty((len(rows), topn), dtype=np.int64)
+
+    def run_batch(start):
+        batch = rows[start:start + batch_size]
+        if normed is not None:
+            dists = _query_vectors(language_model, batch) @ normed.T
+        else:
+            dists = _query_vectors(language_model, batch) @ vectors.T
+            dists /= norms
+        # the test word itself is never one of its own neighbours
+        dists[np.arange(len(batch)), batch] = -np.inf
+        neighbours[start:start + len(batch)] = np.argpartition(-dists, topn - 1, axis=1)[:, :topn]
+
+    starts = range(0, len(rows), batch_size)
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(run_batch, starts))
+    else:
+        for start in starts:
+            run_batch(start)
+    return neighbours
+
+
+def score_analogies(sections, language_model, topn=15, batch_size=256, threads=1):
+    """
+    Scores already-read analogy `sections` (see `read_analogies()`) against a
+    KeyedVectors model.
+
+    A question counts as correct when one of its acceptable answers is among
+    the `topn` nearest neighbours of the test word. Questions where the test
+    word or every answer is missing from the vocabulary count as incorrect,
+    and are also counted as out of vocabulary.
+
+    Returns a dictionary with the (name, correct, total) counts for each
+    section, the number of questions and of out-of-vocabulary questions, the
+    number of nearest-neighbour queries run, and the time they took.
+    """
+    start = time.perf_counter()
+    index = folded_index(language_model)
+    ok_vocab, folded_keys = index.rows, index.folded_keys
+
+    # find every test word that needs its neighbours looked up, once each
+    rows = {}
+    for section in sections:
+        for a, expected in section['questions']:
+            if a and a in ok_vocab and any(e and e in ok_vocab for e in expected):
+                rows.setdefault(a, len(rows))
+    neighbours = nearest_rows(language_model, [ok_vocab[a] for a in rows], topn, batch_size, threads)
+
+    results = {'sections': [], 'questions': 0, 'oov': 0, 'queries': len(rows)}
+    for section in sections:
+        correct = 0
+        for a, expected in section['questions']:
+            results['questions'] += 1
+            combos = [e for e in expected if a and e]
+            usable = [e for e in combos if a in ok_vocab and e in ok_vocab]
+            # if every combination contains an out-of-vocabulary word, the question is void
+            if not usable and len(combos) == len(expected):
+                results['oov'] += 1
+            if usable:
+                predicted = set(folded_keys[neighbours[rows[a]]])
+                if any(e in predicted for e in usable):
+                    correct += 1
+        results['sections'].append((section['section'], correct, len(section['questions'])))
+    results['seconds'] = time.perf_counter() - start
+    return results
+
+
+def _print_summary(results):
+    # Prints the scores in the same form as evaluate_word_analogies_mod() and
+    # returns the total score.
+    total = 0
+    total_correct = 0
+    for name, correct, questions in results['sections']:
+        if questions == 0: # avoid dividing by zero
+            score = 0
+        else:
+            score = correct / questions
+
+        subcat_score = ('section', name), score, correct, "/", questions
+        print(subcat_score)
+
+        total += questions
+        total_correct += correct
+
+    # an analogies file with no questions in it has no rate or score
+    oov_ratio = results['oov'] / results['questions'] if results['questions'] else float('nan')
+    print('Out Of Vocabulary rate: ', oov_ratio)
+
+    total_score = total_correct / total if total else 0
+    print('Total category score: ', total_score)
+
+    print('%d queries in %.2fs (%.0f queries per second)'
+          % (results['queries'], results['seconds'], results['queries'] / max(results['seconds'], 1e-9)))
+    return total_score
+
+
+def evaluate_word_analogies_batched(analogies, vectors, topn=15, batch_size=256, threads=1):
+    """
+    Evaluates word vectors against a file of word pairs, giving the same scores
+    and printing the same summary as `evaluate_word_analogies_mod()` in the
+    evaluation notebook, followed by the number of queries per second.
+
+    `vectors` is the path to a saved KeyedVectors file, or a KeyedVectors
+    model that has already been loaded. `batch_size` sets how many test words
+    are compared with the vocabulary at once; larger batches are faster but
+    take `batch_size` times the vocabulary size in memory. `threads` sets how
+    many batches are worked on at the same time.
+    """
+    print('Starting analogy evaluations using %s. Loading model...' % analogies)
+    if isinstance(vectors, KeyedVectors):
+        language_model = vectors
+    else:
+        language_model = KeyedVectors.load(vectors)
+        if has_normed(vectors):
+            load_normed(language_model, vectors)
+
+    results = score_analogies(read_analogies(analogies), language_model, topn, batch_size, threads)
+    return _print_summary(results)
+
+
+def split_analogies(sections, shards):
+    # Splits the questions in `sections` into about `shards` runs of
+    # consecutive questions. Each shard is a list of (section number, section)
+    # pairs; a long section can be spread over several shards.
+    questions = [(number, question) for number, section in enumerate(sections)
+                 for question in section['questions']]
+    size = max(1, -(-len(questions) // shards))
+    split = []
+    for start in range(0, len(questions), size):
+        shard = []
+        for number, question in questions[start:start + size]:
+            if not shard or shard[-1][0] != number:
+                shard.append((number, {'section': sections[number]['section'], 'questions': []}))
+            shard[-1][1]['questions'].append(question)
+        split.append(shard)
+    return split
+
+
+# the model opened by each worker process in evaluate_word_analogies_parallel()
+_worker_model = None
+
+
+def _open_worker_model(vectors):
+    global _worker_model
+    # mmap='r' maps the saved vectors file into memory instead of reading it,
+    # so every worker shares the one copy the operating system keeps
+    _worker_model = KeyedVectors.load(vectors, mmap='r')
+    if has_normed(vectors):
+        # the parent process has already checked the unit-length vectors, so
+        # the workers only open them; if they have changed since, the
+        # worker works out the norms itself rather than saving them again
+        try:
+            load_normed(_worker_model, vectors, rebuild=False)
+        except ValueError:
+            pass
+
+
+def _score_shard(shard, topn, batch_size):
+    results = score_analogies([section for _, section in shard], _worker_model, topn, batch_size)
+    results['numbers'] = [number for number, _ in shard]
+    return results
+
+
+def evaluate_word_analogies_parallel(analogies, vectors, processes=None, topn=15, batch_size=256):
+    """
+    Evaluates word vectors against a file of word pairs using a pool of worker
+    processes, giving the same scores and summary as
+    `evaluate_word_analogies_batched()`.
+
+    The questions are split into runs of consecutive lines, several per
+    process. Each process opens the vectors saved at the path `vectors` with
+    `mmap='r'`, so the vectors are read from disk once and shared between all
+    of the processes instead of each holding its own copy. Large vectors are
+    saved to a separate .npy file by KeyedVectors.save(), which is what makes
+    this possible. The correct and incorrect counts from each process are then
+    added together section by section.
+
+    `processes` defaults to the number of CPU cores.
+    """
+    processes = processes or os.cpu_count() or 1
+    print('Starting analogy evaluations using %s with %d processes...' % (analogies, processes))
+    start = time.perf_counter()
+    sections = read_analogies(analogies)
+    shards = split_analogies(sections, processes * 4)
+    if has_normed(vectors):
+        # check the saved unit-length vectors (and save them again if they
+        # are out of date) once here, rather than in every worker at once
+        load_normed(KeyedVectors.load(vectors, mmap='r'), vectors)
+
+    with multiprocessing.Pool(processes, initializer=_open_worker_model, initargs=(vectors,)) as pool:
+        shard_results = pool.starmap(_score_shard, [(shard, topn, batch_size) for shard in shards])
+
+    # add up the counts for each section across all of the shards
+    correct = [0] * len(sections)
+    totals = [0] * len(sections)
+    results = {'questions': 0, 'oov': 0, 'queries': 0}
+    for shard_result in shard_results:
+        for number, (_, shard_correct, shard_total) in zip(shard_result['numbers'], shard_result['sections']):
+            correct[number] += shard_correct
+            totals[number] += shard_total
+        for count in ('questions', 'oov', 'queries'):
+            results[count] += shard_result[count]
+    results['sections'] = [(section['section'], correct[number], totals[number])
+                           for number, section in enumerate(sections)]
+    results['seconds'] = time.perf_counter() - start
+    return _print_summary(results)
+
+
+def score_word_pairs(word_pairs, language_model):
+    # Returns the cosine similarity of each (word1, word2) pair, ignoring case,
+    # or NaN when either word isn't in the model's vocabulary.
+    index = folded_index(language_model)
+    rows = [-1 if row is None else row
+            for pair in word_pairs for row in (index.row(pair[0]), index.row(pair[1]))]
+    rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return row_similarities(language_model, rows[:, 0], rows[:, 1]).astype(np.float64)
+
+
+MODEL_EXTENSIONS = ('.wordvectors', '.wv', '.kv', '.model')
+
+
+def find_models(model_dir, extensions=MODEL_EXTENSIONS):
+    # Returns the paths of every saved model or set of vectors in `model_dir`.
+    # A model saved as both a .model file and a vectors file is only listed
+    # once, as whichever of its files has the extension that comes first in
+    # `extensions` (by default the vectors file).
+    found = {}
+    for name in os.listdir(model_dir):
+        for rank, extension in enumerate(extensions):
+            if name.endswith(extension):
+                stem = name[:-len(extension)]
+                if stem not in found or rank < found[stem][0]:
+                    found[stem] = (rank, name)
+                break
+    return sorted(os.path.join(model_dir, name) for _, name in found.values())
+
+
+def load_vectors(path):
+    # Opens saved vectors, or the vectors of a saved Word2Vec model, with
+    # mmap='r' so that they are read from disk only as they are used.
+    if path.endswith('.model'):
+        language_model = Word2Vec.load(path, mmap='r').wv
+    else:
+        language_model = KeyedVectors.load(path, mmap='r')
+    # unit-length vectors saved with save_normed() are used if there are any
+    if has_normed(path):
+        load_normed(language_model, path)
+    return language_model
+
+
+def evaluate_models(model_dir, analogies=None, word_pairs=DEFAULT_WORD_PAIRS,
+                    output_csv='./output/model-test-results.csv', topn=15, batch_size=256):
+    """
+    Tests every model in `model_dir` and writes all of the results to one CSV.
+
+    Like model-test-results.csv from the R walkthroughs, the CSV has a column
+    for each model and a row for each word pair, holding the cosine similarity
+    of the two words (empty if either is missing from the model). If an
+    `analogies` file is given, rows follow with each model's score for every
+    section of the file, its total score and its out-of-vocabulary rate, as
+    printed by `evaluate_word_analogies_mod()`.
+
+    The word pairs and analogies are read once and shared by every model, and
+    each model is opened with mmap='r' only when it is its turn, so testing
+    many models costs little more than scoring each of them.
+
+    Returns the results as a dictionary of {model path: list of scores}.
+    """
+    if isinstance(word_pairs, str):
+        word_pairs = read_word_pairs(word_pairs)
+    sections = read_analogies(analogies) if analogies else []
+    row_names = ['%s-%s' % pair for pair in word_pairs]
+    if sections:
+        row_names += ['analogies: %s' % section['section'] for section in sections]
+        row_names += ['analogies: total', 'analogies: out of vocabulary rate']
+
+    results = {}
+    for path in find_models(model_dir):
+        print('Testing %s...' % path)
+        language_model = load_vectors(path)
+        scores = score_word_pairs(word_pairs, language_model).tolist()
+        if sections:
+            analogy_results = score_analogies(sections, language_model, topn, batch_size)
+            total = total_correct = 0
+            for _, correct, questions in analogy_results['sections']:
+                scores.append(correct / questions if questions else 0)
+                total += questions
+                total_correct += correct
+            scores.append(total_correct / total if total else 0)
+            scores.append(analogy_results['oov'] / analogy_results['questions']
+                          if analogy_results['questions'] else float('nan'))
+        results[path] = scores
+
+    with open(output_csv, 'w', encoding='utf-8', newline='') as results_file:
+        c = csv.writer(results_file)
+        c.writerow([''] + [os.path.basename(path) for path in results])
+        for i, row_name in enumerate(row_names):
+            c.writerow([row_name] + ['' if np.isnan(scores[i]) else scores[i] for scores in results.values()])
+    print('Results for %d models saved to %s' % (len(results), output_csv))
+    return results
@@ -0,0 +1,80 @@
+"""
+Saving vectors in a bare-bones form that opens almost instantly.
+
+A `.model` file holds everything needed to keep training a model, and even a
+`.wordvectors` file is a pickled Python object that has to be unpacked before
+it can be used. When a model is only going to be queried, all that is needed
+is the matrix of vectors and the list of words. `export_vectors()` saves just
+those two things:
+
+    recipes-demo.matrix.npy    the vectors, as float32
+    recipes-demo.vocab.txt     the words, one per line, in the same order
+
+`load_exported()` opens the matrix with a single memory map and gives back an
+ordinary gensim KeyedVectors object, so `most_similar()`, `similarity()` and
+the other `wem_tools` helpers work with it as usual:
+
+    export_vectors(model.wv, './models/recipes-demo')
+    wv = load_exported('./models/recipes-demo')
+
+Anything else saved with the model, such as word counts, is left out. To
+keep the vectors in less memory as well as less disk space, use
+wem_tools.quantize instead.
+"""
+
+import numpy as np
+from gensim.models import KeyedVectors
+
+
+def _matrix_path(path):
+    return path + '.matrix.npy'
+
+
+def vocab_path(path):
+    return path + '.vocab.txt'
+
+
+def write_vocab(words, path):
+    # Saves a list of words to the vocabulary file for `path`, one per line.
+    for word in words:
+        if not isinstance(word, str) or '\n' in word or '\r' in word:
+            raise ValueError("can't export the key %r: keys must be words without line breaks" % (word,))
+    with open(vocab_path(path), 'w', encoding='utf-8', newline='\n') as vocab_file:
+        vocab_file.write(''.join(word + '\n' for word in words))
+
+
+def read_vocab(path):
+    # Reads the list of words saved by write_vocab().
+    with open(vocab_path(path), encoding='utf-8', newline='\n') as vocab_file:
+        return vocab_file.read().split('\n')[:-1]
+
+
+def export_vectors(language_model, path):
+    # Saves the vectors as a plain float32 .npy matrix and the words as a
+    # text file, both named after `path`.
+    write_vocab(language_model.index_to_key, path)
+    np.save(_matrix_path(path), np.asarray(language_model.vectors, dtype=np.float32))
+
+
+def load_exported(path, mmap='r'):
+    """
+    Opens vectors saved with `export_vectors()` as a KeyedVectors object.
+
+    With mmap='r' (the default) the matrix is read from disk as it is used,
+    so opening even a very large model takes only as long as reading its list
+    of words. Use mmap=None to read the whole matrix into memory instead.
+    """
+    vectors = np.load(_matrix_path(path), mmap_mode=mmap)
+    if vectors.dtype != np.float32:
+        raise ValueError("%s holds %s vectors, not float32" % (_matrix_path(path), vectors.dtype))
+    words = read_vocab(path)
+    if len(words) != len(vectors):
+        raise ValueError("%s has %d words but %s has %d vectors"
+                         % (vocab_path(path), len(words), _matrix_path(path), len(vectors)))
+
+    language_model = KeyedVectors(vectors.shape[1], count=0, dtype=vectors.dtype)
+    language_model.vectors = vectors
+    language_model.index_to_key = words
+    language_model.key_to_index = {word: row for row, word in enumerate(words)}
+    language_model.next_index = len(words)
+    return language_model
@@ -0,0 +1,190 @@
+"""
+Saving unit-length vectors alongside a model.
+
+Cosine similarity compares the directions of vectors, not their lengths, so
+before answering its first `most_similar()` or `similarity()` query a freshly
+loaded model works out the length of every one of its vectors. For a large
+model that first query can take many times longer than the ones after it.
+
+`save_normed()` does this work once and saves the results next to the vectors
+file: every vector scaled to unit length (`.normed.npy`) and the original
+lengths (`.norms.npy`). `load_normed()` opens them with mmap='r' and hands the
+lengths to the model, so the first query is as fast as the rest:
+
+    save_normed(wv, './models/recipes-demo.wordvectors')
+    load_normed(wv, './models/recipes-demo.wordvectors')
+
+A fingerprint of the model is saved with them (`.normed.json`), along with
+the size and modification time of the model's files. If the files have
+changed since, because the model was retrained and saved again,
+`load_normed()` checks the fingerprint, and if it no longer matches it saves
+the unit-length vectors again rather than using the old ones.
+
+The analogy evaluator, `similarities()`, `IVFIndex.build()` and the query
+server use the saved unit-length vectors automatically when they are present.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import warnings
+import weakref
+
+import numpy as np
+
+
+def _normed_path(path):
+    return path + '.normed.npy'
+
+
+def _norms_path(path):
+    return path + '.norms.npy'
+
+
+def _info_path(path):
+    return path + '.normed.json'
+
+
+def _file_signature(path):
+    # The size and modification time of the model saved at `path` and of the
+    # vectors gensim saves next to it, which change whenever it is saved.
+    paths = [path] + sorted(glob.glob(glob.escape(path) + '*vectors.npy'))
+    return [[os.path.basename(name), os.stat(name).st_size, os.stat(name).st_mtime_ns]
+            for name in paths if os.path.exists(name)]
+
+
+def _write_info(path, model_fingerprint):
+    # written to a temporary file and then swapped in, so that another
+    # process reading it never sees it half written
+    info_path = _info_path(path)
+    with open(info_path + '.tmp', 'w', encoding='utf-8') as info_file:
+        json.dump({'fingerprint': model_fingerprint, 'files': _file_signature(path)}, info_file, indent=2)
+    os.replace(info_path + '.tmp', info_path)
+
+
+def _read_info(path):
+    # An info file that can't be read is treated like a missing one, so the
+    # vectors are checked (and if need be saved) again.
+    try:
+        with open(_info_path(path), encoding='utf-8') as info_file:
+            return json.load(info_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+# the unit-length vectors attached to each model by load_normed(), along with
+# the norms array they were saved with
+_saved_normed = weakref.WeakKeyDictionary()
+
+
+def save_normed(language_model, path, block_size=65536):
+    # Saves the unit-length vectors and the norms of `language_model` next to
+    # `path`, the file the vectors were saved to. The vectors are scaled a
+    # block at a time so that the whole matrix is never copied in memory.
+    # Each file is written under a temporary name and then swapped in, so a
+    # process that has the old files open or memory-mapped keeps reading
+    # them unchanged.
+    language_model.fill_norms()
+    vectors, norms = language_model.vectors, language_model.norms
+    normed = np.lib.format.open_memmap(_normed_path(path) + '.tmp', mode='w+',
+                                       dtype=vectors.dtype, shape=vectors.shape)
+    for start in range(0, len(vectors), block_size):
+        end = start + block_size
+        normed[start:end] = vectors[start:end] / norms[start:end, np.newaxis]
+    normed.flush()
+    del normed
+    with open(_norms_path(path) + '.tmp', 'wb') as norms_file:
+        np.save(norms_file, norms)
+    os.replace(_normed_path(path) + '.tmp', _normed_path(path))
+    os.replace(_norms_path(path) + '.tmp', _norms_path(path))
+    _write_info(path, fingerprint(language_model, block_size))
+
+
+def has_normed(path):
+    # True if unit-length vectors have been saved next to `path`.
+    return os.path.exists(_normed_path(path)) and os.path.exists(_norms_path(path))
+
+
+def load_normed(language_model, path, mmap='r', rebuild=True):
+    """
+    Opens the unit-length vectors and norms saved next to `path` and attaches
+    them to `language_model`, which is returned.
+
+    The norms are used by gensim's own `most_similar()` and `similarity()`,
+    and the unit-length vectors by the `wem_tools` helpers. If the model is
+    trained again afterwards, gensim throws the norms away and the saved
+    vectors stop being used, since they no longer match.
+
+    If the saved vectors were made from a different version of the model
+    (their shape or fingerprint doesn't match, or they were saved without a
+    fingerprint), they are saved again from `language_model` with a warning,
+    or, with `rebuild=False`, a ValueError is raised.
+    """
+    normed = np.load(_normed_path(path), mmap_mode=mmap)
+    norms = np.load(_norms_path(path), mmap_mode=mmap)
+    expected = (len(language_model.index_to_key), language_model.vector_size)
+    info = _read_info(path)
+    problem = None
+    if normed.shape != expected or norms.shape != expected[:1]:
+        problem = "have shape %s, but the model has %s" % (normed.shape, expected)
+    elif not info.get('files') or info['files'] != _file_signature(path):
+        # the model's files have changed (or been copied), so only working
+        # out the fingerprint again tells whether the vectors have
+        model_fingerprint = fingerprint(language_model)
+        if info.get('fingerprint') != model_fingerprint:
+            problem = "were saved from a different version of the model"
+        else:
+            _write_info(path, model_fingerprint)
+    if problem is not None:
+        if not rebuild:
+            raise ValueError("the vectors saved next to %s %s; save them again with save_normed()"
+                             % (path, problem))
+        warnings.warn("the vectors saved next to %s %s; saving them again" % (path, problem))
+        del normed, norms
+        save_normed(language_model, path)
+        normed = np.load(_normed_path(path), mmap_mode=mmap)
+        norms = np.load(_norms_path(path), mmap_mode=mmap)
+    language_model.norms = norms
+    _saved_normed[language_model] = (normed, norms)
+    return language_model
+
+
+def saved_normed(language_model):
+    # The unit-length vectors attached by load_normed(), or None if there
+    # aren't any or the model has been trained since they were attached.
+    saved = _saved_normed.get(language_model)
+    if saved is None or saved[1] is not language_model.norms \
+            or len(saved[0]) != len(language_model.index_to_key):
+        return None
+    return saved[0]
+
+
+def normed_vectors(language_model):
+    # The unit-length vectors, from load_normed() if possible or else worked
+    # out now, the same as `language_model.get_normed_vectors()`.
+    normed = saved_normed(language_model)
+    return language_model.get_normed_vectors() if normed is None else normed
+
+
+def normed_rows(language_model, rows):
+    # The unit-length vectors of `rows` (a slice or a list of row numbers) as
+    # float32, from load_normed() if possible or else worked out for just
+    # those rows, without making a copy of the whole matrix.
+    normed = saved_normed(language_model)
+    if normed is not None:
+        return np.asarray(normed[rows], dtype=np.float32)
+    language_model.fill_norms()
+    vectors = language_model.vectors[rows] / language_model.norms[rows, np.newaxis]
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def fingerprint(language_model, block_size=65536):
+    # A short hash of the model's words and vectors, used to check that
+    # results saved for a model (such as clusters) still match it.
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update('\n'.join(language_model.index_to_key).encode('utf-8'))
+    vectors = language_model.vectors
+    for start in range(0, len(vectors), block_size):
+        digest.update(np.ascontiguousarray(vectors[start:start + block_size]).data)
+    return digest.hexdigest()
@@ -0,0 +1,152 @@
+"""
+Principal component analysis (PCA) of a model, worked out once and saved.
+
+Each of the PCA plotting functions in the visualization notebook copies every
+vector out of the model with `model.wv[model.wv.key_to_index]` and fits a new
+`PCA()` to them, so drawing the 2D plot and then the 3D plot of the same model
+does the same work twice. `pca_projection()` fits PCA to a model once, saves
+the results in the "output" folder under a fingerprint of the model, and gives
+back the same coordinates straight away the next time it is asked, whether for
+two dimensions or three:
+
+    result = pca_projection(model.wv, 2)    # fits PCA and saves the results
+    result = pca_projection(model.wv, 3)    # loaded, not fitted again
+
+The principal components are found from the covariance of the vectors, which
+is added up a block of vectors at a time, so memory use doesn't grow with the
+size of the vocabulary and the vectors never have to be copied out of the
+model. The coordinates are the same as those from scikit-learn's `PCA()`.
+"""
+
+import os
+import weakref
+
+import numpy as np
+
+from wem_tools.normed import fingerprint
+
+
+DEFAULT_CACHE = './output/projections'
+PROJECTION_PARTS = ('components', 'mean', 'explained_variance', 'total_variance', 'coordinates')
+
+# the projection last used for each model, along with the vectors and norms
+# arrays it was made from
+_projections = weakref.WeakKeyDictionary()
+
+
+def _projection_path(path, part):
+    return '%s.pca_%s.npy' % (path, part)
+
+
+class Projection:
+    """
+    The result of fitting PCA to a set of vectors.
+
+    `components` holds the principal components, one per row, `mean` the
+    average vector that is taken away before projecting, and
+    `explained_variance` the variance along each component, out of the
+    `total_variance` of the vectors. `coordinates` holds the position of
+    every word along each component, so `coordinates[:, :2]` are the points
+    of a 2D plot. Use `fit()` to make a projection and `load()` to open a
+    saved one.
+    """
+
+    def __init__(self, components, mean, explained_variance, total_variance, coordinates):
+        self.components = components
+        self.mean = mean
+        self.explained_variance = explained_variance
+        self.total_variance = total_variance
+        self.coordinates = coordinates
+
+    @property
+    def explained_variance_ratio(self):
+        # The share of the total variance along each component.
+        return self.explained_variance / self.total_variance
+
+    @classmethod
+    def fit(cls, vectors, components=3, block_size=65536):
+        # Fits PCA with `components` components to `vectors`, reading them a
+        # block at a time, and projects every vector onto the components.
+        count, size = vectors.shape
+        total = np.zeros(size)
+        products = np.zeros((size, size))
+        for start in range(0, count, block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float64)
+            total += block.sum(axis=0)
+            products += block.T @ block
+        mean = total / count
+        covariance = (products - count * np.outer(mean, mean)) / (count - 1)
+
+        variance, axes = np.linalg.eigh(covariance)
+        order = np.argsort(variance)[::-1][:components]
+        found = axes[:, order].T
+        # flip each component so that its largest entry is positive, as
+        # scikit-learn does, so the plots point the same way as PCA()'s
+        largest = np.argmax(np.abs(found), axis=1)
+        found *= np.sign(found[np.arange(len(found)), largest])[:, np.newaxis]
+
+        coordinates = np.empty((count, len(found)), dtype=np.float32)
+        for start in range(0, count, block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float64)
+            coordinates[start:start + block_size] = (block - mean) @ found.T
+        return cls(found, mean, variance[order], variance.sum(), coordinates)
+
+    def transform(self, vectors):
+        # Projects new `vectors` onto the components.
+        return (np.asarray(vectors, dtype=np.float64) - self.mean) @ self.components.T
+
+    def save(self, path):
+        # Saves the projection as a few .npy files beginning with `path`.
+        for part in PROJECTION_PARTS:
+            np.save(_projection_path(path, part), getattr(self, part))
+
+    @classmethod
+    def load(cls, path, mmap=None):
+        # Opens a projection saved at `path`. With mmap='r' the coordinates
+        # are read from disk as they are needed.
+        return cls(*[np.load(_projection_path(path, part), mmap_mode=mmap) for part in PROJECTION_PARTS])
+
+
+def _saved_path(cache_dir, model_fingerprint, components):
+    return os.path.join(cache_dir, '%s-%d' % (model_fingerprint, components))
+
+
+def fit_projection(language_model, components=3, cache_dir=DEFAULT_CACHE):
+    """
+    Returns a `Projection` of `language_model`'s vectors with at least
+    `components` components.
+
+    The projection is saved in `cache_dir` under a fingerprint of the model's
+    words and vectors, and loaded from there if the same model has been
+    projected before, even in an earlier session. Within a session it is also
+    kept in memory until the model is trained again, so later calls return
+    immediately. Pass `cache_dir=None` to keep it in memory only.
+    """
+    # gensim throws the norms away whenever a model is trained, which shows
+    # that the vectors have changed
+    language_model.fill_norms()
+    kept = _projections.get(language_model)
+    if kept is not None and kept[0] is language_model.vectors and kept[1] is language_model.norms \
+            and len(kept[2].components) >= components:
+        return kept[2]
+
+    components = max(components, 3)
+    projection = None
+    if cache_dir:
+        path = _saved_path(cache_dir, fingerprint(language_model), components)
+        if os.path.exists(_projection_path(path, 'coordinates')):
+            projection = Projection.load(path, mmap='r')
+    if projection is None:
+        projection = Projection.fit(language_model.vectors, components)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            projection.save(path)
+    _projections[language_model] = (language_model.vectors, language_model.norms, projection)
+    return projection
+
+
+def pca_projection(language_model, dimensions=2, cache_dir=DEFAULT_CACHE):
+    # The coordinates of every word in the model along its first
+    # `dimensions` principal components, in the same form as
+    # `PCA(n_components=dimensions).fit_transform(vectors)`.
+    return fit_projection(language_model, dimensions, cache_dir).coordinates[:, :dimensions]
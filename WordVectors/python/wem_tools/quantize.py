@@ -0,0 +1,328 @@
+"""
+Storing word vectors in less memory.
+
+Each number in a gensim model takes four bytes, so a model like the
+`word2vec-google-news-300` download uses several gigabytes. For answering
+similarity queries the numbers rarely need that much precision. This module
+stores the unit-length vectors in one of three smaller forms:
+
+    'float16'   each number in two bytes (half the memory)
+    'int8'      each number rounded to one of 255 steps, one byte each, with one
+                scale for each dimension (a quarter of the memory)
+    'pq'        product quantization: each vector is split into short pieces and
+                each piece is replaced by the number of the closest of 256
+                typical pieces, so every 2 numbers take one byte (about an
+                eighth of the memory for a large vocabulary)
+
+Queries are compared with the stored vectors without turning them back into
+full vectors. For 'pq', the query is compared with the 256 typical pieces once
+and each word's score is added up from those results ("asymmetric distance").
+
+    quantized = quantize(wv, 'int8')
+    quantized.most_similar('milk', topn=10)
+    quantized.save('./models/recipes-demo')
+    quantized = load_quantized('./models/recipes-demo', 'int8')
+
+`accuracy_report()` shows how much each form changes a model's scores on the
+analogy and word pair tests, and how much memory it saves.
+"""
+
+import numpy as np
+
+from wem_tools.clustering import closest_centroids, kmeans
+from wem_tools.evaluation import DEFAULT_WORD_PAIRS, read_analogies, read_word_pairs, \
+    score_analogies, score_word_pairs
+from wem_tools.export import read_vocab, write_vocab
+from wem_tools.normed import normed_rows
+
+
+METHODS = ('float16', 'int8', 'pq')
+
+# the arrays that make up each kind of quantized vectors
+PARTS = {
+    'float16': ('codes',),
+    'int8': ('codes', 'scales'),
+    'pq': ('codes', 'codebooks', 'norms'),
+}
+
+
+def _part_path(path, method, part):
+    return '%s.%s_%s.npy' % (path, method, part)
+
+
+class QuantizedVectors:
+    """
+    Unit-length word vectors stored in a compressed form.
+
+    Use `quantize()` to make one from a model and `load_quantized()` to open a
+    saved one. `most_similar()` and `similarity()` work like their
+    KeyedVectors versions, and the analogy and word pair tests in
+    wem_tools.evaluation accept quantized vectors in place of a model.
+    """
+
+    def __init__(self, index_to_key, method, parts):
+        if method not in PARTS:
+            raise ValueError("unknown method %r; use one of %s" % (method, ', '.join(METHODS)))
+        self.index_to_key = index_to_key
+        self.key_to_index = {word: row for row, word in enumerate(index_to_key)}
+        self.method = method
+        self.parts = parts
+        self.codes = parts['codes']
+        if len(self.codes) != len(index_to_key):
+            raise ValueError("%d words but %d stored vectors" % (len(index_to_key), len(self.codes)))
+        if method == 'pq':
+            self.vector_size = parts['codebooks'].shape[0] * parts['codebooks'].shape[2]
+        else:
+            self.vector_size = self.codes.shape[1]
+
+    def __len__(self):
+        return len(self.index_to_key)
+
+    def __contains__(self, word):
+        return word in self.key_to_index
+
+    @property
+    def nbytes(self):
+        # The memory taken up by the stored vectors, not counting the words.
+        return sum(part.nbytes for part in self.parts.values())
+
+    def save(self, path):
+        # Saves the stored vectors as .npy files named after `path`, along with
+        # the list of words (in the same file as wem_tools.export uses).
+        write_vocab(self.index_to_key, path)
+        for part, array in self.parts.items():
+            np.save(_part_path(path, self.method, part), array)
+
+    def vectors_for_rows(self, rows):
+        # Turns the stored vectors for `rows` back into (approximate) float32 vectors.
+        rows = np.asarray(rows, dtype=np.int64)
+        codes = self.codes[rows]
+        if self.method == 'float16':
+            return codes.astype(np.float32)
+        if self.method == 'int8':
+            return codes.astype(np.float32) * self.parts['scales']
+        codebooks = self.parts['codebooks']
+        pieces = codebooks[np.arange(codebooks.shape[0]), codes]
+        return pieces.reshape(len(rows), -1)[:, :self.vector_size]
+
+    def get_vector(self, word):
+        return self.vectors_for_rows([self.key_to_index[word]])[0]
+
+    def scores(self, queries, start=0, end=None):
+        # The cosine similarity between each row of `queries` (unit-length
+        # float32 vectors) and the stored vectors of rows start to end.
+        codes = self.codes[start:end]
+        if self.method == 'float16':
+            return queries @ codes.astype(np.float32).T
+        if self.method == 'int8':
+            # scaling the query rather than the stored vectors gives the same scores
+            return (queries * self.parts['scales']) @ codes.astype(np.float32).T
+        # compare each query with every typical piece once, then add up
+        # each word's score from the pieces it is made of
+        codebooks = self.parts['codebooks']
+        subspaces, _, width = codebooks.shape
+        padded = np.zeros((len(queries), subspaces * width), dtype=np.float32)
+        padded[:, :queries.shape[1]] = queries
+        tables = np.einsum('qsw,skw->sqk', padded.reshape(len(queries), subspaces, width), codebooks)
+        totals = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for subspace in range(subspaces):
+            totals += tables[subspace][:, codes[:, subspace]]
+        return totals / self.parts['norms'][start:end]
+
+    def _search(self, queries, exclude, topn, block_size=65536):
+        # Returns the rows and scores of the `topn` best matches for each
+        # query, best first, leaving out the rows in exclude[i] for query i.
+        queries = np.asarray(queries, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        # look through the vocabulary a block at a time, keeping the best so far
+        for start in range(0, len(self), block_size):
+            scores = self.scores(queries, start, start + block_size)
+            for i, rows_to_skip in enumerate(exclude):
+                skip = [row - start for row in rows_to_skip if start <= row < start + len(scores[i])]
+                scores[i, skip] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+            best_rows = np.concatenate((best_rows, rows), axis=1)
+            best_scores = np.concatenate((best_scores, scores), axis=1)
+            if best_scores.shape[1] > topn:
+                keep = np.argpartition(-best_scores, topn - 1, axis=1)[:, :topn]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def _unit(self, vectors):
+        return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    def nearest_rows(self, rows, topn=15, batch_size=256, threads=1):
+        # The rows of the `topn` nearest neighbours of each row in `rows`,
+        # leaving out the row itself; used by wem_tools.evaluation.
+        rows = np.asarray(rows, dtype=np.int64)
+        topn = min(topn, len(self) - 1)
+        neighbours = np.empty((len(rows), topn), dtype=np.int64)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            queries = self._unit(self.vectors_for_rows(batch))
+            neighbours[start:start + len(batch)] = self._search(queries, [[row] for row in batch], topn)[0]
+        return neighbours
+
+    def row_similarities(self, first, second):
+        # The cosine similarity between rows first[i] and second[i], or NaN
+        # where either is -1; used by wem_tools.evaluation.
+        first = np.asarray(first, dtype=np.int64)
+        second = np.asarray(second, dtype=np.int64)
+        scores = np.full(len(first), np.nan, dtype=np.float32)
+        found = np.flatnonzero((first >= 0) & (second >= 0))
+        if len(found):
+            vectors1 = self._unit(self.vectors_for_rows(first[found]))
+            vectors2 = self._unit(self.vectors_for_rows(second[found]))
+            scores[found] = np.einsum('ij,ij->i', vectors1, vectors2)
+        return scores
+
+    def similarity(self, w1, w2):
+        return float(self.row_similarities([self.key_to_index[w1]], [self.key_to_index[w2]])[0])
+
+    def most_similar(self, positive=None, negative=None, topn=10):
+        # Works like KeyedVectors.most_similar() for lists of words.
+        if isinstance(positive, str):
+            positive = [positive]
+        if isinstance(negative, str):
+            negative = [negative]
+        positive = list(positive or [])
+        negative = list(negative or [])
+        rows = [self.key_to_index[word] for word in positive + negative]
+        weights = np.concatenate((np.ones(len(positive)), -np.ones(len(negative))))
+        query = self._unit(weights @ self._unit(self.vectors_for_rows(rows)))
+        best_rows, best_scores = self._search(query[np.newaxis], [rows], topn)
+        return [(self.index_to_key[row], float(score)) for row, score in zip(best_rows[0], best_scores[0])]
+
+
+def quantize(language_model, method='int8', subspaces=None, sample_size=16384, iterations=15, seed=0,
+             block_size=65536):
+    """
+    Returns the unit-length vectors of `language_model` stored with `method`
+    ('float16', 'int8' or 'pq').
+
+    For 'pq', each vector is split into `subspaces` pieces (by default one for
+    every two numbers), and the 256 typical pieces for each position are
+    found with k-means on a random sample of at most `sample_size` words.
+
+    The vectors are read and stored `block_size` rows at a time, so apart from
+    the result only one block of full-size vectors is held in memory.
+    """
+    words = list(language_model.index_to_key)
+    count, size = len(words), language_model.vector_size
+    blocks = [slice(start, start + block_size) for start in range(0, count, block_size)]
+
+    if method == 'float16':
+        codes = np.empty((count, size), dtype=np.float16)
+        for block in blocks:
+            codes[block] = normed_rows(language_model, block)
+        return QuantizedVectors(words, method, {'codes': codes})
+
+    if method == 'int8':
+        # each dimension gets its own scale, so its largest number becomes +/-127
+        scales = np.zeros(size, dtype=np.float32)
+        for block in blocks:
+            scales = np.maximum(scales, np.abs(normed_rows(language_model, block)).max(axis=0))
+        scales /= 127
+        scales[scales == 0] = 1
+        codes = np.empty((count, size), dtype=np.int8)
+        for block in blocks:
+            codes[block] = np.rint(normed_rows(language_model, block) / scales)
+        return QuantizedVectors(words, method, {'codes': codes, 'scales': scales})
+
+    if method != 'pq':
+        raise ValueError("unknown method %r; use one of %s" % (method, ', '.join(METHODS)))
+    subspaces = subspaces or max(1, size // 2)
+    width = -(-size // subspaces)
+
+    def pieces(vectors):
+        # splits each vector into `subspaces` pieces of `width`, padding the
+        # last piece with zeros
+        padded = np.zeros((len(vectors), subspaces * width), dtype=np.float32)
+        padded[:, :size] = vectors
+        return padded.reshape(len(vectors), subspaces, width)
+
+    rng = np.random.default_rng(seed)
+    sample = pieces(normed_rows(language_model, np.sort(rng.choice(count, min(count, sample_size), replace=False))))
+    centres = min(256, len(sample))
+    codebooks = np.zeros((subspaces, 256, width), dtype=np.float32)
+    for subspace in range(subspaces):
+        codebooks[subspace, :centres] = kmeans(sample[:, subspace], centres, iterations, seed + subspace,
+                                               spherical=False)
+
+    codes = np.empty((count, subspaces), dtype=np.uint8)
+    norms = np.empty(count, dtype=np.float32)
+    for block in blocks:
+        block_pieces = pieces(normed_rows(language_model, block))
+        for subspace in range(subspaces):
+            codes[block, subspace] = closest_centroids(block_pieces[:, subspace], codebooks[subspace, :centres],
+                                                       spherical=False)[0]
+        # keep the length of each rebuilt vector so that scores stay cosines
+        rebuilt = codebooks[np.arange(subspaces), codes[block]]
+        norms[block] = np.sqrt((rebuilt ** 2).sum(axis=(1, 2)))
+    norms[norms == 0] = 1
+    return QuantizedVectors(words, method, {'codes': codes, 'codebooks': codebooks, 'norms': norms})
+
+
+def load_quantized(path, method, mmap='r'):
+    # Opens quantized vectors saved with QuantizedVectors.save(). With
+    # mmap='r', the stored vectors are read from disk as they are needed.
+    parts = {part: np.load(_part_path(path, method, part), mmap_mode=mmap) for part in PARTS[method]}
+    return QuantizedVectors(read_vocab(path), method, parts)
+
+
+def accuracy_report(language_model, analogies=None, word_pairs=None, methods=METHODS, **options):
+    """
+    Quantizes `language_model` with each of `methods` and prints, for each,
+    how much memory the vectors take compared with float32, the total score on
+    the `analogies` file (if given) and the change from the full model in
+    percentage points, and the average and largest change in the cosine
+    similarity of the `word_pairs` (by default the pairs used by
+    wem_tools.evaluation.evaluate_models()).
+
+    Returns the figures as a dictionary of {method: {...}}.
+    """
+    if word_pairs is None:
+        word_pairs = DEFAULT_WORD_PAIRS
+    elif isinstance(word_pairs, str):
+        word_pairs = read_word_pairs(word_pairs)
+    sections = read_analogies(analogies) if analogies else []
+
+    def analogy_score(model):
+        if not sections:
+            return None
+        counts = score_analogies(sections, model)['sections']
+        total = sum(questions for _, _, questions in counts)
+        return sum(correct for _, correct, _ in counts) / total if total else 0
+
+    full_bytes = len(language_model.index_to_key) * language_model.vector_size * 4
+    full_score = analogy_score(language_model)
+    full_pairs = score_word_pairs(word_pairs, language_model)
+    print("%-8s %10s %8s %9s %8s %14s" % ('method', 'MB', 'smaller', 'analogies', 'change', 'pairs change'))
+    print("%-8s %10.2f %7.1fx %9s %8s %14s" % ('float32', full_bytes / 1e6, 1,
+          '-' if full_score is None else '%.4f' % full_score, '', ''))
+
+    report = {}
+    for method in methods:
+        quantized = quantize(language_model, method, **options)
+        score = analogy_score(quantized)
+        change = np.abs(score_word_pairs(word_pairs, quantized) - full_pairs)
+        change = change[~np.isnan(change)]
+        report[method] = {
+            'bytes': quantized.nbytes,
+            'ratio': full_bytes / quantized.nbytes,
+            'analogy_score': score,
+            'analogy_change_points': None if score is None else (score - full_score) * 100,
+            'pairs_mean_change': float(change.mean()) if len(change) else None,
+            'pairs_max_change': float(change.max()) if len(change) else None,
+        }
+        figures = report[method]
+        print("%-8s %10.2f %7.1fx %9s %8s %14s" % (
+            method, figures['bytes'] / 1e6, figures['ratio'],
+            '-' if score is None else '%.4f' % score,
+            '-' if score is None else '%+.2f pt' % figures['analogy_change_points'],
+            '-' if not len(change) else '%.4f / %.4f' % (change.mean(), change.max())))
+    print("(pairs change: average / largest change in cosine similarity)")
+    return report
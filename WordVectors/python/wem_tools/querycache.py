@@ -0,0 +1,166 @@
+"""
+Remembering the answers to repeated queries.
+
+Notebooks and dashboards often ask a model the same questions over and over,
+such as `most_similar('milk', topn=10)` every time a cell is re-run, and each
+time the model compares the query with the whole vocabulary again.
+`CachedVectors` wraps a set of KeyedVectors and keeps the answers to recent
+`most_similar()` and `similarity()` queries, so a repeated query is answered
+immediately. When the cache reaches its memory limit, the answers that were
+used least recently are dropped.
+
+If the model is trained further in place (with `build_vocab(update=True)` and
+`train()`, as in the Further Explorations notebook), the cache notices and
+starts again from empty, so it never hands back answers from the old model.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+
+def _size_of(value):
+    # A rough count of the bytes used by a cache key or answer: a float, a
+    # (possibly nested) tuple or list of words and scores, or a NumPy array.
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_size_of(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _as_key(words):
+    # most_similar() accepts a single word or a list of words (or of
+    # (word, weight) pairs); this turns either into a tuple so it can be
+    # used as part of a dictionary key.
+    if words is None:
+        return ()
+    if isinstance(words, (str, int)):
+        return (words,)
+    if isinstance(words, (list, tuple)):
+        return tuple(tuple(word) if isinstance(word, list) else word for word in words)
+    # anything else, such as a NumPy vector, is left as it is and isn't cached
+    return words
+
+
+class CachedVectors:
+    """
+    KeyedVectors with a least-recently-used cache of query results.
+
+    `most_similar()` answers are stored under (positive, negative, topn,
+    restrict_vocab) and `similarity()` answers under the pair of words. The
+    cache holds at most about `max_bytes` of answers. `hits` and `misses`
+    count how many queries were answered from the cache and how many had to be
+    worked out, `invalidations` how many times the cache was emptied because
+    the model changed, and `cached` how many answers it holds.
+
+    Anything else, such as `wv.index_to_key`, `wv.doesnt_match()`, `len(wv)`,
+    `'milk' in wv` or `wv['milk']`, is passed straight through to the wrapped
+    vectors. Looping over `wv` gives the words in the vocabulary.
+
+        wv = CachedVectors(model.wv)
+        wv.most_similar('milk', topn=10)
+        wv.most_similar('milk', topn=10)   # answered from the cache
+        print(wv.hits, wv.misses)
+    """
+
+    def __init__(self, language_model, max_bytes=64 * 1024 ** 2):
+        self.language_model = language_model
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.size = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._state = None
+
+    def __getattr__(self, name):
+        return getattr(self.language_model, name)
+
+    # Python looks special methods up on the class rather than through
+    # __getattr__, so they have to be passed on one by one
+    def __contains__(self, key):
+        return key in self.language_model
+
+    def __getitem__(self, key):
+        return self.language_model[key]
+
+    def __len__(self):
+        return len(self.language_model)
+
+    def __iter__(self):
+        # KeyedVectors has no __iter__ of its own, and looping over it falls
+        # back on wv[0], wv[1], ... until it fails, so loop over the words
+        return iter(self.language_model.index_to_key)
+
+    @property
+    def cached(self):
+        # The number of answers held in the cache.
+        return len(self._results)
+
+    def _check_model(self):
+        # Training clears the vectors' norms and adding words replaces the
+        # vectors array, so if either array is not the one seen last time
+        # (or the vocabulary has changed size) the cached answers are stale.
+        # Holding on to the arrays themselves means they can't be freed and
+        # replaced by new arrays at the same address.
+        language_model = self.language_model
+        language_model.fill_norms()
+        state = (language_model.vectors, language_model.norms, len(language_model.index_to_key))
+        old = self._state
+        if old is None or old[0] is not state[0] or old[1] is not state[1] or old[2] != state[2]:
+            if self._results:
+                self.invalidations += 1
+            self._results.clear()
+            self.size = 0
+            self._state = state
+
+    def _lookup(self, key, compute):
+        # Returns the cached answer for `key`, or works it out with `compute()`
+        # and caches it, evicting the least recently used answers if needed.
+        with self._lock:
+            self._check_model()
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                result, _ = self._results[key]
+                return list(result) if isinstance(result, list) else result
+            self.misses += 1
+            state = self._state
+
+        result = compute()
+
+        with self._lock:
+            size = _size_of(key) + _size_of(result)
+            # don't keep the answer if the model changed while it was worked out
+            if self._state is state and size <= self.max_bytes and key not in self._results:
+                self._results[key] = (result, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, old_size) = self._results.popitem(last=False)
+                    self.size -= old_size
+        return list(result) if isinstance(result, list) else result
+
+    def most_similar(self, positive=None, negative=None, topn=10, restrict_vocab=None, **kwargs):
+        # The same as KeyedVectors.most_similar(). Queries given as vectors
+        # rather than words, or with extra settings, aren't cached.
+        compute = lambda: self.language_model.most_similar(
+            positive=positive, negative=negative, topn=topn, restrict_vocab=restrict_vocab, **kwargs)
+        if kwargs:
+            return compute()
+        key = ('most_similar', _as_key(positive), _as_key(negative), topn, restrict_vocab)
+        try:
+            hash(key)
+        except TypeError:
+            return compute()
+        return self._lookup(key, compute)
+
+    def similarity(self, w1, w2):
+        # The same as KeyedVectors.similarity().
+        return self._lookup(('similarity', w1, w2), lambda: self.language_model.similarity(w1, w2))
+
+    def clear(self):
+        # Empties the cache and resets the counters.
+        with self._lock:
+            self._results.clear()
+            self.size = 0
+            self.hits = self.misses = self.invalidations = 0
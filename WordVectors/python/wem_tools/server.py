@@ -0,0 +1,255 @@
+"""
+A small web server for querying a model from other programs.
+
+Loading a large model can take longer than the queries themselves, so a
+dashboard or script that loads the model every time it runs spends most of
+its time waiting. This server loads a saved `.wordvectors` file once, with
+mmap='r', and answers queries sent to it over HTTP on your own computer.
+Start it from the `WordVectors/python` directory with:
+
+    python -m wem_tools.server ./models/recipes-demo.wordvectors --port 8000
+
+and then visit, for example, http://localhost:8000/most_similar?positive=milk&topn=5
+
+Every endpoint takes either URL parameters (as above) or a JSON object sent with
+POST, and answers in JSON:
+
+    /most_similar   {"positive": ["milk"], "negative": [], "topn": 10}
+    /analogy        {"a": "man", "b": "king", "c": "woman", "topn": 10}
+                    (a is to b as c is to ...?)
+    /similarity     {"w1": "milk", "w2": "cream"}
+    /vocab          {"word": "milk"}
+
+To send many queries in one request, POST {"queries": [...]} with a list of
+query objects; the answers come back as {"results": [...]} in the same order,
+and are worked out together, which is much faster than one request each.
+This batching only happens within a request: the server does not combine
+separate requests that arrive at the same time, so a program with many
+queries to ask should send them together itself.
+
+Each copy of the server answers one request at a time. With `--workers`,
+several copies are started (on systems that support `os.fork()`, such as
+Linux and macOS) that share the memory-mapped vectors, so they can answer
+that many requests at the same time.
+"""
+
+import argparse
+import json
+import os
+import signal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from gensim.models import KeyedVectors
+
+from wem_tools.normed import has_normed, load_normed, saved_normed
+from wem_tools.similarity import similarities
+
+
+def _as_list(words):
+    if words is None:
+        return []
+    if isinstance(words, str):
+        return [words]
+    return list(words)
+
+
+def _field(query, name):
+    # Returns query[name], raising ValueError (a bad request) if it's missing.
+    if name not in query:
+        raise ValueError("missing %r" % name)
+    return query[name]
+
+
+def most_similar(language_model, queries, batch_size=256):
+    # Answers a list of {"positive", "negative", "topn"} queries like
+    # KeyedVectors.most_similar(), comparing a whole batch of queries with
+    # the vocabulary in one matrix multiplication. Raises KeyError if a query
+    # word isn't in the model.
+    language_model.fill_norms()
+    vectors, norms = language_model.vectors, language_model.norms
+    normed = saved_normed(language_model)
+    index_to_key = language_model.index_to_key
+
+    means, exclude, topns = [], [], []
+    for query in queries:
+        positive = _as_list(query.get('positive'))
+        negative = _as_list(query.get('negative'))
+        keys = positive + negative
+        if not keys:
+            raise ValueError("a query needs at least one positive or negative word")
+        weights = np.concatenate((np.ones(len(positive)), -np.ones(len(negative))))
+        means.append(language_model.get_mean_vector(keys, weights, pre_normalize=True,
+                                                    post_normalize=True, ignore_missing=False))
+        exclude.append([language_model.get_index(key) for key in keys])
+        topns.append(int(query.get('topn', 10)))
+
+    results = []
+    for start in range(0, len(means), batch_size):
+        if normed is not None:
+            dists = np.stack(means[start:start + batch_size]) @ normed.T
+        else:
+            dists = np.stack(means[start:start + batch_size]) @ vectors.T
+            dists /= norms
+        for row, rows_to_skip, topn in zip(dists, exclude[start:start + batch_size],
+                                           topns[start:start + batch_size]):
+            row[rows_to_skip] = -np.inf
+            topn = max(0, min(topn, len(row) - len(rows_to_skip)))
+            best = np.argpartition(-row, topn - 1)[:topn] if topn else np.arange(0)
+            best = best[np.argsort(-row[best], kind='stable')]
+            results.append([[index_to_key[i], float(row[i])] for i in best.tolist()])
+    return results
+
+
+def analogy(language_model, queries):
+    # "a is to b as c is to ...?" is most_similar(positive=[b, c], negative=[a])
+    return most_similar(language_model, [
+        {'positive': [_field(query, 'b'), _field(query, 'c')], 'negative': [_field(query, 'a')],
+         'topn': query.get('topn', 10)}
+        for query in queries])
+
+
+def similarity(language_model, queries):
+    # Cosine similarities of (w1, w2) pairs, with None if a word is missing.
+    scores = similarities(language_model, [(_field(query, 'w1'), _field(query, 'w2')) for query in queries])
+    return [None if np.isnan(score) else float(score) for score in scores.tolist()]
+
+
+def vocab(language_model, queries):
+    # Whether each word is in the model, and its row and count if it is.
+    results = []
+    for query in queries:
+        word = _field(query, 'word')
+        row = language_model.key_to_index.get(word)
+        result = {'word': word, 'in_vocab': row is not None, 'index': row, 'count': None}
+        if row is not None and 'count' in language_model.expandos:
+            result['count'] = int(language_model.get_vecattr(word, 'count'))
+        results.append(result)
+    return results
+
+
+ENDPOINTS = {
+    'most_similar': most_similar,
+    'analogy': analogy,
+    'similarity': similarity,
+    'vocab': vocab,
+}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers one HTTP request with the model held by the server."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {}
+        for name, values in parse_qs(url.query).items():
+            # words such as `positive` can be given more than once
+            params[name] = values if name in ('positive', 'negative') else values[-1]
+        self._answer(url.path, params)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send(400, {'error': 'the request body is not valid JSON'})
+        self._answer(urlparse(self.path).path, params)
+
+    def _answer(self, path, params):
+        endpoint = ENDPOINTS.get(path.strip('/'))
+        if endpoint is None:
+            return self._send(404, {'error': 'unknown endpoint %s; try one of %s'
+                                    % (path, ', '.join('/' + name for name in ENDPOINTS))})
+        batched = isinstance(params, dict) and 'queries' in params
+        queries = params['queries'] if batched else [params]
+        try:
+            results = endpoint(self.server.language_model, queries)
+        except KeyError as error:
+            return self._send(404, {'error': str(error.args[0])})
+        except (TypeError, ValueError, AttributeError) as error:
+            return self._send(400, {'error': 'bad query: %s' % error})
+        self._send(200, {'results': results} if batched else results[0])
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(vectors, host='127.0.0.1', port=8000, verbose=False):
+    # Loads the vectors with mmap='r' and returns a server ready to answer
+    # queries about them, without starting it.
+    language_model = KeyedVectors.load(vectors, mmap='r')
+    if has_normed(vectors):
+        load_normed(language_model, vectors)
+    else:
+        # work out the norms now so that every worker shares one copy of them
+        language_model.fill_norms()
+    server = HTTPServer((host, port), QueryHandler)
+    server.language_model = language_model
+    server.verbose = verbose
+    return server
+
+
+def serve(vectors, host='127.0.0.1', port=8000, workers=1, verbose=False):
+    """
+    Answers queries about the vectors saved at `vectors` until stopped with
+    Ctrl-C. With more than one worker, the server is copied into `workers`
+    processes that all answer requests arriving on the same port.
+    """
+    server = make_server(vectors, host, port, verbose)
+    print("Serving %s on http://%s:%d/ with %d worker(s)" % (vectors, host, port, workers))
+    if workers <= 1 or not hasattr(os, 'fork'):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    # stopping the main process, with Ctrl-C or by the system, stops the workers too
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('vectors', help='path to a saved .wordvectors file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help='print a line for every request')
+    args = parser.parse_args()
+    serve(args.vectors, args.host, args.port, args.workers, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Cosine similarities for many pairs of words at once.
+
+`wv.similarity("milk", "cream")` compares one pair of words per call, which is
+slow when a test has hundreds or thousands of pairs per model. `similarities()`
+looks up every word once and then works out the similarity of all of the pairs
+together with NumPy:
+
+    similarities(wv, [("milk", "cream"), ("stir", "whisk")])
+
+Pairs where either word isn't in the model get NaN ("not a number") instead of
+raising a KeyError.
+"""
+
+import numpy as np
+
+from wem_tools.normed import saved_normed
+
+
+def word_rows(language_model, words):
+    # Returns the row of each word in the model's vectors as a NumPy array,
+    # with -1 for words that aren't in the vocabulary.
+    get_row = language_model.key_to_index.get
+    return np.fromiter((get_row(word, -1) for word in words), dtype=np.int64, count=len(words))
+
+
+def row_similarities(language_model, first, second, batch_size=16384):
+    # Returns the cosine similarity between the vectors in rows `first[i]` and
+    # `second[i]` for every i, or NaN where either row is -1. Vectors with
+    # their own `row_similarities()`, such as QuantizedVectors, use that.
+    if hasattr(language_model, 'row_similarities'):
+        return language_model.row_similarities(first, second)
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    scores = np.full(len(first), np.nan, dtype=np.float32)
+    found = np.flatnonzero((first >= 0) & (second >= 0))
+
+    language_model.fill_norms()
+    vectors, norms = language_model.vectors, language_model.norms
+    normed = saved_normed(language_model)
+    # work through the pairs in batches so that only a few thousand vectors
+    # are copied out of the model at a time
+    for start in range(0, len(found), batch_size):
+        batch = found[start:start + batch_size]
+        rows1, rows2 = first[batch], second[batch]
+        if normed is not None:
+            unit1, unit2 = normed[rows1], normed[rows2]
+        else:
+            unit1 = vectors[rows1] / norms[rows1, np.newaxis]
+            unit2 = vectors[rows2] / norms[rows2, np.newaxis]
+        scores[batch] = np.einsum('ij,ij->i', unit1, unit2)
+    return scores
+
+
+def similarities(language_model, pairs, batch_size=16384):
+    """
+    Returns the cosine similarity of each (word1, word2) pair in `pairs` as a
+    NumPy array, in the same order, with NaN for any pair where a word isn't
+    in the model. `pairs` can be a list of tuples or an array with two
+    columns. The results are the same as calling `wv.similarity()` for each
+    pair.
+    """
+    pairs = list(pairs)
+    words = [word for pair in pairs for word in pair]
+    if len(words) != 2 * len(pairs):
+        raise ValueError("every pair must hold exactly two words")
+    rows = word_rows(language_model, words)
+    return row_similarities(language_model, rows[0::2], rows[1::2], batch_size)
@@ -0,0 +1,152 @@
+"""
+Map-style tiles for exploring a plot of a whole vocabulary in a web browser.
+
+A scatter plot with a label on every word is unreadable beyond a few thousand
+words, and drawing hundreds of thousands of points in a notebook is slow.
+`export_tiles()` instead cuts a 2D plot of the model (by default the saved PCA
+from wem_tools.projection) into square tiles at several zoom levels, the way
+online maps are. At the outermost zoom level a single tile shows the most
+common words; each level below splits every tile into four, so zooming in
+shows more and more of the vocabulary, but no tile ever holds more than a few
+thousand points. Each tile also lists the most common words in it to use as
+labels.
+
+The tiles are written as JSON files along with a small web page that loads
+only the tiles in view:
+
+    python -m wem_tools.tiles ./models/recipes-demo.wordvectors ./output/tiles --serve
+
+and then open http://127.0.0.1:8001/ in a browser. Drag to move around and
+scroll to zoom in and out. The same can be done from Python:
+
+    export_tiles(model.wv, './output/tiles')
+
+Browsers won't load the tiles from a page opened directly from disk, which is
+why the page has to be served; `--serve` (or `python -m http.server` run in
+the tiles folder) does this.
+"""
+
+import argparse
+import json
+import os
+import shutil
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from wem_tools.evaluation import load_vectors
+from wem_tools.projection import DEFAULT_CACHE, pca_projection
+
+
+VIEWER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tile_viewer.html')
+
+
+def _tile_path(directory, zoom, x, y):
+    return os.path.join(directory, str(zoom), str(x), '%d.json' % y)
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file, separators=(',', ':'))
+
+
+def export_tiles(language_model, directory, coordinates=None, max_points=4096, labels=32, max_zoom=12,
+                 cache_dir=DEFAULT_CACHE):
+    """
+    Writes tiles of a 2D plot of `language_model` to `directory`, along with
+    `index.html`, a viewer for them, and returns the number of the deepest
+    zoom level.
+
+    `coordinates` holds the x and y position of every word in the
+    vocabulary, in the model's order; by default they come from
+    `pca_projection()`, but the result of `tsne_projection()` on the whole
+    vocabulary works as well. Tiles are split into four until none holds
+    more than `max_points` words (or `max_zoom` is reached); a tile that
+    would hold more shows only its most common words. The `labels` most
+    common words in each tile are labelled.
+    """
+    if coordinates is None:
+        coordinates = pca_projection(language_model, 2, cache_dir)
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    words = language_model.index_to_key
+    if len(coordinates) != len(words):
+        raise ValueError("there are %d coordinates but %d words" % (len(coordinates), len(words)))
+
+    # fit the plot into a unit square, keeping its proportions
+    low = coordinates.min(axis=0)
+    size = (coordinates.max(axis=0) - low).max() or 1.0
+    unit = (coordinates - low) / size
+    rows = np.arange(len(words))
+
+    written = {}
+    for zoom in range(max_zoom + 1):
+        tiles = 2 ** zoom
+        cells = np.minimum((unit * tiles).astype(np.int64), tiles - 1)
+        keys = cells[:, 0] * tiles + cells[:, 1]
+        # gensim keeps the vocabulary sorted from most to least common, so a
+        # stable sort by tile leaves the words in each tile in that order too
+        order = np.argsort(keys, kind='stable')
+        found, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        written[zoom] = []
+        for key, start, count in zip(found.tolist(), starts.tolist(), counts.tolist()):
+            x, y = divmod(key, tiles)
+            chosen = order[start:start + min(count, max_points)]
+            path = _tile_path(directory, zoom, x, y)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_json(path, {
+                'x': np.round(unit[chosen, 0], 6).tolist(),
+                'y': np.round(unit[chosen, 1], 6).tolist(),
+                'rows': rows[chosen].tolist(),
+                'words': [words[row] for row in chosen[:labels].tolist()],
+                'count': count,
+            })
+            written[zoom].append('%d/%d' % (x, y))
+        if counts.max() <= max_points:
+            break
+
+    _write_json(os.path.join(directory, 'tiles.json'), {
+        'max_zoom': zoom,
+        'words': len(words),
+        'max_points': max_points,
+        'bounds': [low.tolist(), (low + size).tolist()],
+        'tiles': written,
+    })
+    shutil.copyfile(VIEWER, os.path.join(directory, 'index.html'))
+    return zoom
+
+
+def serve_tiles(directory, host='127.0.0.1', port=8001):
+    # Serves the tiles and the viewer in `directory` until interrupted.
+    handler = partial(SimpleHTTPRequestHandler, directory=directory)
+    httpd = ThreadingHTTPServer((host, port), handler)
+    print("Serving the tiles in %s on http://%s:%d/" % (directory, host, port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('vectors', help='a .wordvectors, .kv or .model file')
+    parser.add_argument('directory', help='folder to write the tiles to')
+    parser.add_argument('--max-points', type=int, default=4096)
+    parser.add_argument('--labels', type=int, default=32)
+    parser.add_argument('--max-zoom', type=int, default=12)
+    parser.add_argument('--serve', action='store_true', help='serve the viewer after exporting')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+
+    language_model = load_vectors(args.vectors)
+    zoom = export_tiles(language_model, args.directory, max_points=args.max_points, labels=args.labels,
+                        max_zoom=args.max_zoom)
+    print("wrote %d zoom levels of tiles to %s" % (zoom + 1, args.directory))
+    if args.serve:
+        serve_tiles(args.directory, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
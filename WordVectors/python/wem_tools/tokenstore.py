@@ -0,0 +1,122 @@
+"""
+Saving cleaned texts in a compact form that can be read back instantly.
+
+The evaluation notebook used to save its cleaned text by appending the printed
+form of each list of tokens to a .txt file, which could not easily be turned
+back into lists. A token store is a folder holding three files instead:
+
+    vocab.txt       every distinct word, one per line; a word's id is its line number
+    tokens.int32    the id of every token in every document, one after another
+    offsets.int64   where each document starts and ends in tokens.int32
+
+The two number files are opened with NumPy's memory mapping, so opening a store
+takes about the same time no matter how large it is, and counting or looping
+over the documents reads straight from the file without copying it into memory.
+"""
+
+import os
+from collections import Counter
+
+import numpy as np
+
+
+TOKEN_DTYPE = np.dtype('<i4')
+OFFSET_DTYPE = np.dtype('<i8')
+
+
+class TokenStoreWriter:
+    """
+    Writes cleaned documents to a new token store, one document at a time.
+
+    Everything is written as it goes, so if Python stops partway through the
+    documents added so far can still be read.
+
+        with TokenStoreWriter('./output/all_text_clean') as store:
+            for filename in filenames:
+                store.add(clean_file(filename))
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.word_ids = {}
+        self.length = 0
+        self._vocab_file = open(os.path.join(directory, 'vocab.txt'), 'w', encoding='utf-8')
+        self._tokens_file = open(os.path.join(directory, 'tokens.int32'), 'wb')
+        self._offsets_file = open(os.path.join(directory, 'offsets.int64'), 'wb')
+        self._offsets_file.write(np.array([0], dtype=OFFSET_DTYPE).tobytes())
+
+    def add(self, tokens):
+        # Adds one document, given as a list of tokens. Tokens must not
+        # contain line breaks, which is always true of cleaned text.
+        word_ids = self.word_ids
+        ids = np.empty(len(tokens), dtype=TOKEN_DTYPE)
+        for position, token in enumerate(tokens):
+            word_id = word_ids.get(token)
+            if word_id is None:
+                # a word we haven't seen before gets the next id
+                word_id = word_ids[token] = len(word_ids)
+                self._vocab_file.write(token + '\n')
+            ids[position] = word_id
+        self._tokens_file.write(ids.tobytes())
+        self.length += len(ids)
+        self._offsets_file.write(np.array([self.length], dtype=OFFSET_DTYPE).tobytes())
+
+    def close(self):
+        for afile in (self._vocab_file, self._tokens_file, self._offsets_file):
+            afile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _map(path, dtype):
+    # np.memmap can't map an empty file, so an empty array stands in for one
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class TokenStore:
+    """
+    A token store opened for reading.
+
+    Looping over a `TokenStore` yields each document as a list of words, so it
+    can be given straight to Word2Vec as `sentences`. `counts()` counts every
+    word in the store at once.
+
+        cleaned_text = TokenStore('./output/all_text_clean')
+        model = Word2Vec(sentences=cleaned_text, window=5, min_count=3)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'vocab.txt'), encoding='utf-8') as vocab_file:
+            self.vocab = vocab_file.read().split('\n')[:-1]
+        self.tokens = _map(os.path.join(directory, 'tokens.int32'), TOKEN_DTYPE)
+        self.offsets = _map(os.path.join(directory, 'offsets.int64'), OFFSET_DTYPE)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def document_ids(self, index):
+        # The word ids of one document, read directly from the file.
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def __getitem__(self, index):
+        vocab = self.vocab
+        return [vocab[word_id] for word_id in self.document_ids(index).tolist()]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def counts(self):
+        # Counts how often each word appears across the whole store. Words are
+        # listed in the order they were first seen, like a Counter that was
+        # updated one document at a time.
+        totals = np.bincount(self.tokens, minlength=len(self.vocab))
+        return Counter(dict(zip(self.vocab, totals.tolist())))
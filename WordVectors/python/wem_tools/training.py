@@ -0,0 +1,327 @@
+"""
+Training a Word2Vec model with checkpoints, so that it can be picked up again.
+
+`Word2Vec(sentences=data_clean, ...)` builds the vocabulary and trains every
+epoch in a single step. If Python is stopped partway through, all of the
+training done so far is lost, and nothing is reported about how quickly it was
+going. `train_model()` trains the same model, but saves a copy of it (a
+"checkpoint") every few epochs and writes a line to a log after each epoch:
+
+    model = train_model(data_clean, './models/checkpoints/word2vec',
+                        window=5, min_count=3, workers=4, epochs=5, sg=1)
+
+If training is interrupted, running the same call again loads the latest
+checkpoint and carries on from there instead of starting over. The learning
+rate continues from where it left off, so the finished model is trained the
+same way as one trained in a single go.
+
+The log, `training-log.jsonl` in the checkpoint folder, has one JSON record
+per line for each epoch, including the number of words per second, the
+training loss and the time taken, so that a change that slows training down
+shows up when two logs are compared. `read_log()` reads it back as a list of
+dictionaries.
+
+How much faster training gets with more `workers` depends on the corpus and
+the machine. `tune_workers()` trains briefly on a sample of the corpus with
+different numbers of workers and batch sizes, writes a report of the words per
+second of each, and returns the best settings for the full run:
+
+    settings = tune_workers(data_clean, report='./output/worker-scaling.csv',
+                            window=5, min_count=3, sg=1)
+    model = train_model(data_clean, './models/checkpoints/word2vec',
+                        window=5, min_count=3, epochs=5, sg=1, **settings)
+"""
+
+import csv
+import glob
+import json
+import os
+import time
+from timeit import default_timer
+
+from gensim.models import Word2Vec
+from gensim.models.callbacks import CallbackAny2Vec
+from gensim.models.word2vec import MAX_WORDS_IN_BATCH
+
+
+STATE_NAME = 'checkpoint.json'
+LOG_NAME = 'training-log.jsonl'
+
+
+def _checkpoint_path(directory, epoch):
+    return os.path.join(directory, 'epoch-%04d.model' % epoch)
+
+
+def _alpha_at(state, epoch):
+    # The learning rate gensim uses at the start of `epoch`, falling in a
+    # straight line from `alpha` to `min_alpha` over all of the epochs.
+    alpha, min_alpha = state['alpha'], state['min_alpha']
+    return alpha - (alpha - min_alpha) * epoch / state['epochs']
+
+
+def read_state(directory):
+    # Returns the details of the latest checkpoint saved in `directory`, or
+    # None if there isn't one yet.
+    try:
+        with open(os.path.join(directory, STATE_NAME), encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def read_log(path):
+    # Reads a training log back as a list with one dictionary per epoch.
+    # `path` can be the log itself or the checkpoint folder it is in.
+    if os.path.isdir(path):
+        path = os.path.join(path, LOG_NAME)
+    with open(path, encoding='utf-8') as log_file:
+        return [json.loads(line) for line in log_file if line.strip()]
+
+
+class EpochLogger(CallbackAny2Vec):
+    """
+    A gensim callback that appends a JSON record to `log_path` at the end of
+    every epoch, and prints it as well if `verbose` is true.
+
+    Each record holds the epoch number (counting from 1), the seconds the
+    epoch took, the seconds since training began, the number of words in the
+    corpus, the words trained per second, the training loss for the epoch and
+    the learning rate reached. `epoch` and `elapsed` say how far training had
+    already got when it was resumed from a checkpoint.
+
+    The loss is only worked out if the model is trained with
+    `compute_loss=True`; otherwise it is recorded as 0. Epochs that were
+    trained after the last checkpoint of an interrupted run are trained again
+    when it is resumed, so they appear in the log twice.
+    """
+
+    def __init__(self, log_path, epoch=0, elapsed=0.0, verbose=False):
+        self.log_path = log_path
+        self.epoch = epoch
+        self.elapsed = elapsed
+        self.verbose = verbose
+
+    def on_train_begin(self, model):
+        self.started = default_timer() - self.elapsed
+        self.loss = 0.0
+
+    def on_epoch_begin(self, model):
+        self.epoch_started = default_timer()
+
+    def on_epoch_end(self, model):
+        now = default_timer()
+        seconds = now - self.epoch_started
+        # gensim adds up the loss over the whole call to train()
+        loss = model.get_latest_training_loss()
+        self.epoch += 1
+        record = {
+            'epoch': self.epoch,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seconds': round(seconds, 3),
+            'elapsed': round(now - self.started, 3),
+            'words': model.corpus_total_words,
+            'words_per_second': round(model.corpus_total_words / seconds, 1),
+            'loss': float(loss - self.loss),
+            'alpha': float(model.min_alpha_yet_reached),
+        }
+        self.loss = loss
+        with open(self.log_path, 'a', encoding='utf-8') as log_file:
+            log_file.write(json.dumps(record) + '\n')
+        if self.verbose:
+            print(record)
+
+
+class CheckpointSaver(CallbackAny2Vec):
+    """
+    A gensim callback that saves the model to `directory` after every `every`
+    epochs, and after the last one.
+
+    Each checkpoint is saved as `epoch-0003.model` (for the third epoch) and
+    then recorded in `checkpoint.json`, so that a checkpoint that was only
+    half written when Python stopped is never used. Only the latest `keep`
+    checkpoints are kept. `state` holds the settings recorded alongside each
+    checkpoint, including the total number of epochs and how many have been
+    trained already.
+    """
+
+    def __init__(self, directory, state, every=1, keep=2):
+        self.directory = directory
+        self.state = dict(state)
+        self.every = every
+        self.keep = keep
+
+    def on_train_begin(self, model):
+        self.started = default_timer() - self.state['elapsed']
+
+    def on_epoch_end(self, model):
+        state = self.state
+        state['epoch'] += 1
+        if state['epoch'] % self.every and state['epoch'] < state['epochs']:
+            return
+        path = _checkpoint_path(self.directory, state['epoch'])
+        model.save(path)
+        state['checkpoint'] = os.path.basename(path)
+        state['elapsed'] = round(default_timer() - self.started, 3)
+
+        # write the new state to a temporary file and then swap it in, so
+        # that checkpoint.json is never left half written
+        state_path = os.path.join(self.directory, STATE_NAME)
+        with open(state_path + '.tmp', 'w', encoding='utf-8') as state_file:
+            json.dump(state, state_file, indent=2)
+        os.replace(state_path + '.tmp', state_path)
+        self._remove_old(state['epoch'])
+
+    def _remove_old(self, epoch):
+        saved = sorted(glob.glob(os.path.join(self.directory, 'epoch-*.model')))
+        for old in saved[:-self.keep]:
+            if old != _checkpoint_path(self.directory, epoch):
+                # gensim saves large arrays in separate files next to the model
+                for filename in glob.glob(glob.escape(old) + '*'):
+                    os.remove(filename)
+
+
+def train_model(sentences, directory, every=1, keep=2, callbacks=(), verbose=False, **params):
+    """
+    Trains a Word2Vec model on `sentences`, saving a checkpoint to `directory`
+    every `every` epochs, and returns the trained model.
+
+    `params` are the settings given to `Word2Vec()`, such as `window`,
+    `min_count`, `workers`, `epochs` and `sg`. `sentences` must be a list or
+    a corpus that can be looped over more than once, such as a TextCorpus.
+
+    If `directory` already holds a checkpoint, training carries on from it
+    with the settings it was started with, and only the epochs that are left
+    are trained. A model that has already finished is simply loaded. Any
+    extra gensim `callbacks` are run after the logging and checkpoint ones.
+    """
+    os.makedirs(directory, exist_ok=True)
+    state = read_state(directory)
+    if state is None:
+        params.setdefault('compute_loss', True)
+        model = Word2Vec(**params)
+        model.build_vocab(sentences)
+        state = {'epoch': 0, 'epochs': model.epochs, 'alpha': model.alpha,
+                 'min_alpha': model.min_alpha, 'elapsed': 0.0}
+    else:
+        model = Word2Vec.load(os.path.join(directory, state['checkpoint']))
+        if verbose:
+            print("resuming from %s after epoch %d of %d"
+                  % (state['checkpoint'], state['epoch'], state['epochs']))
+
+    remaining = state['epochs'] - state['epoch']
+    if remaining > 0:
+        logger = EpochLogger(os.path.join(directory, LOG_NAME), state['epoch'], state['elapsed'], verbose)
+        saver = CheckpointSaver(directory, state, every, keep)
+        model.train(sentences, total_examples=model.corpus_count, epochs=remaining,
+                    start_alpha=_alpha_at(state, state['epoch']), end_alpha=state['min_alpha'],
+                    compute_loss=model.compute_loss, callbacks=[logger, saver] + list(callbacks))
+
+    # train() sets these to cover only the epochs it was asked to train
+    model.epochs = state['epochs']
+    model.alpha = state['alpha']
+    model.min_alpha = state['min_alpha']
+    return model
+
+
+def _sample(sentences, sample_words):
+    # The first texts in `sentences`, up to about `sample_words` words.
+    sample, words = [], 0
+    for sentence in sentences:
+        sample.append(list(sentence))
+        words += len(sample[-1])
+        if words >= sample_words:
+            break
+    return sample
+
+
+def _worker_counts(cores):
+    # 1, 2, 4, ... up to the number of processor cores, and the number of
+    # cores itself.
+    counts = [1]
+    while counts[-1] * 2 < cores:
+        counts.append(counts[-1] * 2)
+    if cores > 1:
+        counts.append(cores)
+    return counts
+
+
+def measure_scaling(sentences, workers=None, batch_words=(2500, 5000, 10000), sample_words=1000000,
+                    epochs=1, verbose=False, **params):
+    # Trains on a sample of about `sample_words` words of `sentences` once
+    # for each combination of `workers` and `batch_words`, and returns a list
+    # with the words per second of each. `params` are the other Word2Vec()
+    # settings, which should match the real run since they change the speed
+    # too. The speeds count the words actually trained on, after gensim's
+    # downsampling of very common words. `speedup` compares each run with the fewest workers tried at the
+    # same batch size, and `efficiency` is the speedup per worker.
+    if max(batch_words) > MAX_WORDS_IN_BATCH:
+        # gensim's compiled training code skips every word after the first
+        # 10,000 in a batch, so bigger batches look faster but train less
+        raise ValueError("batch_words can be at most %d" % MAX_WORDS_IN_BATCH)
+    sample = _sample(sentences, sample_words)
+    workers = workers or _worker_counts(os.cpu_count() or 1)
+    for name in ('workers', 'batch_words', 'epochs'):
+        params.pop(name, None)
+    model = Word2Vec(epochs=epochs, **params)
+    model.build_vocab(sample)
+
+    results = []
+    for batch in batch_words:
+        baseline = None
+        for count in workers:
+            model.workers, model.batch_words = count, batch
+            start = default_timer()
+            words, _ = model.train(sample, total_examples=model.corpus_count, epochs=epochs)
+            seconds = default_timer() - start
+            words_per_second = words / seconds
+            baseline = baseline or (count, words_per_second)
+            speedup = words_per_second / baseline[1]
+            results.append({
+                'workers': count,
+                'batch_words': batch,
+                'seconds': round(seconds, 3),
+                'words_per_second': round(words_per_second, 1),
+                'speedup': round(speedup, 2),
+                'efficiency': round(speedup * baseline[0] / count, 2),
+            })
+            if verbose:
+                print("%(workers)3d workers, batches of %(batch_words)6d words: %(words_per_second)10.0f "
+                      "words/s, %(speedup).2fx speedup, %(efficiency).2f efficiency" % results[-1])
+    return results
+
+
+def write_scaling_report(results, path):
+    # Saves the results of measure_scaling() as a CSV file.
+    with open(path, 'w', newline='', encoding='utf-8') as report:
+        writer = csv.DictWriter(report, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def tune_workers(sentences, workers=None, batch_words=(2500, 5000, 10000), sample_words=1000000, epochs=1,
+                 tolerance=0.05, report=None, verbose=True, **params):
+    """
+    Finds the number of `workers` and the `batch_words` that train fastest on
+    a sample of `sentences`, and returns them as a dictionary that can be
+    passed on to `Word2Vec()` or `train_model()`.
+
+    By default, 1, 2, 4 and so on workers are tried, up to the number of
+    processor cores. Each is timed on the first `sample_words` words of the
+    corpus with each of the `batch_words` sizes. `params` are the other
+    Word2Vec() settings, such as `window`, `min_count` and `sg`, which also
+    affect the speed.
+
+    Adding workers eventually stops helping, so rather than the very fastest
+    settings, the fewest workers within `tolerance` (5%) of the fastest speed
+    are chosen. If `report` is a path, the speeds of every combination are
+    saved there as a CSV file.
+    """
+    results = measure_scaling(sentences, workers, batch_words, sample_words, epochs, verbose, **params)
+    if report:
+        write_scaling_report(results, report)
+    fastest = max(result['words_per_second'] for result in results)
+    best = min((result for result in results if result['words_per_second'] >= (1 - tolerance) * fastest),
+               key=lambda result: (result['workers'], -result['words_per_second']))
+    if verbose:
+        print("best: %(workers)d workers, batches of %(batch_words)d words" % best)
+    return {'workers': best['workers'], 'batch_words': best['batch_words']}
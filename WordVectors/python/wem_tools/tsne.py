@@ -0,0 +1,222 @@
+"""
+t-SNE plots of large models.
+
+The tSNE functions in the visualization notebook build their list of vectors
+by appending one word at a time, compare every word with every other word
+while t-SNE runs, and then draw each point with its own `plt.scatter()` call.
+That is fine for a few thousand words, but on a real model it can take hours
+and give a plot too crowded to draw.
+
+The helpers below do the same work in steps that scale to large models:
+
+* `select_words()` picks out the rows of the words to plot in one go, and can
+  keep only the most common words of a very large vocabulary;
+* `knn_graph()` finds the nearest neighbours of each of those words, either by
+  comparing them a block at a time or with an `IVFIndex` from wem_tools.ann,
+  and saves them so they only have to be found once;
+* `tsne_projection()` runs scikit-learn's Barnes-Hut t-SNE on those neighbours
+  alone, starting from the saved PCA of the model, and saves the result.
+
+Like the notebook's `TSNE()`, they compare words by the straight-line
+(Euclidean) distance between their vectors unless given metric='cosine',
+which compares them by direction only, as `most_similar()` does.
+
+For example:
+
+    rows, labels = select_words(model.wv, max_words=10000)
+    new_values = tsne_projection(model.wv, rows, perplexity=40)
+    plt.scatter(new_values[:, 0], new_values[:, 1])
+
+Neighbours and t-SNE results are saved in the "output" folder under a
+fingerprint of the model, so drawing the same words again, with different
+labels for instance, doesn't mean running t-SNE again.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+from scipy import sparse
+
+from wem_tools.normed import fingerprint, normed_vectors
+from wem_tools.projection import DEFAULT_CACHE, fit_projection
+
+
+def select_words(language_model, focus_word=None, n=50, max_words=None):
+    """
+    Returns the rows of the words to plot, as a NumPy array, and a list of
+    the words themselves.
+
+    With a `focus_word`, these are that word and its `n` most similar words,
+    as in the notebook. Otherwise they are every word in the vocabulary, or,
+    if `max_words` is given, only the `max_words` most common words, which
+    keeps very large models quick to plot and the plot readable.
+    """
+    if focus_word is not None:
+        labels = [focus_word] + [word for word, _ in language_model.most_similar(focus_word, topn=n)]
+        rows = np.array([language_model.get_index(word) for word in labels], dtype=np.int64)
+        return rows, labels
+
+    # gensim keeps the vocabulary sorted from most to least common
+    count = len(language_model.index_to_key)
+    if max_words is not None:
+        count = min(count, max_words)
+    return np.arange(count, dtype=np.int64), list(language_model.index_to_key[:count])
+
+
+def _cache_path(cache_dir, language_model, rows, kind, *settings):
+    # A file name made from the model's fingerprint and a hash of the rows
+    # and settings, so each combination gets its own file.
+    digest = hashlib.blake2b(np.ascontiguousarray(rows, dtype=np.int64).data, digest_size=8)
+    digest.update(repr(settings).encode('utf-8'))
+    return os.path.join(cache_dir, '%s-%s-%s' % (fingerprint(language_model), kind, digest.hexdigest()))
+
+
+def _exact_neighbours(vectors, neighbours, block_size, metric):
+    # The `neighbours` closest rows to each row of `vectors` and the distances
+    # to them, comparing one block of rows with all of the others at a time.
+    # With metric='cosine' the vectors must be unit length and the distance
+    # is 1 minus their cosine similarity; with 'euclidean' it is the squared
+    # Euclidean distance, which is what scikit-learn's TSNE uses.
+    count = len(vectors)
+    # keep each block of distances to about 128MB
+    block_size = max(1, min(block_size, 2 ** 25 // count))
+    if metric == 'euclidean':
+        squared_norms = (vectors ** 2).sum(axis=1)
+    found = np.empty((count, neighbours), dtype=np.int64)
+    distances = np.empty((count, neighbours), dtype=np.float32)
+    for start in range(0, count, block_size):
+        block = vectors[start:start + block_size] @ vectors.T
+        if metric == 'euclidean':
+            block = squared_norms[start:start + block_size, np.newaxis] + squared_norms - 2 * block
+        else:
+            block = 1 - block
+        # a word is not its own neighbour
+        block[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf
+        best = np.argpartition(block, neighbours - 1, axis=1)[:, :neighbours]
+        found[start:start + block_size] = best
+        distances[start:start + block_size] = np.take_along_axis(block, best, axis=1)
+    return found, distances
+
+
+def _index_neighbours(index, vectors, rows, neighbours):
+    # The same with metric='cosine', using an IVFIndex built for the whole
+    # vocabulary. Only works when `rows` is the whole vocabulary in order.
+    if len(rows) != len(index.rows) or not np.array_equal(rows, np.arange(len(rows))):
+        raise ValueError("an index can only be used to find neighbours for the whole vocabulary")
+    found = np.empty((len(rows), neighbours), dtype=np.int64)
+    similarity = np.empty((len(rows), neighbours), dtype=np.float32)
+    for row in range(len(rows)):
+        best, scores = index.search(vectors[row], neighbours, exclude=np.array([row]))
+        if len(best) < neighbours:
+            raise ValueError("the index found fewer than %d neighbours for %r; search more probes"
+                             % (neighbours, index.language_model.index_to_key[row]))
+        found[row], similarity[row] = best, scores
+    return found, 1 - similarity
+
+
+def knn_graph(language_model, rows, neighbours=121, index=None, cache_dir=DEFAULT_CACHE, block_size=2048,
+              metric='euclidean'):
+    """
+    Finds the `neighbours` nearest words to each of the words in `rows`,
+    among those words only, and returns them as a SciPy sparse matrix of
+    distances, with one row and column per word in `rows`. Each word is also
+    listed as its own closest neighbour, at a distance of 0, which
+    scikit-learn expects.
+
+    With metric='euclidean' (the default) the distances are the squared
+    straight-line distances between the vectors, the same ones scikit-learn's
+    TSNE works with; with metric='cosine' they are 1 minus the cosine
+    similarity.
+
+    By default every word is compared with every other word, `block_size`
+    words at a time, which gives the exact neighbours but gets slow for more
+    than a few tens of thousands of words. If `index` is an IVFIndex built
+    for the model (and `rows` is the whole vocabulary), it is used instead;
+    an index compares words by cosine similarity, so only works with
+    metric='cosine'.
+
+    The graph is saved in `cache_dir` and loaded from there the next time
+    the same words of the same model are asked for. Pass `cache_dir=None` to
+    skip saving it.
+    """
+    if metric not in ('euclidean', 'cosine'):
+        raise ValueError("unknown metric %r; use 'euclidean' or 'cosine'" % (metric,))
+    if index is not None and metric != 'cosine':
+        raise ValueError("an index can only be used with metric='cosine'")
+    rows = np.asarray(rows, dtype=np.int64)
+    neighbours = min(neighbours, len(rows) - 1)
+    if cache_dir:
+        path = _cache_path(cache_dir, language_model, rows, 'knn', neighbours, metric) + '.npz'
+        if os.path.exists(path):
+            return sparse.load_npz(path)
+
+    if metric == 'euclidean':
+        vectors = np.asarray(language_model.vectors[rows], dtype=np.float32)
+        found, distances = _exact_neighbours(vectors, neighbours, block_size, metric)
+    elif index is not None:
+        found, distances = _index_neighbours(index, normed_vectors(language_model), rows, neighbours)
+    else:
+        vectors = np.asarray(normed_vectors(language_model)[rows], dtype=np.float32)
+        found, distances = _exact_neighbours(vectors, neighbours, block_size, metric)
+
+    # scikit-learn expects each word's neighbours to be listed closest first,
+    # starting with the word itself
+    order = np.argsort(distances, axis=1, kind='stable')
+    found = np.hstack((np.arange(len(rows))[:, np.newaxis], np.take_along_axis(found, order, axis=1)))
+    # rounding can make the distance between very similar words just below 0
+    distances = np.clip(np.take_along_axis(distances, order, axis=1), 0, None)
+    distances = np.hstack((np.zeros((len(rows), 1), dtype=distances.dtype), distances))
+    indptr = np.arange(0, found.size + 1, neighbours + 1)
+    graph = sparse.csr_matrix((distances.ravel(), found.ravel(), indptr), shape=(len(rows), len(rows)))
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        sparse.save_npz(path, graph)
+    return graph
+
+
+def tsne_projection(language_model, rows=None, perplexity=40, max_iter=2500, random_state=23, angle=0.8,
+                    index=None, cache_dir=DEFAULT_CACHE, metric='euclidean'):
+    """
+    Runs Barnes-Hut t-SNE on the words in `rows` (by default, the whole
+    vocabulary) and returns an array with the x and y position of each one.
+
+    Only each word's nearest neighbours are used, from `knn_graph()`: about
+    three times `perplexity` of them, which is all that Barnes-Hut t-SNE
+    looks at anyway. The starting positions are taken from the model's PCA
+    (see wem_tools.projection), as with `TSNE(init='pca')`. `perplexity`,
+    `max_iter`, `random_state` and `angle` work as they do for `TSNE()`;
+    `angle` is higher than scikit-learn's 0.5 by default, which makes each
+    step about a third quicker with plots that are just as good.
+
+    The defaults for `max_iter` and `metric` are those the notebook gave
+    `TSNE()`: words are placed by the straight-line distance between their
+    vectors. With metric='cosine' they are placed by cosine similarity
+    instead, which ignores the length of the vectors, as `most_similar()`
+    does; this is also needed to use an `index` (see `knn_graph()`).
+
+    The result is saved in `cache_dir` along with the neighbours, so asking
+    for the same words with the same settings again returns it straight away.
+    """
+    from sklearn.manifold import TSNE
+
+    if rows is None:
+        rows = np.arange(len(language_model.index_to_key))
+    rows = np.asarray(rows, dtype=np.int64)
+    if cache_dir:
+        settings = (perplexity, max_iter, random_state, angle, metric)
+        path = _cache_path(cache_dir, language_model, rows, 'tsne', *settings) + '.npy'
+        if os.path.exists(path):
+            return np.load(path)
+
+    graph = knn_graph(language_model, rows, int(3 * perplexity + 1), index, cache_dir, metric=metric)
+    # scale the PCA positions down the same way TSNE(init='pca') does
+    start = np.asarray(fit_projection(language_model, 2, cache_dir).coordinates[rows, :2], dtype=np.float32)
+    start = start / np.std(start[:, 0]) * 1e-4
+    tsne_model = TSNE(n_components=2, perplexity=min(perplexity, len(rows) - 1), metric='precomputed',
+                      init=start, method='barnes_hut', angle=angle, max_iter=max_iter,
+                      random_state=random_state)
+    new_values = tsne_model.fit_transform(graph).astype(np.float32)
+    if cache_dir:
+        np.save(path, new_values)
+    return new_values
@@ -0,0 +1,529 @@
+"""
+Folding new texts into a trained model as they arrive.
+
+The "Resuming Training" section of the further explorations notebook adds new
+texts to a model with
+
+    model.build_vocab(data_clean, update=True)
+    model.train(data_clean, total_examples=len(data_clean), epochs=model.epochs)
+
+and then saves the whole model again. That is fine once in a while, but when
+new texts (transcriptions, say) arrive every day, loading and saving the whole
+model for each handful of them takes far longer than the training itself.
+`IncrementalUpdater` keeps the model in memory instead. New texts are queued
+with `add()` and folded into the model in small batches, either whenever
+`update()` is called or on a schedule with `start()`:
+
+    updater = IncrementalUpdater('./models/recipes-demo.model', './models/updates')
+    updater.add(data_clean)
+    updater.update()
+    updater.live.most_similar('milk')
+
+New words are added with `update_vocab()`, which gives the same vocabulary
+as `build_vocab(update=True)` but doesn't go through every word in the model
+one at a time, so an update takes about as long as training on the new
+documents, however large the model is.
+
+Each update gets a version number and saves a "delta" with only the vectors
+that changed and any new words, which is much smaller than the model. The
+whole model (a "snapshot") is only saved every few versions. Texts added since
+the last snapshot are kept in a journal, so if Python stops they are trained
+on again the next time an updater is started on the same folder.
+`load_updates()` opens the latest snapshot and applies the deltas saved after
+it, which gives the same vectors as the updater's.
+
+Queries should go to `updater.live`, a copy of the vectors that is replaced in
+a single step once an update has finished, so that they never see a model
+that is partway through training. The updater keeps two such copies and
+takes turns between them, copying over only the vectors that changed, so
+keeping them up to date doesn't depend on the size of the model either, but
+they take twice the memory of the vectors on top of the model's own. Every update is logged to `update-log.jsonl`
+with the number of documents per second folded into the model;
+`wem_tools.training.read_log()` reads the log back.
+
+The updater can also be run as a service that checks a folder for new .txt
+files on a schedule and answers queries about the latest vectors, in the same
+way as wem_tools.server:
+
+    python -m wem_tools.updates ./models/recipes-demo.model ./models/updates --watch ./data/incoming
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import HTTPServer
+from timeit import default_timer
+
+import numpy as np
+from gensim.models import KeyedVectors, Word2Vec
+
+from wem_tools.corpus import clean_file, find_files
+from wem_tools.server import QueryHandler
+
+
+STATE_NAME = 'updates.json'
+LOG_NAME = 'update-log.jsonl'
+JOURNAL_NAME = 'journal.jsonl'
+SEEN_NAME = 'seen-files.txt'
+
+
+def _snapshot_path(directory, version):
+    return os.path.join(directory, 'version-%06d.model' % version)
+
+
+def _delta_path(directory, version):
+    return os.path.join(directory, 'version-%06d.delta.npz' % version)
+
+
+def _write_lines(path, lines):
+    # write to a temporary file and then swap it in, so that the file is
+    # never left half written
+    with open(path + '.tmp', 'w', encoding='utf-8') as tmp_file:
+        tmp_file.write(''.join(line + '\n' for line in lines))
+    os.replace(path + '.tmp', path)
+
+
+def _write_state(directory, state):
+    _write_lines(os.path.join(directory, STATE_NAME), [json.dumps(state, indent=2)])
+
+
+def _read_state(directory):
+    try:
+        with open(os.path.join(directory, STATE_NAME), encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return None
+
+
+def _read_journal(directory):
+    # Returns the snapshot the journal was started for, if it says, and the
+    # documents in it.
+    try:
+        with open(os.path.join(directory, JOURNAL_NAME), encoding='utf-8') as journal:
+            lines = [json.loads(line) for line in journal if line.strip()]
+    except FileNotFoundError:
+        return None, []
+    if lines and isinstance(lines[0], dict):
+        return lines[0], lines[1:]
+    return None, lines
+
+
+class _LiveVectors:
+    # Two separate copies of the words and vectors of a model, for answering
+    # queries while the model itself goes on being trained. They take turns:
+    # one answers queries while the other is brought up to date, by copying
+    # only the rows that have changed since it was last used and working out
+    # the norms of just those rows, and then the two swap. Each copy's arrays
+    # are views of larger ones with room for new words at the end, so a copy
+    # only has to be made again in full when that room runs out.
+
+    def __init__(self, language_model):
+        self.copies, self.arrays = [None, None], [None, None]
+        for number in range(2):
+            self._copy(number, language_model)
+        # the rows of the model that have changed since each copy was updated
+        self.changed = [[], []]
+        self.current = 0
+
+    @property
+    def vectors(self):
+        return self.copies[self.current]
+
+    def _copy(self, number, language_model):
+        count = len(language_model.index_to_key)
+        capacity = count + max(1024, count // 4)
+        arrays = {'vectors': np.empty((capacity, language_model.vector_size), dtype=np.float32),
+                  'norms': np.empty(capacity, dtype=np.float32)}
+        arrays['vectors'][:count] = language_model.vectors
+        arrays['norms'][:count] = np.linalg.norm(language_model.vectors, axis=1)
+        if 'count' in language_model.expandos:
+            arrays['count'] = np.zeros(capacity, dtype=language_model.expandos['count'].dtype)
+            arrays['count'][:count] = language_model.expandos['count']
+        copy = KeyedVectors(language_model.vector_size)
+        copy.index_to_key = list(language_model.index_to_key)
+        copy.key_to_index = dict(language_model.key_to_index)
+        self.copies[number], self.arrays[number] = copy, arrays
+        self._resize(number, count)
+
+    def _resize(self, number, count):
+        copy, arrays = self.copies[number], self.arrays[number]
+        copy.vectors = arrays['vectors'][:count]
+        copy.norms = arrays['norms'][:count]
+        if 'count' in arrays:
+            copy.expandos['count'] = arrays['count'][:count]
+        copy.next_index = count
+
+    def update(self, language_model, rows):
+        # Brings the copy that isn't answering queries up to date with
+        # `language_model`, whose `rows` (including those of any new words)
+        # have just changed, makes it the one that is, and returns it. A query
+        # still running on that copy from before the last swap would see its
+        # rows change, but updates take far longer than queries.
+        for changed in self.changed:
+            changed.append(np.asarray(rows, dtype=np.int64))
+        standby = 1 - self.current
+        count = len(language_model.index_to_key)
+        if count > len(self.arrays[standby]['vectors']):
+            self._copy(standby, language_model)
+        else:
+            copy = self.copies[standby]
+            for word in language_model.index_to_key[len(copy.index_to_key):]:
+                copy.key_to_index[word] = len(copy.index_to_key)
+                copy.index_to_key.append(word)
+            self._resize(standby, count)
+            changed = np.unique(np.concatenate(self.changed[standby]))
+            copy.vectors[changed] = language_model.vectors[changed]
+            copy.norms[changed] = np.linalg.norm(copy.vectors[changed], axis=1)
+            if 'count' in self.arrays[standby]:
+                copy.expandos['count'][changed] = language_model.expandos['count'][changed]
+        self.changed[standby] = []
+        self.current = standby
+        return self.copies[standby]
+
+
+def update_vocab(model, documents):
+    """
+    Adds the words in `documents` to the vocabulary of a trained Word2Vec
+    `model`, with the same result as `model.build_vocab(documents,
+    update=True)`.
+
+    gensim goes through the whole vocabulary one word at a time to update
+    the word counts, the chances of frequent words being skipped and the
+    table used to pick words for negative sampling, which takes seconds for
+    a model with a few hundred thousand words, however few new documents
+    there are. Here the same numbers are worked out with NumPy. Models that
+    use hierarchical softmax, `max_final_vocab` or a null word are passed to
+    `build_vocab()` as usual.
+    """
+    if model.hs or model.max_final_vocab is not None or model.null_word:
+        model.build_vocab(documents, update=True)
+        return
+
+    wv = model.wv
+    raw_vocab = Counter(word for document in documents for word in document)
+    model.corpus_count = len(documents)
+    model.corpus_total_words = sum(raw_vocab.values())
+    model.effective_min_count = model.min_count
+
+    # new words go on the end of the vocabulary in the order they were found
+    kept = [word for word, count in raw_vocab.items() if count >= model.min_count]
+    for word in kept:
+        if word not in wv.key_to_index:
+            wv.key_to_index[word] = len(wv.index_to_key)
+            wv.index_to_key.append(word)
+    wv.allocate_vecattrs(attrs=['count', 'sample_int'], types=[int, np.uint32])
+    seen = [word for word in raw_vocab if word in wv.key_to_index]
+    wv.expandos['count'][[wv.key_to_index[word] for word in seen]] += [raw_vocab[word] for word in seen]
+
+    # only the words kept from these documents get a new sampling threshold,
+    # worked out from their counts in these documents alone, as gensim does
+    counts = np.array([raw_vocab[word] for word in kept], dtype=np.float64)
+    retain_total = counts.sum()
+    if not model.sample:
+        threshold = retain_total
+    elif model.sample < 1.0:
+        threshold = model.sample * retain_total
+    else:
+        threshold = int(model.sample * (3 + np.sqrt(5)) / 2)
+    probability = np.minimum((np.sqrt(counts / threshold) + 1) * (threshold / counts), 1.0)
+    wv.expandos['sample_int'][[wv.key_to_index[word] for word in kept]] = \
+        (probability * (2 ** 32 - 1)).astype(np.uint32)
+    model.raw_vocab = defaultdict(int)
+
+    if model.negative:
+        domain = 2 ** 31 - 1
+        cumulative = np.cumsum(wv.expandos['count'].astype(np.float64) ** float(model.ns_exponent))
+        model.cum_table = np.round(cumulative / cumulative[-1] * domain).astype(np.uint32)
+    model.prepare_weights(update=True)
+
+
+def save_delta(path, version, words, rows, vectors):
+    # Saves the changes made by one update: the `words` added to the end of
+    # the vocabulary, and the new `vectors` of the `rows` that changed,
+    # including those of the new words.
+    np.savez(path, version=version, words=np.array(words, dtype=str),
+             rows=np.asarray(rows, dtype=np.int64), vectors=np.asarray(vectors, dtype=np.float32))
+
+
+def load_delta(path):
+    # Reads a delta saved by save_delta() back as a dictionary.
+    with np.load(path) as delta:
+        return {'version': int(delta['version']), 'words': delta['words'].tolist(),
+                'rows': delta['rows'], 'vectors': delta['vectors']}
+
+
+def apply_delta(language_model, delta):
+    # Adds the new words in `delta` to `language_model` and replaces the
+    # vectors that changed. The model's vectors must be writable, so it
+    # can't have been loaded with mmap='r'.
+    if delta['words']:
+        language_model.add_vectors(delta['words'], np.zeros((len(delta['words']), language_model.vector_size),
+                                                            dtype=language_model.vectors.dtype))
+    language_model.vectors[delta['rows']] = delta['vectors']
+    language_model.norms = None
+
+
+def load_updates(directory):
+    """
+    Returns the latest vectors saved by an `IncrementalUpdater` in
+    `directory`, by loading the latest snapshot of the model and applying
+    each delta saved after it in turn.
+    """
+    state = _read_state(directory)
+    if state is None:
+        raise FileNotFoundError("no updates have been saved in %s" % directory)
+    language_model = Word2Vec.load(_snapshot_path(directory, state['snapshot'])).wv
+    for version in range(state['snapshot'] + 1, state['version'] + 1):
+        apply_delta(language_model, load_delta(_delta_path(directory, version)))
+    return language_model
+
+
+class IncrementalUpdater:
+    """
+    Keeps a Word2Vec model in memory and trains it on new documents in
+    batches, saving each batch's changes as a new version in `directory`.
+
+    `model` is a Word2Vec model or the path of a saved one. It is only used
+    the first time; after that the updater carries on from the latest
+    snapshot in `directory`, and any documents in the journal are queued
+    again. Documents are lists of tokens, cleaned in the same way as the
+    ones the model was trained on, and each update trains on at most
+    `batch_size` of them. The whole model is saved every `snapshot_every`
+    versions, and only the latest `keep` snapshots are kept.
+
+    `live` holds the vectors to answer queries with. Each HTTP server in
+    `servers`, such as one from wem_tools.server, is switched to the new
+    vectors as well after every update.
+    """
+
+    def __init__(self, model, directory, batch_size=1000, snapshot_every=10, keep=2, servers=(),
+                 verbose=False):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.snapshot_every = snapshot_every
+        self.keep = keep
+        self.servers = list(servers)
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._updating = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        os.makedirs(directory, exist_ok=True)
+        journal_start, self.pending = _read_journal(directory)
+        self.state = _read_state(directory)
+        if self.state is None:
+            self.model = Word2Vec.load(model) if isinstance(model, str) else model
+            self.state = {'version': 0, 'snapshot': 0, 'documents': 0}
+            self._save_snapshot()
+        else:
+            if journal_start is not None and journal_start['snapshot'] != self.state['snapshot']:
+                # Python stopped after a snapshot and its journal were saved
+                # but before the state was, so carry on from that snapshot
+                self.state.update(journal_start)
+            self.model = Word2Vec.load(_snapshot_path(directory, self.state['snapshot']))
+            # versions after the snapshot are made again from the journal
+            for version in range(self.state['snapshot'] + 1, self.state['version'] + 1):
+                if os.path.exists(_delta_path(directory, version)):
+                    os.remove(_delta_path(directory, version))
+            self.state['version'] = self.state['snapshot']
+            self.state['documents'] = self.state['snapshot_documents']
+            _write_state(directory, self.state)
+        if verbose and self.pending:
+            print("%d documents queued from the journal" % len(self.pending))
+        self._live = _LiveVectors(self.model.wv)
+        self.live = self._live.vectors
+
+    def add(self, documents):
+        # Queues `documents` to be trained on in the next update, and writes
+        # them to the journal so they aren't lost if Python stops first.
+        documents = [list(document) for document in documents]
+        with self._lock:
+            with open(os.path.join(self.directory, JOURNAL_NAME), 'a', encoding='utf-8') as journal:
+                for document in documents:
+                    journal.write(json.dumps(document) + '\n')
+            self.pending.extend(documents)
+
+    def update(self):
+        """
+        Trains the model on up to `batch_size` queued documents, saves the
+        changes as a new version, swaps in the new `live` vectors and
+        returns the log record for the update, or None if nothing was
+        queued.
+        """
+        with self._updating:
+            with self._lock:
+                batch = self.pending[:self.batch_size]
+            if not batch:
+                return None
+            started = default_timer()
+            model = self.model
+            vocab_size = len(model.wv)
+
+            update_vocab(model, batch)
+            # the number of documents is that of this batch, not the corpus
+            # the model was first trained on
+            model.train(batch, total_examples=len(batch), epochs=model.epochs)
+            trained = default_timer()
+
+            # only the vectors of words in the batch change, and new words
+            # are added to the end of the vocabulary
+            key_to_index = model.wv.key_to_index
+            rows = np.array(sorted({key_to_index[word] for document in batch for word in document
+                                    if word in key_to_index}), dtype=np.int64)
+            version = self.state['version'] + 1
+            save_delta(_delta_path(self.directory, version), version, model.wv.index_to_key[vocab_size:],
+                       rows, model.wv.vectors[rows])
+            self.live = self._live.update(model.wv, rows)
+            for server in self.servers:
+                server.language_model = self.live
+
+            with self._lock:
+                self.pending = self.pending[len(batch):]
+            self.state['version'] = version
+            self.state['documents'] += len(batch)
+            if version % self.snapshot_every == 0:
+                self._save_snapshot()
+            else:
+                _write_state(self.directory, self.state)
+            finished = default_timer()
+
+            record = {
+                'version': version,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'documents': len(batch),
+                'words': model.corpus_total_words,
+                'new_words': len(model.wv) - vocab_size,
+                'changed_vectors': len(rows),
+                'train_seconds': round(trained - started, 3),
+                'seconds': round(finished - started, 3),
+                'documents_per_second': round(len(batch) / (finished - started), 1),
+                'queued': len(self.pending),
+            }
+            with open(os.path.join(self.directory, LOG_NAME), 'a', encoding='utf-8') as log_file:
+                log_file.write(json.dumps(record) + '\n')
+            if self.verbose:
+                print(record)
+            return record
+
+    def update_all(self):
+        # Runs updates until nothing is left in the queue, and returns their
+        # log records.
+        records = []
+        record = self.update()
+        while record is not None:
+            records.append(record)
+            record = self.update()
+        return records
+
+    def snapshot(self):
+        # Saves the whole model now, so the journal can be emptied.
+        with self._updating:
+            self._save_snapshot()
+
+    def _save_snapshot(self):
+        version = self.state['version']
+        self.model.save(_snapshot_path(self.directory, version))
+        start = {'snapshot': version, 'snapshot_documents': self.state['documents']}
+        # the journal only needs the documents that the snapshot hasn't seen.
+        # It is replaced before the state, and starts with the snapshot it
+        # follows, so that if Python stops in between, the next updater
+        # neither trains on the snapshot's documents again nor loses the
+        # ones after it.
+        with self._lock:
+            _write_lines(os.path.join(self.directory, JOURNAL_NAME),
+                         [json.dumps(start)] + [json.dumps(document) for document in self.pending])
+            self.state.update(start)
+            _write_state(self.directory, self.state)
+
+        saved = sorted(glob.glob(os.path.join(self.directory, 'version-*.model')))
+        for old in saved[:-self.keep]:
+            # gensim saves large arrays in separate files next to the model
+            for filename in glob.glob(glob.escape(old) + '*'):
+                os.remove(filename)
+
+    def start(self, interval=3600, collect=None):
+        """
+        Updates the model every `interval` seconds in a background thread,
+        until `stop()` is called. If `collect` is given, such as a function
+        from `watch_folder()`, it is called first each time to queue any new
+        documents with `add()`.
+        """
+        def run():
+            while not self._stop.is_set():
+                if collect is not None:
+                    collect()
+                self.update_all()
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Stops the background updates, trains on anything still queued and
+        # saves a snapshot.
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.update_all()
+        self.snapshot()
+
+
+def watch_folder(dirpath, updater):
+    # Returns a function that queues the cleaned documents in any .txt files
+    # in `dirpath` that `updater` hasn't seen before, and records their names
+    # in the updater's folder so they are only read once. The documents are
+    # written to the journal before the names are recorded, so a file is
+    # never marked as seen without its documents being kept.
+    seen_path = os.path.join(updater.directory, SEEN_NAME)
+
+    def collect():
+        try:
+            with open(seen_path, encoding='utf-8') as seen_file:
+                seen = set(seen_file.read().splitlines())
+        except FileNotFoundError:
+            seen = set()
+        new_files = [filename for filename in sorted(find_files(dirpath)) if filename not in seen]
+        if new_files:
+            updater.add([clean_file(filename) for filename in new_files])
+            _write_lines(seen_path, sorted(seen.union(new_files)))
+
+    return collect
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('model', help='path to the saved .model file to start from')
+    parser.add_argument('directory', help='folder to save versions of the model to')
+    parser.add_argument('--watch', required=True, help='folder to look for new .txt files in')
+    parser.add_argument('--interval', type=float, default=3600, help='seconds between updates')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--snapshot-every', type=int, default=10)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = HTTPServer((args.host, args.port), QueryHandler)
+    server.verbose = False
+    updater = IncrementalUpdater(args.model, args.directory, args.batch_size, args.snapshot_every,
+                                 servers=[server], verbose=args.verbose)
+    server.language_model = updater.live
+    updater.start(args.interval, watch_folder(args.watch, updater))
+    print("Watching %s and serving the latest vectors on http://%s:%d/" % (args.watch, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    updater.stop()
+
+
+if __name__ == "__main__":
+    main()